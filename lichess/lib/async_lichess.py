@@ -0,0 +1,697 @@
+"""Communication with APIs using asyncio, so that one process can handle many streams and requests at once."""
+from __future__ import annotations
+import asyncio
+import json
+import ssl
+import logging
+import contextlib
+import time
+import requests
+import backoff
+from urllib.parse import urljoin, urlsplit, urlencode
+from requests.exceptions import (ChunkedEncodingError, ConnectionError as RequestsConnectionError, HTTPError,
+                                 ReadTimeout)
+from http.client import RemoteDisconnected
+from collections import defaultdict
+from collections.abc import AsyncIterator
+from typing import Any, Optional, Union, cast
+import chess.engine
+from lib.lichess import (RateLimitedClient, MAX_CHAT_MESSAGE_LEN, is_new_rate_limit, is_final, backoff_handler,
+                         get_rate_limit_delay, post_rate_limit_delay, RateLimitedError)
+from lib import ndjson
+from lib.move_sender import MoveSender
+from lib.online_cache import OnlineCache, has_move
+from lib.lichess_types import (UserProfileType, REQUESTS_PAYLOAD_TYPE, GameType, PublicDataType, OnlineType,
+                               ChallengeType, TOKEN_TESTS_TYPE)
+
+logger = logging.getLogger(__name__)
+
+RETRY_EXCEPTIONS = (RemoteDisconnected, RequestsConnectionError, HTTPError, ReadTimeout)
+CONNECTION_KEY_TYPE = tuple[str, str, int]
+CONNECTION_TYPE = tuple[asyncio.StreamReader, asyncio.StreamWriter]
+READ_SIZE = 65536
+
+
+class AsyncResponse:
+    """The response to an HTTP request sent by `AsyncLichess`. Mirrors the parts of `requests.Response` that we use."""
+
+    def __init__(self, url: str, status_code: int, reason: str, headers: dict[str, str], reader: asyncio.StreamReader,
+                 writer: asyncio.StreamWriter, pool: ConnectionPool, key: CONNECTION_KEY_TYPE, timeout: float) -> None:
+        """
+        Wrap a response whose status line and headers have been read.
+
+        :param url: The url of the request.
+        :param status_code: The HTTP status code.
+        :param reason: The HTTP reason phrase.
+        :param headers: The response headers with lowercase names.
+        :param reader: The stream that the body is read from.
+        :param writer: The stream of the connection, closed or returned to the pool once the body is read.
+        :param pool: The pool the connection is returned to.
+        :param key: The scheme, host and port of the connection.
+        :param timeout: How long to wait for each read of the body.
+        """
+        self.url = url
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers
+        self.content = b""
+        self.reader = reader
+        self.writer = writer
+        self.pool = pool
+        self.key = key
+        self.timeout = timeout
+        self.body_read = False
+
+    async def read(self) -> bytes:
+        """Read the whole body. The connection is reused afterwards if the server allows it."""
+        if not self.body_read:
+            self.content = b"".join([chunk async for chunk in self.iter_chunks()])
+        return self.content
+
+    async def iter_chunks(self) -> AsyncIterator[bytes]:
+        """Yield the body as it arrives. Handles both chunked and fixed-length bodies."""
+        try:
+            if self.headers.get("transfer-encoding", "").lower() == "chunked":
+                while True:
+                    size_line = await self.read_with_timeout(self.reader.readline())
+                    size = int(size_line.split(b";", 1)[0].strip() or b"0", 16)
+                    if size == 0:
+                        while (await self.read_with_timeout(self.reader.readline())).strip():
+                            pass
+                        break
+                    chunk = await self.read_with_timeout(self.reader.readexactly(size))
+                    await self.read_with_timeout(self.reader.readexactly(2))
+                    yield chunk
+            elif "content-length" in self.headers:
+                remaining = int(self.headers["content-length"])
+                while remaining > 0:
+                    chunk = await self.read_with_timeout(self.reader.read(min(READ_SIZE, remaining)))
+                    if not chunk:
+                        raise ChunkedEncodingError(f"Connection closed with {remaining} bytes left to read from {self.url}")
+                    remaining -= len(chunk)
+                    yield chunk
+            else:
+                while chunk := await self.read_with_timeout(self.reader.read(READ_SIZE)):
+                    yield chunk
+                self.headers["connection"] = "close"
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError) as error:
+            self.close()
+            raise ChunkedEncodingError(f"Connection broken while reading from {self.url}: {error!r}") from error
+        except BaseException:
+            self.close()
+            raise
+
+        self.body_read = True
+        if self.headers.get("connection", "").lower() == "close":
+            self.close()
+        else:
+            self.pool.release(self.key, (self.reader, self.writer))
+
+    async def iter_lines(self) -> AsyncIterator[bytes]:
+        """Yield the body line by line. Empty lines (keep-alive messages from lichess) are yielded as `b""`."""
+        async for line in ndjson.aiter_lines(self.iter_chunks()):
+            yield line
+
+    async def read_with_timeout(self, awaitable: Any) -> bytes:
+        """Wait for a read, and raise `ReadTimeout` if nothing arrives in time."""
+        try:
+            return cast(bytes, await asyncio.wait_for(awaitable, self.timeout))
+        except asyncio.TimeoutError as error:
+            raise ReadTimeout(f"Read timed out after {self.timeout} seconds from {self.url}") from error
+
+    @property
+    def text(self) -> str:
+        """The body of the response as text. `read()` must be awaited first."""
+        return self.content.decode("utf-8")
+
+    def json(self) -> Any:
+        """Decode the JSON body of the response. `read()` must be awaited first."""
+        try:
+            return json.loads(self.content)
+        except json.JSONDecodeError as error:
+            raise requests.exceptions.JSONDecodeError(error.msg, error.doc, error.pos) from error
+
+    def raise_for_status(self) -> None:
+        """Raise `HTTPError` if the response contains an error code, in the same way as `requests`."""
+        kind = "Client" if 400 <= self.status_code < 500 else "Server" if 500 <= self.status_code < 600 else ""
+        if kind:
+            raise HTTPError(f"{self.status_code} {kind} Error: {self.reason} for url: {self.url}", response=self)
+
+    def close(self) -> None:
+        """Close the connection without reading the rest of the body."""
+        self.body_read = True
+        self.writer.close()
+
+    async def aclose(self) -> None:
+        """Close the connection of a response. Used to stop reading a stream."""
+        if not self.body_read:
+            self.close()
+
+
+class ConnectionPool:
+    """Keep-alive connections, so that consecutive requests to the same host don't open a new connection each time."""
+
+    def __init__(self) -> None:
+        """Start without any connections."""
+        self.idle: defaultdict[CONNECTION_KEY_TYPE, list[CONNECTION_TYPE]] = defaultdict(list)
+        self.ssl_context = ssl.create_default_context()
+
+    async def acquire(self, key: CONNECTION_KEY_TYPE, timeout: float) -> tuple[CONNECTION_TYPE, bool]:
+        """
+        Get an idle connection or open a new one.
+
+        :param key: The scheme, host and port to connect to.
+        :param timeout: How long to wait for a new connection to open.
+        :return: The connection and whether it was reused.
+        """
+        idle = self.idle[key]
+        while idle:
+            reader, writer = idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return (reader, writer), True
+            writer.close()
+
+        scheme, host, port = key
+        try:
+            connection = await asyncio.wait_for(asyncio.open_connection(host, port,
+                                                                        ssl=self.ssl_context if scheme == "https" else None),
+                                                timeout)
+        except (OSError, asyncio.TimeoutError) as error:
+            raise RequestsConnectionError(f"Could not connect to {host}:{port}: {error!r}") from error
+        return connection, False
+
+    def release(self, key: CONNECTION_KEY_TYPE, connection: CONNECTION_TYPE) -> None:
+        """Return a connection whose response has been completely read."""
+        self.idle[key].append(connection)
+
+    def close(self) -> None:
+        """Close all idle connections."""
+        for connections in self.idle.values():
+            for _, writer in connections:
+                writer.close()
+        self.idle.clear()
+
+
+class AsyncSession:
+    """A minimal HTTP/1.1 client built on asyncio streams with the session interface of `requests` that we use."""
+
+    def __init__(self) -> None:
+        """Start a session with no default headers."""
+        self.headers: dict[str, str] = {}
+        self.pool = ConnectionPool()
+
+    async def request(self, method: str, url: str, *, params: Optional[dict[str, Any]] = None,
+                      data: Union[str, dict[str, str], None] = None, json_payload: Optional[REQUESTS_PAYLOAD_TYPE] = None,
+                      headers: Optional[dict[str, str]] = None, timeout: float = 2, stream: bool = False) -> AsyncResponse:
+        """
+        Send an HTTP request.
+
+        :param method: The HTTP method (GET or POST).
+        :param url: The url to send the request to.
+        :param params: Parameters added to the query string.
+        :param data: The body of the request. A dict is sent as an urlencoded form.
+        :param json_payload: A payload sent as a JSON body.
+        :param headers: Headers added to the session headers for this request.
+        :param timeout: How long to wait for the connection, for the response headers, and for each read of the body.
+        :param stream: Whether the body should be left unread, so that it can be read as it arrives.
+        :return: The response.
+        """
+        split_url = urlsplit(url)
+        scheme = split_url.scheme or "https"
+        host = split_url.hostname or ""
+        port = split_url.port or (443 if scheme == "https" else 80)
+        target = split_url.path or "/"
+        query = "&".join(filter(None, [split_url.query, urlencode(params or {})]))
+        if query:
+            target += f"?{query}"
+
+        body = b""
+        request_headers = self.headers | (headers or {})
+        if json_payload is not None:
+            body = json.dumps(json_payload).encode("utf-8")
+            request_headers.setdefault("Content-Type", "application/json")
+        elif isinstance(data, dict):
+            body = urlencode(data).encode("utf-8")
+            request_headers.setdefault("Content-Type", "application/x-www-form-urlencoded")
+        elif data is not None:
+            body = data.encode("utf-8")
+        if body or method == "POST":
+            request_headers["Content-Length"] = str(len(body))
+        request_headers["Host"] = host if split_url.port is None else f"{host}:{port}"
+        request_headers["Accept-Encoding"] = "identity"
+        request_headers.setdefault("Connection", "keep-alive")
+
+        head = f"{method} {target} HTTP/1.1\r\n" + "".join(f"{name}: {value}\r\n" for name, value in request_headers.items())
+        key = (scheme, host, port)
+        (reader, writer), reused = await self.pool.acquire(key, timeout)
+        try:
+            writer.write(head.encode("latin-1") + b"\r\n" + body)
+            await writer.drain()
+            status_line = await asyncio.wait_for(reader.readline(), timeout)
+            if not status_line:
+                raise RemoteDisconnected(f"{host} closed the {'reused ' if reused else ''}connection without a response")
+            _, status_code, *reason = status_line.decode("latin-1").split(" ", 2)
+            response_headers: dict[str, str] = {}
+            while (header_line := await asyncio.wait_for(reader.readline(), timeout)).strip():
+                name, _, value = header_line.decode("latin-1").partition(":")
+                response_headers[name.strip().lower()] = value.strip()
+        except asyncio.TimeoutError as error:
+            writer.close()
+            raise ReadTimeout(f"Read timed out after {timeout} seconds from {url}") from error
+        except (OSError, ValueError) as error:
+            writer.close()
+            raise RequestsConnectionError(f"Connection to {host} failed: {error!r}") from error
+        except BaseException:
+            writer.close()
+            raise
+
+        response = AsyncResponse(url, int(status_code), "".join(reason).strip(), response_headers, reader, writer,
+                                 self.pool, key, timeout)
+        if not stream:
+            await response.read()
+        return response
+
+    async def get(self, url: str, **kwargs: Any) -> AsyncResponse:
+        """Send a GET request."""
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs: Any) -> AsyncResponse:
+        """Send a POST request."""
+        return await self.request("POST", url, **kwargs)
+
+    def close(self) -> None:
+        """Close all idle connections."""
+        self.pool.close()
+
+
+# Docs: https://lichess.org/api.
+class AsyncLichess(RateLimitedClient):
+    """
+    Communication with lichess.org (and chessdb.cn for getting moves) using asyncio.
+
+    The endpoints, rate limits, and retries are the same as in `lib.lichess.Lichess`, so the two can be used interchangeably
+    with `await` in front of each call. Use `AsyncLichess.create` to also confirm that the token can play games.
+    """
+
+    def __init__(self, token: str, url: str, version: str, logging_level: int, max_retries: int,
+                 online_cache: Optional[OnlineCache] = None) -> None:
+        """
+        Communication with lichess.org (and chessdb.cn for getting moves) using asyncio.
+
+        :param token: The bot's token.
+        :param url: The base url (lichess.org).
+        :param version: The lichess-bot version running.
+        :param logging_level: The logging level (logging.INFO or logging.DEBUG).
+        :param max_retries: The maximum amount of retries for online moves (e.g. chessdb's opening book).
+        :param online_cache: Where responses from online move sources are stored. Nothing is stored if it is `None`.
+        """
+        super().__init__()
+        self.version = version
+        self.token = token
+        self.header = {
+            "Authorization": f"Bearer {token}"
+        }
+        self.baseUrl = url
+        self.session = AsyncSession()
+        self.session.headers.update(self.header)
+        self.other_session = AsyncSession()
+        self.set_user_agent("?")
+        self.logging_level = logging_level
+        self.max_retries = max_retries
+        self.online_cache = online_cache
+        # Decides when a move is sent again and keeps the move latencies. Moves are sent once if it is `None`.
+        self.move_sender: Optional[MoveSender] = None
+
+    @classmethod
+    async def create(cls, token: str, url: str, version: str, logging_level: int, max_retries: int,
+                     online_cache: Optional[OnlineCache] = None) -> AsyncLichess:
+        """Create an `AsyncLichess` and confirm that the OAuth token has the proper permission to play on lichess."""
+        li = cls(token, url, version, logging_level, max_retries, online_cache)
+        await li.check_token()
+        return li
+
+    async def check_token(self) -> None:
+        """Confirm that the OAuth token has the proper permission to play on lichess."""
+        token_response = cast(TOKEN_TESTS_TYPE, await self.api_post("token_test", data=self.token))
+        token_info = token_response.get(self.token)
+
+        if not token_info:
+            raise RuntimeError("There was an error in retrieving information about the bot's token. "
+                               "Please check that it was copied correctly into your configuration file "
+                               "and try again.")
+
+        scopes = token_info.get("scopes", "")
+        if "bot:play" not in scopes.split(","):
+            raise RuntimeError("Please use an API access token for your bot that "
+                               'has the scope "Play games with the bot API (bot:play)". '
+                               f"The current token has: {scopes}.")
+
+    async def __aenter__(self) -> AsyncLichess:  # noqa: PYI034 (return Self not available until 3.11)
+        """Enter context so that connections are closed afterwards."""
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        """Close all connections."""
+        self.close()
+
+    def close(self) -> None:
+        """Close all idle connections."""
+        self.session.close()
+        self.other_session.close()
+
+    @backoff.on_exception(backoff.constant,
+                          RETRY_EXCEPTIONS,
+                          max_time=60,
+                          interval=0.1,
+                          giveup=is_final,
+                          on_backoff=backoff_handler,
+                          backoff_log_level=logging.DEBUG,
+                          giveup_log_level=logging.DEBUG)
+    async def api_get(self, endpoint_name: str, *template_args: str,
+                      params: Optional[dict[str, str]] = None,
+                      stream: bool = False, timeout: int = 2) -> AsyncResponse:
+        """
+        Send a GET to lichess.org.
+
+        :param endpoint_name: The name of the endpoint.
+        :param template_args: The values that go in the url (e.g. the challenge id if `endpoint_name` is `accept`).
+        :param params: Parameters sent to lichess.org.
+        :param stream: Whether the data returned from lichess.org should be streamed.
+        :param timeout: The amount of time in seconds to wait for a response.
+        :return: lichess.org's response.
+        """
+        logging.getLogger("backoff").setLevel(self.logging_level)
+        path_template = self.get_path_template(endpoint_name)
+        await asyncio.sleep(self.reserve_request(endpoint_name))
+        url = urljoin(self.baseUrl, path_template.format(*template_args))
+        response = await self.session.get(url, params=params, timeout=timeout, stream=stream)
+
+        if is_new_rate_limit(response):
+            self.set_rate_limit_delay(path_template, get_rate_limit_delay(endpoint_name))
+
+        if response.status_code >= 400:
+            await response.aclose()
+        response.raise_for_status()
+        return response
+
+    async def api_get_json(self, endpoint_name: str, *template_args: str,
+                           params: Optional[dict[str, str]] = None
+                           ) -> Union[PublicDataType, UserProfileType, dict[str, list[GameType]]]:
+        """
+        Send a GET to the lichess.org endpoints that return a JSON.
+
+        :param endpoint_name: The name of the endpoint.
+        :param template_args: The values that go in the url (e.g. the challenge id if `endpoint_name` is `accept`).
+        :param params: Parameters sent to lichess.org.
+        :return: lichess.org's response in a dict.
+        """
+        response = await self.api_get(endpoint_name, *template_args, params=params)
+        json_response: Union[PublicDataType, UserProfileType, dict[str, list[GameType]]] = response.json()
+        return json_response
+
+    async def api_get_list(self, endpoint_name: str, *template_args: str,
+                           params: Optional[dict[str, str]] = None) -> list[UserProfileType]:
+        """
+        Send a GET to the lichess.org endpoints that return a list containing JSON.
+
+        :param endpoint_name: The name of the endpoint.
+        :param template_args: The values that go in the url (e.g. the challenge id if `endpoint_name` is `accept`).
+        :param params: Parameters sent to lichess.org.
+        :return: lichess.org's response in a list of dicts.
+        """
+        response = await self.api_get(endpoint_name, *template_args, params=params)
+        json_response: list[UserProfileType] = response.json()
+        return json_response
+
+    async def api_get_raw(self, endpoint_name: str, *template_args: str,
+                          params: Optional[dict[str, str]] = None) -> str:
+        """
+        Send a GET to lichess.org that returns plain text (UTF-8).
+
+        :param endpoint_name: The name of the endpoint.
+        :param template_args: The values that go in the url (e.g. the challenge id if `endpoint_name` is `accept`).
+        :param params: Parameters sent to lichess.org.
+        :return: The text of lichess.org's response.
+        """
+        response = await self.api_get(endpoint_name, *template_args, params=params)
+        return response.text
+
+    @backoff.on_exception(backoff.constant,
+                          RETRY_EXCEPTIONS,
+                          max_time=60,
+                          interval=0.1,
+                          giveup=is_final,
+                          on_backoff=backoff_handler,
+                          backoff_log_level=logging.DEBUG,
+                          giveup_log_level=logging.DEBUG)
+    async def api_post(self,
+                       endpoint_name: str,
+                       *template_args: str,
+                       data: Union[str, dict[str, str], None] = None,
+                       headers: Optional[dict[str, str]] = None,
+                       params: Optional[dict[str, str]] = None,
+                       payload: Optional[REQUESTS_PAYLOAD_TYPE] = None,
+                       raise_for_status: bool = True) -> Union[ChallengeType, Optional[TOKEN_TESTS_TYPE]]:
+        """
+        Send a POST to lichess.org.
+
+        :param endpoint_name: The name of the endpoint.
+        :param template_args: The values that go in the url (e.g. the challenge id if `endpoint_name` is `accept`).
+        :param data: Data sent to lichess.org.
+        :param headers: The headers for the request.
+        :param params: Parameters sent to lichess.org.
+        :param payload: Payload sent to lichess.org.
+        :param raise_for_status: Whether to raise an exception if the response contains an error code.
+        :return: lichess.org's response in a dict.
+        """
+        logging.getLogger("backoff").setLevel(self.logging_level)
+        path_template = self.get_path_template(endpoint_name)
+        await asyncio.sleep(self.reserve_request(endpoint_name))
+        url = urljoin(self.baseUrl, path_template.format(*template_args))
+        response = await self.session.post(url, data=data, headers=headers, params=params, json_payload=payload, timeout=2)
+
+        if is_new_rate_limit(response):
+            self.set_rate_limit_delay(path_template, post_rate_limit_delay(endpoint_name, response))
+
+        if raise_for_status:
+            response.raise_for_status()
+
+        json_response: Union[ChallengeType, Optional[TOKEN_TESTS_TYPE]] = response.json()
+        return json_response
+
+    async def upgrade_to_bot_account(self) -> None:
+        """Upgrade the account to a BOT account."""
+        await self.api_post("upgrade")
+
+    async def make_move(self, game_id: str, move: chess.engine.PlayResult) -> None:
+        """
+        Make a move.
+
+        :param game_id: The id of the game.
+        :param move: The move to make.
+        """
+        logging.getLogger("backoff").setLevel(self.logging_level)
+        path_template = self.get_path_template("move")
+        await asyncio.sleep(self.reserve_request("move"))
+        url = urljoin(self.baseUrl, path_template.format(game_id, str(move.move)))
+        params = {"offeringDraw": str(move.draw_offered).lower()}
+        if self.move_sender is None:
+            response = await self.session.post(url, params=params, timeout=2)
+        else:
+            response = await self.send_hedged_move(self.move_sender, url, params)
+
+        if is_new_rate_limit(response):
+            self.set_rate_limit_delay(path_template, post_rate_limit_delay("move", response))
+
+        response.raise_for_status()
+
+    async def send_hedged_move(self, move_sender: MoveSender, url: str, params: dict[str, str]) -> AsyncResponse:
+        """
+        Send a move, and send it again if it isn't answered in time. This does the same as `MoveSender.send`.
+
+        :param move_sender: Decides when the move is sent again and records the latency.
+        :param url: The url of the move.
+        :param params: Parameters sent with the move.
+        :return: The first successful response, or the last response if none succeeded.
+        """
+        start = time.perf_counter()
+        pending = {asyncio.ensure_future(self.session.post(url, params=params, timeout=2))}
+        hedge: Optional[asyncio.Future[AsyncResponse]] = None
+        if move_sender.hedge:
+            delay = move_sender.hedge_delay()
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if not done:
+                logger.debug(f"No answer to the move after {delay:0.2f} seconds. Sending it again.")
+                hedge = asyncio.ensure_future(self.session.post(url, params=params, timeout=2))
+                pending.add(hedge)
+                move_sender.hedged += 1
+
+        response: Optional[AsyncResponse] = None
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except (requests.exceptions.RequestException, RemoteDisconnected) as e:
+                    error = error or e
+                    continue
+                if result.status_code < 400:
+                    move_sender.record(start, future is hedge)
+                    for other in pending:
+                        # The other copy finishes on its own. Its answer (or error) isn't needed.
+                        other.add_done_callback(lambda f: f.cancelled() or f.exception())
+                    return result
+                response = result
+
+        move_sender.last_used = time.monotonic()
+        if response is not None:
+            return response
+        assert error is not None
+        raise error
+
+    async def accept_takeback(self, game_id: str, accept: bool) -> bool:
+        """Answer an opponent's move takeback request."""
+        try:
+            await self.api_post("takeback", game_id, "yes" if accept else "no")
+            if accept:
+                logger.info("Opponent took back previous move.")
+            else:
+                logger.info("Refused opponent's take back request.")
+            return accept
+        except Exception:
+            return False
+
+    async def chat(self, game_id: str, room: str, text: str) -> None:
+        """
+        Send a message to the chat.
+
+        :param game_id: The id of the game.
+        :param room: The room (either chat or spectator room).
+        :param text: The text to send.
+        """
+        if len(text) > MAX_CHAT_MESSAGE_LEN:
+            logger.warning(f"This chat message is {len(text)} characters, which is longer "
+                           f"than the maximum of {MAX_CHAT_MESSAGE_LEN}. It will not be sent.")
+            logger.warning(f"Message: {text}")
+
+        data = {"room": room, "text": text}
+        try:
+            await self.api_post("chat", game_id, data=data)
+        except RateLimitedError:
+            logger.info(f"Chat message not sent to stay below the rate limit: {text}")
+
+    async def abort(self, game_id: str) -> None:
+        """Aborts a game."""
+        await self.api_post("abort", game_id)
+
+    async def get_event_stream(self) -> AsyncResponse:
+        """Get a stream of the events (e.g. challenge, gameStart)."""
+        return await self.api_get("stream_event", stream=True, timeout=15)
+
+    async def get_game_stream(self, game_id: str) -> AsyncResponse:
+        """Get  stream of the in-game events (e.g. moves by the opponent)."""
+        return await self.api_get("stream", game_id, stream=True, timeout=15)
+
+    async def accept_challenge(self, challenge_id: str) -> None:
+        """Accept a challenge."""
+        await self.api_post("accept", challenge_id)
+
+    async def decline_challenge(self, challenge_id: str, reason: str = "generic") -> None:
+        """Decline a challenge. If too many challenges were declined recently, the challenge is left to expire."""
+        with contextlib.suppress(Exception):
+            await self.api_post("decline", challenge_id,
+                                data=f"reason={reason}",
+                                headers={"Content-Type": "application/x-www-form-urlencoded"},
+                                raise_for_status=False)
+
+    async def get_profile(self) -> UserProfileType:
+        """Get the bot's profile (e.g. username)."""
+        profile = cast(UserProfileType, await self.api_get_json("profile"))
+        self.set_user_agent(profile["username"])
+        return profile
+
+    async def get_ongoing_games(self) -> list[GameType]:
+        """Get the bot's ongoing games. An empty list is returned if lichess.org couldn't be asked."""
+        return await self.fetch_ongoing_games() or []
+
+    async def fetch_ongoing_games(self) -> Optional[list[GameType]]:
+        """Get the bot's ongoing games, or `None` if lichess.org couldn't be asked."""
+        try:
+            response = cast(dict[str, list[GameType]], await self.api_get_json("playing"))
+            return response["nowPlaying"]
+        except Exception:
+            logger.debug("Could not get the ongoing games.", exc_info=True)
+            return None
+
+    async def resign(self, game_id: str) -> None:
+        """Resign a game."""
+        await self.api_post("resign", game_id)
+
+    def set_user_agent(self, username: str) -> None:
+        """Set the user agent for communication with lichess.org."""
+        self.header.update({"User-Agent": f"lichess-bot/{self.version} user:{username}"})
+        self.session.headers.update(self.header)
+
+    async def get_game_pgn(self, game_id: str) -> str:
+        """Get the PGN (Portable Game Notation) record of a game."""
+        try:
+            return await self.api_get_raw("export", game_id)
+        except Exception:
+            return ""
+
+    async def get_online_bots(self) -> list[UserProfileType]:
+        """Get a list of bots that are online."""
+        try:
+            online_bots_str = await self.api_get_raw("online_bots")
+            online_bots = list(filter(bool, online_bots_str.split("\n")))
+            return list(map(json.loads, online_bots))
+        except Exception:
+            return []
+
+    async def challenge(self, username: str, payload: REQUESTS_PAYLOAD_TYPE) -> ChallengeType:
+        """Create a challenge."""
+        return cast(ChallengeType,
+                    await self.api_post("challenge", username, payload=payload, raise_for_status=False))
+
+    async def cancel(self, challenge_id: str) -> None:
+        """Cancel a challenge."""
+        await self.api_post("cancel", challenge_id, raise_for_status=False)
+
+    async def online_book_get(self, path: str, params: Optional[dict[str, Union[str, int]]] = None,
+                              stream: bool = False) -> OnlineType:
+        """Get an external move from online sources (chessdb or lichess.org). Responses are cached if enabled."""
+        if self.online_cache:
+            cached_response = self.online_cache.get(path, params)
+            if cached_response is not None:
+                return cached_response
+
+        @backoff.on_exception(backoff.constant,
+                              RETRY_EXCEPTIONS,
+                              max_time=60,
+                              max_tries=self.max_retries,
+                              interval=0.1,
+                              giveup=is_final,
+                              on_backoff=backoff_handler,
+                              backoff_log_level=logging.DEBUG,
+                              giveup_log_level=logging.DEBUG)
+        async def online_book_get() -> tuple[int, OnlineType]:
+            response = await self.other_session.get(path, timeout=2, params=params)
+            if response.status_code >= 500:
+                response.raise_for_status()
+            json_response: OnlineType = response.json()
+            return response.status_code, json_response
+
+        status_code, json_response = await online_book_get()
+        if self.online_cache and has_move(status_code, json_response):
+            self.online_cache.put(path, params, json_response)
+        return json_response
+
+    async def is_online(self, user_id: str) -> bool:
+        """Check if lichess.org thinks the bot is online or not."""
+        user = await self.api_get_list("status", params={"ids": user_id})
+        return bool(user and user[0].get("online"))
+
+    async def get_public_data(self, user_name: str) -> PublicDataType:
+        """Get the public data of a bot."""
+        return cast(PublicDataType, await self.api_get_json("public_data", user_name))
@@ -0,0 +1,96 @@
+"""Keep the board of a game up to date with the moves in the game stream."""
+import chess
+import logging
+from chess.variant import find_variant
+from lib import model
+
+logger = logging.getLogger(__name__)
+
+
+class BoardTracker:
+    """
+    The board of a game, updated move by move.
+
+    Each `gameState` message has all the moves of the game. Instead of replaying all of them for every message, the
+    tracker compares the moves with the moves it has already played on its board. New moves are pushed and taken back
+    moves are popped. The board is only set up again from the start if the moves don't continue or shorten the moves
+    already played, or if a move was illegal.
+    """
+
+    def __init__(self, game: model.Game) -> None:
+        """
+        Set up the starting position of the game.
+
+        :param game: The game. Its variant and initial FEN give the starting position.
+        """
+        self.game = game
+        self.board = starting_board(game)
+        self.moves = ""
+        self.in_sync = True
+
+    def update(self, game: model.Game) -> chess.Board:
+        """
+        Bring the board up to date with the moves of the game.
+
+        :param game: The game with the latest state from the game stream.
+        :return: The board after all the moves of the game.
+        """
+        moves = game.state["moves"]
+        if moves == self.moves and self.in_sync:
+            return self.board
+
+        if self.in_sync and continues(moves, self.moves):
+            self.push(moves[len(self.moves):].split(), moves)
+        elif self.in_sync and continues(self.moves, moves):
+            takeback_count = len(self.moves[len(moves):].split())
+            logger.debug(f"Taking back {takeback_count} moves in game {game.id}.")
+            for _ in range(takeback_count):
+                self.board.pop()
+        else:
+            self.rebuild(moves)
+
+        self.moves = moves
+        return self.board
+
+    def push(self, new_moves: list[str], moves: str) -> None:
+        """
+        Play new moves on the board.
+
+        :param new_moves: The moves after the moves already on the board.
+        :param moves: All the moves of the game, used to set up the board again if a new move is illegal.
+        """
+        for move in new_moves:
+            try:
+                self.board.push_uci(move)
+            except ValueError:
+                break
+        else:
+            return
+        self.rebuild(moves)
+
+    def rebuild(self, moves: str) -> None:
+        """Set up the board again from the starting position, ignoring illegal moves."""
+        self.board = starting_board(self.game)
+        self.in_sync = True
+        for move in moves.split():
+            try:
+                self.board.push_uci(move)
+            except ValueError:
+                logger.exception(f"Ignoring illegal move {move} on board {self.board.fen()}")
+                self.in_sync = False
+
+
+def starting_board(game: model.Game) -> chess.Board:
+    """Get the board of the starting position of a game."""
+    if game.variant_name.lower() == "chess960":
+        return chess.Board(game.initial_fen, chess960=True)
+    if game.variant_name == "From Position":
+        return chess.Board(game.initial_fen)
+    VariantBoard = find_variant(game.variant_name)
+    return VariantBoard()
+
+
+def continues(moves: str, prior_moves: str) -> bool:
+    """Whether the moves `moves` start with all the moves of `prior_moves`."""
+    return moves.startswith(prior_moves) and (not prior_moves or len(moves) == len(prior_moves)
+                                              or moves[len(prior_moves)] == " ")
@@ -8,6 +8,7 @@ import requests
 from abc import ABCMeta
 from typing import Any, Union, ItemsView, Callable
 from lib.lichess_types import CONFIG_DICT_TYPE, FilterType
+from lib.timer import days, to_seconds
 
 logger = logging.getLogger(__name__)
 
@@ -149,6 +150,21 @@ def insert_default_values(CONFIG: CONFIG_DICT_TYPE) -> None:
     set_config_default(CONFIG, key="pgn_directory", default=None)
     set_config_default(CONFIG, key="pgn_file_grouping", default="game", force_empty_values=True)
     set_config_default(CONFIG, key="max_takebacks_accepted", default=0, force_empty_values=True)
+    set_config_default(CONFIG, key="game_runner", default="pool", force_empty_values=True)
+    set_config_default(CONFIG, "adaptive_move_overhead", key="enabled", default=True)
+    set_config_default(CONFIG, "adaptive_move_overhead", key="percentile", default=95, force_empty_values=True)
+    set_config_default(CONFIG, "adaptive_move_overhead", key="min_samples", default=5, force_empty_values=True)
+    set_config_default(CONFIG, "adaptive_move_overhead", key="margin", default=50, force_empty_values=True)
+    set_config_default(CONFIG, "adaptive_move_overhead", key="min_overhead", default=100, force_empty_values=True)
+    set_config_default(CONFIG, "adaptive_move_overhead", key="max_overhead", default=5000, force_empty_values=True)
+    set_config_default(CONFIG, "move_submission", key="hedge", default=True)
+    set_config_default(CONFIG, "move_submission", key="hedge_percentile", default=90, force_empty_values=True)
+    set_config_default(CONFIG, "move_submission", key="min_hedge_delay", default=150, force_empty_values=True)
+    set_config_default(CONFIG, "move_submission", key="max_hedge_delay", default=1000, force_empty_values=True)
+    set_config_default(CONFIG, "move_submission", key="keep_alive", default=20, force_empty_values=True)
+    set_config_default(CONFIG, "cpu_scheduler", key="enabled", default=True)
+    set_config_default(CONFIG, "cpu_scheduler", key="urgent_time", default=30, force_empty_values=True)
+    set_config_default(CONFIG, "cpu_scheduler", key="relaxed_time", default=300, force_empty_values=True)
     set_config_default(CONFIG, "engine", key="interpreter", default=None)
     set_config_default(CONFIG, "engine", key="interpreter_options", default=[], force_empty_values=True)
     change_value_to_list(CONFIG, "engine", key="interpreter_options")
@@ -166,6 +182,10 @@ def insert_default_values(CONFIG: CONFIG_DICT_TYPE) -> None:
     set_config_default(CONFIG, "engine", "online_moves", key="max_out_of_book_moves", default=10)
     set_config_default(CONFIG, "engine", "online_moves", key="max_retries", default=2, force_empty_values=True)
     set_config_default(CONFIG, "engine", "online_moves", key="max_depth", default=math.inf, force_empty_values=True)
+    set_config_default(CONFIG, "engine", "online_moves", key="priority",
+                       default=["chessdb_book", "lichess_cloud_analysis", "lichess_opening_explorer"],
+                       force_empty_values=True)
+    set_config_default(CONFIG, "engine", "online_moves", key="max_time_fraction", default=0.05, force_empty_values=True)
     set_config_default(CONFIG, "engine", "online_moves", "online_egtb", key="enabled", default=False)
     set_config_default(CONFIG, "engine", "online_moves", "online_egtb", key="source", default="lichess")
     set_config_default(CONFIG, "engine", "online_moves", "online_egtb", key="min_time", default=20)
@@ -191,6 +211,17 @@ def insert_default_values(CONFIG: CONFIG_DICT_TYPE) -> None:
     set_config_default(CONFIG, "engine", "online_moves", "lichess_opening_explorer", key="player_name", default="")
     set_config_default(CONFIG, "engine", "online_moves", "lichess_opening_explorer", key="sort", default="winrate")
     set_config_default(CONFIG, "engine", "online_moves", "lichess_opening_explorer", key="min_games", default=10)
+    set_config_default(CONFIG, "engine", "online_moves", "cache", key="enabled", default=True)
+    set_config_default(CONFIG, "engine", "online_moves", "cache", key="path", default="online_moves_cache.sqlite",
+                       force_empty_values=True)
+    set_config_default(CONFIG, "engine", "online_moves", "cache", key="max_entries", default=100000,
+                       force_empty_values=True)
+    for source, ttl in (("chessdb", days(7)),
+                        ("lichess_cloud_analysis", days(1)),
+                        ("lichess_opening_explorer", days(7)),
+                        ("lichess_egtb", days(365))):
+        set_config_default(CONFIG, "engine", "online_moves", "cache", "ttl", key=source, default=int(to_seconds(ttl)),
+                           force_empty_values=True)
     set_config_default(CONFIG, "engine", "lichess_bot_tbs", "syzygy", key="enabled", default=False)
     set_config_default(CONFIG, "engine", "lichess_bot_tbs", "syzygy", key="max_pieces", default=7)
     set_config_default(CONFIG, "engine", "lichess_bot_tbs", "syzygy", key="move_quality", default="best")
@@ -198,6 +229,11 @@ def insert_default_values(CONFIG: CONFIG_DICT_TYPE) -> None:
     set_config_default(CONFIG, "engine", "lichess_bot_tbs", "gaviota", key="max_pieces", default=5)
     set_config_default(CONFIG, "engine", "lichess_bot_tbs", "gaviota", key="move_quality", default="best")
     set_config_default(CONFIG, "engine", "lichess_bot_tbs", "gaviota", key="min_dtm_to_consider_as_wdl_1", default=120)
+    set_config_default(CONFIG, "engine", "prefetch", key="enabled", default=False)
+    set_config_default(CONFIG, "engine", "prefetch", key="max_replies", default=2, force_empty_values=True)
+    set_config_default(CONFIG, "engine", "pool", key="enabled", default=True)
+    set_config_default(CONFIG, "engine", "pool", key="prelaunch", default=False)
+    set_config_default(CONFIG, "engine", "pool", key="max_games_per_engine", default=20, force_empty_values=True)
     set_config_default(CONFIG, "engine", "polyglot", key="enabled", default=False)
     set_config_default(CONFIG, "engine", "polyglot", key="max_depth", default=8)
     set_config_default(CONFIG, "engine", "polyglot", key="selection", default="weighted_random")
@@ -221,6 +257,11 @@ def insert_default_values(CONFIG: CONFIG_DICT_TYPE) -> None:
     set_config_default(CONFIG, "correspondence", key="checkin_period", default=600)
     set_config_default(CONFIG, "correspondence", key="move_time", default=60, force_empty_values=True)
     set_config_default(CONFIG, "correspondence", key="disconnect_time", default=300)
+    set_config_default(CONFIG, "correspondence", key="worker", default=False)
+    set_config_default(CONFIG, "correspondence", "idle_analysis", key="enabled", default=False)
+    set_config_default(CONFIG, "correspondence", "idle_analysis", key="time", default=60, force_empty_values=True)
+    set_config_default(CONFIG, "correspondence", "idle_analysis", key="position_store",
+                       default="correspondence_positions.sqlite", force_empty_values=True)
     set_config_default(CONFIG, "matchmaking", key="challenge_timeout", default=30, force_empty_values=True)
     CONFIG["matchmaking"]["challenge_timeout"] = max(CONFIG["matchmaking"]["challenge_timeout"], 1)
     set_config_default(CONFIG, "matchmaking", key="block_list", default=[], force_empty_values=True)
@@ -357,6 +398,39 @@ def validate_config(CONFIG: CONFIG_DICT_TYPE) -> None:
                   f"The `pgn_file_grouping` choice of `{config_pgn_choice}` is not valid. "
                   f"Please choose from {valid_pgn_grouping_options}.")
 
+    overhead_cfg = CONFIG["adaptive_move_overhead"]
+    config_assert(0 < overhead_cfg["percentile"] <= 100,
+                  "`adaptive_move_overhead.percentile` must be greater than 0 and at most 100.")
+    config_assert(overhead_cfg["min_samples"] >= 1, "`adaptive_move_overhead.min_samples` must be at least 1.")
+    config_assert(0 <= overhead_cfg["min_overhead"] <= overhead_cfg["max_overhead"],
+                  "`adaptive_move_overhead.min_overhead` must be at least 0 and at most "
+                  "`adaptive_move_overhead.max_overhead`.")
+
+    move_submission_cfg = CONFIG["move_submission"]
+    config_assert(0 < move_submission_cfg["hedge_percentile"] <= 100,
+                  "`move_submission.hedge_percentile` must be greater than 0 and at most 100.")
+    config_assert(0 <= move_submission_cfg["min_hedge_delay"] <= move_submission_cfg["max_hedge_delay"],
+                  "`move_submission.min_hedge_delay` must be at least 0 and at most `move_submission.max_hedge_delay`.")
+
+    cpu_scheduler_cfg = CONFIG["cpu_scheduler"]
+    config_assert(0 <= cpu_scheduler_cfg["urgent_time"] <= cpu_scheduler_cfg["relaxed_time"],
+                  "`cpu_scheduler.urgent_time` must be at least 0 and at most `cpu_scheduler.relaxed_time`.")
+
+    config_assert(CONFIG["engine"]["pool"]["max_games_per_engine"] >= 1,
+                  "`engine.pool.max_games_per_engine` must be at least 1.")
+
+    idle_analysis_cfg = CONFIG["correspondence"]["idle_analysis"]
+    config_assert(idle_analysis_cfg["time"] > 0, "`correspondence.idle_analysis.time` must be greater than 0.")
+    config_assert(not idle_analysis_cfg["enabled"] or CONFIG["correspondence"]["worker"],
+                  "`correspondence.idle_analysis` needs `correspondence.worker` to be enabled.")
+    config_assert(not idle_analysis_cfg["enabled"] or CONFIG["engine"]["protocol"] != "homemade",
+                  "`correspondence.idle_analysis` needs a UCI or XBoard engine.")
+
+    valid_game_runners = ["pool", "multiplexed"]
+    config_assert(CONFIG["game_runner"] in valid_game_runners,
+                  f"The `game_runner` choice of `{CONFIG['game_runner']}` is not valid. "
+                  f"Please choose from {valid_game_runners}.")
+
     def has_valid_list(name: str) -> bool:
         entries = matchmaking.get(name)
         return isinstance(entries, list) and entries[0] is not None
@@ -392,6 +466,13 @@ def validate_config(CONFIG: CONFIG_DICT_TYPE) -> None:
                       f"`{selection}` is not a valid `engine:{select}` value. "
                       f"Please choose from {valid_selections}.")
 
+    online_book_sources = ["chessdb_book", "lichess_cloud_analysis", "lichess_opening_explorer"]
+    online_moves_priority = (CONFIG["engine"].get("online_moves") or {}).get("priority") or []
+    for source in online_moves_priority:
+        config_assert(source in online_book_sources,
+                      f"`{source}` is not a valid entry of `engine:online_moves:priority`. "
+                      f"Please choose from {online_book_sources}.")
+
     polyglot_section = CONFIG["engine"].get("polyglot") or {}
     config_assert(polyglot_section.get("normalization") in ["none", "max", "sum"],
                   f"`{polyglot_section.get('normalization')}` is not a valid choice for "
@@ -4,9 +4,8 @@ from lib import model
 from lib.engine_wrapper import EngineWrapper
 from lib.lichess import Lichess
 from lib.lichess_types import GameEventType
-from collections.abc import Sequence
+from lib.shared_snapshot import SharedSnapshot
 from lib.timer import seconds
-MULTIPROCESSING_LIST_TYPE = Sequence[model.Challenge]
 
 logger = logging.getLogger(__name__)
 
@@ -28,7 +27,7 @@ class Conversation:
     """Enables the bot to communicate with its opponent and the spectators."""
 
     def __init__(self, game: model.Game, engine: EngineWrapper, li: Lichess, version: str,
-                 challenge_queue: MULTIPROCESSING_LIST_TYPE) -> None:
+                 challenge_snapshot: SharedSnapshot) -> None:
         """
         Communication between lichess-bot and the game chats.
 
@@ -36,13 +35,13 @@ class Conversation:
         :param engine: The engine playing the game.
         :param li: A class that is used for communication with lichess.
         :param version: The lichess-bot version.
-        :param challenge_queue: The active challenges the bot has.
+        :param challenge_snapshot: The names of the challengers in the bot's challenge queue, published by the main process.
         """
         self.game = game
         self.engine = engine
         self.li = li
         self.version = version
-        self.challengers = challenge_queue
+        self.challengers = challenge_snapshot
         self.messages: list[ChatLine] = []
 
     command_prefix = "!"
@@ -83,8 +82,9 @@ class Conversation:
         elif is_eval:
             self.send_reply(line, "I don't tell that to my opponent, sorry.")
         elif cmd == "queue":
-            if self.challengers:
-                challengers = ", ".join([f"@{challenger.challenger.name}" for challenger in reversed(self.challengers)])
+            challenger_names: list[str] = self.challengers.read()
+            if challenger_names:
+                challengers = ", ".join([f"@{name}" for name in reversed(challenger_names)])
                 self.send_reply(line, f"Challenge queue: {challengers}")
             else:
                 self.send_reply(line, "No challenges queued.")
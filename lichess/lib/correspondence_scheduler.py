@@ -0,0 +1,110 @@
+"""Decide when to check in on the correspondence games that the bot isn't connected to."""
+import datetime
+import heapq
+import itertools
+import logging
+import math
+import time
+from typing import Optional
+from lib.lichess_types import GameType
+from lib.timer import seconds, to_seconds
+
+logger = logging.getLogger(__name__)
+
+
+class CorrespondenceScheduler:
+    """
+    The correspondence games waiting to be started again, ordered by when they need attention.
+
+    A game in which it is the bot's turn is due at once. Any other game is due after the check-in period, when the
+    opponent may have moved. Among the games that are due, the ones in which it is the bot's turn and with the least time
+    left are started first. The main process waits on its control queue until the next game is due, so no process has to
+    send periodic pings.
+    """
+
+    def __init__(self, checkin_period: datetime.timedelta) -> None:
+        """:param checkin_period: How long to wait before checking a game in which it is the opponent's turn."""
+        self.checkin_period = to_seconds(checkin_period)
+        # (due time, tie-breaker, game id, priority), ordered by the `time.monotonic()` time at which a game is due.
+        self.waiting: list[tuple[float, int, str, tuple[bool, float]]] = []
+        # (priority, tie-breaker, game id) of the games that are due. Games in which it is the bot's turn come first.
+        self.due: list[tuple[tuple[bool, float], int, str]] = []
+        self.scheduled: dict[str, int] = {}
+        self.counter = itertools.count()
+        # Changes whenever a game is added or removed.
+        self.version = 0
+
+    def __len__(self) -> int:
+        """Get the number of games waiting to be started."""
+        return len(self.scheduled)
+
+    def __contains__(self, game_id: str) -> bool:
+        """Whether a game is waiting to be started."""
+        return game_id in self.scheduled
+
+    def add(self, game: GameType) -> None:
+        """
+        Schedule a check-in on a correspondence game. A game that was already scheduled is rescheduled.
+
+        :param game: The game, with `isMyTurn` and `secondsLeft` as in the `gameStart` event or ongoing games list.
+        """
+        game_id = game.get("gameId") or game["id"]
+        is_my_turn = bool(game.get("isMyTurn"))
+        seconds_left = game.get("secondsLeft")
+        priority = (not is_my_turn, math.inf if seconds_left is None else float(seconds_left))
+        due_time = time.monotonic() + (0 if is_my_turn else self.checkin_period)
+        entry_id = next(self.counter)
+        self.scheduled[game_id] = entry_id
+        self.version += 1
+        heapq.heappush(self.waiting, (due_time, entry_id, game_id, priority))
+        logger.debug(f"Check in on correspondence game {game_id} in {max(due_time - time.monotonic(), 0):0.0f} seconds.")
+
+    def discard(self, game_id: str) -> None:
+        """Stop waiting to start a game, e.g. because it ended or was started by other means."""
+        if self.scheduled.pop(game_id, None) is not None:
+            self.version += 1
+
+    def waiting_games(self) -> list[str]:
+        """Get the IDs of all the games waiting to be started: the games that are due first, then by when they're due."""
+        due_games = [game_id for _, entry_id, game_id in sorted(self.due) if self.scheduled.get(game_id) == entry_id]
+        waiting_games = [game_id for _, entry_id, game_id, _ in sorted(self.waiting)
+                         if self.scheduled.get(game_id) == entry_id]
+        return due_games + waiting_games
+
+    def time_until_next(self) -> Optional[datetime.timedelta]:
+        """
+        Get how long until the next waiting game is due, or `None` if no game is waiting to become due.
+
+        Games that are already due but couldn't be started (e.g. because all slots were taken) don't count. They are
+        started after a later event, like a game ending.
+        """
+        self.move_due_games()
+        if not self.waiting:
+            return None
+        return seconds(max(self.waiting[0][0] - time.monotonic(), 0))
+
+    def pop_due(self, count: int) -> list[str]:
+        """
+        Take the games that are due, most urgent first.
+
+        :param count: The most games to take.
+        :return: The IDs of the games.
+        """
+        self.move_due_games()
+        game_ids: list[str] = []
+        while self.due and len(game_ids) < count:
+            _, entry_id, game_id = heapq.heappop(self.due)
+            if self.scheduled.get(game_id) == entry_id:
+                del self.scheduled[game_id]
+                self.version += 1
+                game_ids.append(game_id)
+        return game_ids
+
+    def move_due_games(self) -> None:
+        """Move the games that have become due to the queue of due games, and drop discarded or rescheduled entries."""
+        now = time.monotonic()
+        while self.waiting and (self.waiting[0][0] <= now
+                                or self.scheduled.get(self.waiting[0][2]) != self.waiting[0][1]):
+            _, entry_id, game_id, priority = heapq.heappop(self.waiting)
+            if self.scheduled.get(game_id) == entry_id:
+                heapq.heappush(self.due, (priority, entry_id, game_id))
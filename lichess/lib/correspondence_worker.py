@@ -0,0 +1,375 @@
+"""Play moves in many correspondence games with one engine, without opening a game stream for each move."""
+from __future__ import annotations
+import chess
+import chess.engine
+import contextlib
+import logging
+import multiprocessing
+import multiprocessing.synchronize
+from typing import Optional, cast
+from lib import engine_wrapper, lichess_bot, model, ndjson
+from lib.board_tracker import BoardTracker
+from lib.config import Configuration
+from lib.correspondence_scheduler import CorrespondenceScheduler
+from lib.cpu_scheduler import RELAXED_NICENESS
+from lib.position_store import get_position_store
+from lib.lichess_types import EventType, GameType
+from lib.timer import Timer, msec, seconds, to_seconds
+
+logger = logging.getLogger(__name__)
+
+# Each batch is ("check_in" or "analyze", game IDs).
+BATCH_QUEUE_TYPE = multiprocessing.Queue  # multiprocessing.Queue[Optional[tuple[str, list[str]]]]
+
+# The most games sent to the worker at once, so that games that become due during a batch don't wait too long.
+MAX_BATCH_SIZE = 10
+
+# The niceness of the idle analysis engine, where the OS supports it. 19 is the lowest priority on Unix.
+IDLE_ANALYSIS_NICENESS = 19
+
+# The game passed to the idle analysis engine's searches, so that it isn't told about a new game for each position.
+IDLE_ANALYSIS_GAME = "idle-analysis"
+
+# How long to wait at shutdown for the worker to finish the game it is playing.
+WORKER_SHUTDOWN_TIMEOUT = seconds(5)
+
+
+class CorrespondenceWorker:
+    """
+    A process that checks in on correspondence games in batches.
+
+    The main process sends the IDs of the correspondence games that are due. For each game, the worker reads the current
+    state of the game, and:
+
+    - if it is the bot's turn, plays a move with `correspondence.move_time`, posted with `Lichess.make_move` like any
+      other move;
+    - if it is the opponent's turn, does nothing.
+
+    Either way, a `correspondence_checked` event is sent so that the main process schedules the next check-in. A game
+    that needs more than a move (a greeting at the start, a takeback offer, the end of the game) gets a
+    `correspondence_stream` event instead, and is played by `play_game` with a full game stream. The worker sends a
+    `correspondence_batch_done` event after each batch.
+
+    The worker keeps one engine for all games, and doesn't tell it about each new game, so the engine's process and its
+    hash table are reused. With `cpu_scheduler.enabled`, the engine searches at the priority of a relaxed game (see
+    `lib.cpu_scheduler`), since correspondence moves are never short of time and the worker's searches shouldn't take
+    the CPU from the engines of games with a clock.
+
+    With `correspondence.idle_analysis`, the worker also analyzes the waiting games while it has no check-ins and the
+    main process has free game slots. See `IdleAnalyzer`.
+    """
+
+    def __init__(self, play_game_args: lichess_bot.PlayGameArgsType) -> None:
+        """
+        Start the worker process.
+
+        :param play_game_args: The args passed to `play_game` (except for `game_id`).
+        """
+        self.worker_args = lichess_bot.PlayGameArgsType(**{key: value for key, value in play_game_args.items()
+                                                           if key != "game_id"})
+        self.idle_analysis = bool(play_game_args["config"].correspondence.idle_analysis.enabled)
+        self.start()
+
+    def start(self) -> None:
+        """Start the worker process."""
+        self.batch_queue: BATCH_QUEUE_TYPE = multiprocessing.Queue()
+        self.stop_analysis = multiprocessing.Event()
+        self.process = multiprocessing.Process(target=run_correspondence_worker,
+                                               args=(self.batch_queue, self.stop_analysis, self.worker_args))
+        self.process.start()
+        self.busy = False
+        self.batch: list[str] = []
+        self.analyzing = False
+        self.analyzed_version: Optional[int] = None
+
+    def check_in(self, game_ids: list[str]) -> None:
+        """Send a batch of games to the worker. Idle analysis is stopped first."""
+        logger.info(f"--- Checking in on correspondence games {', '.join(game_ids)}")
+        self.stop_idle_analysis()
+        self.busy = True
+        self.batch = list(game_ids)
+        self.batch_queue.put_nowait(("check_in", game_ids))
+
+    def game_done(self, game_id: str) -> None:
+        """Note that the worker has handed a game of its batch back to the main process."""
+        with contextlib.suppress(ValueError):
+            self.batch.remove(game_id)
+
+    def batch_done(self) -> None:
+        """Note that the worker has finished its batch."""
+        self.busy = False
+        self.batch = []
+
+    def restart_if_dead(self) -> list[str]:
+        """
+        Start a new worker process if the worker died.
+
+        :return: The games of the batch that the dead worker didn't hand back. They need a game stream.
+        """
+        if self.process.is_alive():
+            return []
+        logger.error(f"The correspondence worker stopped (exit code {self.process.exitcode}). Starting a new worker.")
+        lost_games = self.batch
+        self.batch_queue.cancel_join_thread()
+        self.start()
+        return lost_games
+
+    def analyze_when_idle(self, correspondence_scheduler: CorrespondenceScheduler) -> None:
+        """
+        Send the waiting games to be analyzed, if the worker has nothing else to do.
+
+        The games aren't sent again until the waiting games change, so each set of waiting games is analyzed once.
+
+        :param correspondence_scheduler: Where the correspondence games wait to be checked on.
+        """
+        if (not self.idle_analysis or self.busy or self.analyzing
+                or self.analyzed_version == correspondence_scheduler.version):
+            return
+        game_ids = correspondence_scheduler.waiting_games()
+        self.analyzed_version = correspondence_scheduler.version
+        if not game_ids:
+            return
+        self.stop_analysis.clear()
+        self.analyzing = True
+        self.batch_queue.put_nowait(("analyze", game_ids))
+
+    def stop_idle_analysis(self) -> None:
+        """Stop the idle analysis, e.g. because a game slot was taken. It starts again the next time the worker is idle."""
+        if self.analyzing:
+            self.stop_analysis.set()
+            self.analyzed_version = None
+
+    def analysis_done(self) -> None:
+        """Note that the worker has finished or stopped its idle analysis."""
+        self.analyzing = False
+
+    def close(self) -> None:
+        """Stop the worker after the game it is playing, and close its engines."""
+        self.stop_analysis.set()
+        self.batch_queue.put_nowait(None)
+        self.process.join(to_seconds(WORKER_SHUTDOWN_TIMEOUT))
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.batch_queue.cancel_join_thread()
+
+    def __enter__(self) -> CorrespondenceWorker:  # noqa: PYI034 (return Self not available until 3.11)
+        """Enter context like `multiprocessing.pool.Pool`."""
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        """Stop the worker when exiting the context."""
+        self.close()
+
+
+def create_correspondence_worker(config: Configuration, play_game_args: lichess_bot.PlayGameArgsType
+                                 ) -> contextlib.AbstractContextManager[Optional[CorrespondenceWorker]]:
+    """Start the correspondence worker if `correspondence.worker` is enabled. Use in a with-block."""
+    if not config.correspondence.worker:
+        return contextlib.nullcontext()
+    return CorrespondenceWorker(play_game_args)
+
+
+def run_correspondence_worker(batch_queue: BATCH_QUEUE_TYPE, stop_analysis: multiprocessing.synchronize.Event,
+                              play_game_args: lichess_bot.PlayGameArgsType) -> None:
+    """
+    Check in on or analyze every batch of games sent through the batch queue until a `None` is received.
+
+    :param batch_queue: The queue with the batches of game IDs.
+    :param stop_analysis: Set by the main process to stop the idle analysis.
+    :param play_game_args: The args passed to `play_game` (except for `game_id`).
+    """
+    lichess_bot.thread_logging_configurer(play_game_args["logging_queue"], play_game_args["logging_level"])
+    control_queue = play_game_args["control_queue"]
+    engine: Optional[engine_wrapper.EngineWrapper] = None
+    analyzer = IdleAnalyzer(play_game_args, stop_analysis)
+    try:
+        while (batch := batch_queue.get()) is not None:
+            kind, game_ids = batch
+            if kind == "analyze":
+                analyzer.analyze_games(game_ids)
+                control_queue.put_nowait({"type": "correspondence_analysis_done"})
+                continue
+
+            for game_id in game_ids:
+                if engine is not None and not engine.is_alive():
+                    logger.info("The correspondence engine stopped responding. Starting a new engine.")
+                    with contextlib.suppress(Exception):
+                        engine.engine.close()
+                    engine = None
+                try:
+                    event, engine = check_in_on_game(game_id, engine, play_game_args)
+                except Exception:
+                    logger.exception(f"Could not check in on correspondence game {game_id}. Opening its game stream.")
+                    event = {"type": "correspondence_stream", "game": {"id": game_id}}
+                control_queue.put_nowait(event)
+            control_queue.put_nowait({"type": "correspondence_batch_done"})
+    finally:
+        analyzer.close()
+        if engine is not None:
+            engine.__exit__(None, None, None)
+
+
+def check_in_on_game(game_id: str, engine: Optional[engine_wrapper.EngineWrapper],
+                     play_game_args: lichess_bot.PlayGameArgsType
+                     ) -> tuple[EventType, Optional[engine_wrapper.EngineWrapper]]:
+    """
+    Play a move in a correspondence game if it is the bot's turn.
+
+    :param game_id: The ID of the game.
+    :param engine: The worker's engine, or `None` if it hasn't been started yet.
+    :param play_game_args: The args passed to `play_game` (except for `game_id`).
+    :return: The event for the main process, and the worker's engine.
+    """
+    li = play_game_args["li"]
+    config = play_game_args["config"]
+    game = read_game(game_id, play_game_args)
+    board = BoardTracker(game).update(game)
+
+    if needs_game_stream(game, board):
+        return {"type": "correspondence_stream", "game": {"id": game_id}}, engine
+
+    if lichess_bot.bot_to_move(game, board):
+        if engine is None:
+            engine = engine_wrapper.create_engine(config, game)
+            engine.__enter__()
+        else:
+            engine.new_game(game, keep_hash=True)
+        if config.cpu_scheduler.enabled:
+            engine.set_niceness(RELAXED_NICENESS)
+        engine.get_opponent_info(game)
+        logger.info(f"Playing a move in correspondence game {game.url()}")
+        engine.play_move(board,
+                         game,
+                         li,
+                         Timer(),
+                         msec(config.move_overhead),
+                         False,
+                         True,
+                         seconds(config.correspondence.move_time),
+                         config.engine,
+                         lichess_bot.fake_think_time(config, board, game))
+
+    checked_game: GameType = {"id": game_id,
+                              "speed": "correspondence",
+                              "isMyTurn": False,
+                              "secondsLeft": int(to_seconds(game.my_remaining_time()))}
+    return {"type": "correspondence_checked", "game": checked_game}, engine
+
+
+def read_game(game_id: str, play_game_args: lichess_bot.PlayGameArgsType) -> model.Game:
+    """Get the current state of a game from the first message of its game stream, then close the stream."""
+    li = play_game_args["li"]
+    response = li.get_game_stream(game_id)
+    try:
+        lines = ndjson.iter_lines(response.iter_content(chunk_size=None))
+        game_full = ndjson.decode(next(lines))
+    finally:
+        response.close()
+    return model.Game(game_full, play_game_args["user_profile"]["username"], li.baseUrl,
+                      seconds(play_game_args["config"].abort_time))
+
+
+def needs_game_stream(game: model.Game, board: chess.Board) -> bool:
+    """Whether the game needs `play_game` instead of a single move: to greet the opponent, answer a takeback or end."""
+    takeback_offered = game.state.get("btakeback") if game.is_white else game.state.get("wtakeback")
+    return lichess_bot.is_game_over(game) or len(board.move_stack) < 2 or bool(takeback_offered)
+
+
+class IdleAnalyzer:
+    """
+    Analyze the positions of the waiting correspondence games while the bot has nothing else to do.
+
+    For a game in which it is the opponent's turn, the current position is analyzed to predict the opponent's reply,
+    and then the position after that reply is analyzed. For a game in which it is the bot's turn, the current position is
+    analyzed. The results go to the position store, where `EngineWrapper.play_move` finds them when it is deeper than a
+    search with `correspondence.move_time` would be. Positions that are already in the store are skipped.
+
+    The analysis uses its own engine, which runs at the lowest OS priority where the OS allows it, so that it only uses
+    the CPU time left over by the games being played.
+    """
+
+    def __init__(self, play_game_args: lichess_bot.PlayGameArgsType, stop_analysis: multiprocessing.synchronize.Event
+                 ) -> None:
+        """
+        Get ready to analyze.
+
+        :param play_game_args: The args passed to `play_game` (except for `game_id`).
+        :param stop_analysis: Set by the main process to stop the analysis.
+        """
+        self.play_game_args = play_game_args
+        self.config = play_game_args["config"]
+        self.stop_analysis = stop_analysis
+        idle_analysis_cfg = self.config.correspondence.idle_analysis
+        self.limit = chess.engine.Limit(time=idle_analysis_cfg.time)
+        self.position_store = get_position_store(idle_analysis_cfg.position_store) if idle_analysis_cfg.enabled else None
+        self.engine: Optional[engine_wrapper.EngineWrapper] = None
+
+    def analyze_games(self, game_ids: list[str]) -> None:
+        """Analyze the games until all are done or the main process stops the analysis."""
+        for game_id in game_ids:
+            if self.stop_analysis.is_set():
+                logger.debug("Idle analysis stopped.")
+                return
+            try:
+                self.analyze_game(game_id)
+            except Exception:
+                logger.exception(f"Could not analyze correspondence game {game_id}.")
+
+    def analyze_game(self, game_id: str) -> None:
+        """Analyze the current position of a game and, if it is the opponent's turn, the position after their reply."""
+        game = read_game(game_id, self.play_game_args)
+        if lichess_bot.is_game_over(game):
+            return
+        board = BoardTracker(game).update(game)
+        if not lichess_bot.bot_to_move(game, board):
+            predicted_line = self.analyze(board)
+            if not predicted_line or self.stop_analysis.is_set():
+                return
+            board.push(predicted_line[0])
+            if board.is_game_over():
+                return
+        self.analyze(board)
+
+    def analyze(self, board: chess.Board) -> list[chess.Move]:
+        """
+        Analyze a position and store the result.
+
+        :return: The principal variation, or an empty list if there is none.
+        """
+        if self.position_store is None:
+            return []
+        stored = self.position_store.get(board)
+        if stored is not None:
+            return stored.pv
+
+        logger.debug(f"Idle analysis of {board.fen()}")
+        engine = cast(chess.engine.SimpleEngine, self.get_engine().engine)
+        with engine.analysis(board, self.limit, game=IDLE_ANALYSIS_GAME) as analysis:
+            for _ in analysis:
+                if self.stop_analysis.is_set():
+                    break
+            info = analysis.info
+        self.position_store.put(board, info)
+        return info.get("pv", [])
+
+    def get_engine(self) -> engine_wrapper.EngineWrapper:
+        """Get the analysis engine, starting it at a low priority if it isn't running."""
+        if self.engine is not None and not self.engine.is_alive():
+            logger.info("The idle analysis engine stopped responding. Starting a new engine.")
+            with contextlib.suppress(Exception):
+                self.engine.engine.close()
+            self.engine = None
+        if self.engine is None:
+            self.engine = engine_wrapper.create_engine(self.config)
+            self.engine.__enter__()
+            if not self.engine.set_niceness(IDLE_ANALYSIS_NICENESS):
+                logger.debug("The priority of the idle analysis engine can't be lowered on this system.")
+        return self.engine
+
+    def close(self) -> None:
+        """Quit the analysis engine."""
+        if self.engine is not None:
+            self.engine.__exit__(None, None, None)
+            self.engine = None
+
@@ -0,0 +1,139 @@
+"""Share the CPU between the engines of concurrent games according to how much time each game has left."""
+import logging
+from typing import Optional
+from lib.config import Configuration
+from lib.engine_wrapper import EngineWrapper
+from lib.lichess_types import CONTROL_QUEUE_TYPE, EventType
+from lib.shared_snapshot import SharedSnapshot
+
+logger = logging.getLogger(__name__)
+
+URGENT = "urgent"
+NORMAL = "normal"
+RELAXED = "relaxed"
+
+# The niceness of an engine that searches in an urgent game, and of an engine in a relaxed game.
+URGENT_NICENESS = -5
+RELAXED_NICENESS = 10
+
+# Room for the policy of a few hundred games.
+SNAPSHOT_CAPACITY = 64 * 1024
+
+
+class CpuScheduler:
+    """
+    Decide which games' engines get the CPU first. This runs in the main process.
+
+    Each game reports the bot's remaining time with a `game_clock` event after every move. A game is urgent when the bot
+    has less than `cpu_scheduler.urgent_time` seconds left. While any game is urgent, the games in which the bot has more
+    than `cpu_scheduler.relaxed_time` seconds left are relaxed. The level of each game that isn't normal is published to
+    the game processes, where `GameCpuPolicy` applies it according to whose turn it is. The engine of the correspondence
+    worker (`lib.correspondence_worker`) always runs at the priority of a relaxed game.
+    """
+
+    def __init__(self, config: Configuration, snapshot: SharedSnapshot) -> None:
+        """
+        :param config: The `cpu_scheduler` section of the config.
+        :param snapshot: Where the level of each game is published.
+        """
+        self.urgent_time: float = config.urgent_time
+        self.relaxed_time: float = config.relaxed_time
+        self.snapshot = snapshot
+        self.clocks: dict[str, float] = {}
+
+    def update(self, event: EventType) -> None:
+        """
+        Update the clocks from an event and publish the new levels if they changed.
+
+        :param event: An event from the control queue.
+        """
+        game = event.get("game")
+        if not game:
+            return
+        game_id = game.get("gameId") or game["id"]
+        if event["type"] == "game_clock":
+            self.clocks[game_id] = game.get("secondsLeft", 0)
+        elif event["type"] in ["local_game_done", "gameFinish"]:
+            if self.clocks.pop(game_id, None) is None:
+                return
+        else:
+            return
+        self.snapshot.publish(self.levels())
+
+    def levels(self) -> dict[str, str]:
+        """Get the level of every game that isn't normal."""
+        urgent_games = {game_id: URGENT for game_id, seconds_left in self.clocks.items() if seconds_left < self.urgent_time}
+        if not urgent_games:
+            return {}
+        relaxed_games = {game_id: RELAXED for game_id, seconds_left in self.clocks.items()
+                         if seconds_left > self.relaxed_time}
+        return urgent_games | relaxed_games
+
+
+# Whether this process may raise the priority of its engines again after lowering it. `None` until it is checked.
+priority_control_available: Optional[bool] = None
+
+
+class GameCpuPolicy:
+    """
+    Apply the level of a game that the main process's `CpuScheduler` published to the game's engine.
+
+    The priority for the bot's turn is set by `before_search`, and the priority for the opponent's turn by
+    `while_waiting`. An engine doesn't ponder in a relaxed game, and its ponder search is stopped if it is already
+    pondering. The engine of a relaxed game runs at a lower priority. Where the OS allows the priority of a process to be
+    raised again after it is lowered (e.g. when running as root), the engine of an urgent game also searches at a higher
+    priority, and an engine goes back to the normal priority when its game is no longer relaxed. Otherwise, an engine
+    that was lowered keeps the lower priority for the rest of its game, and the engine pool retires it afterwards instead
+    of giving it to the next game.
+    """
+
+    def __init__(self, snapshot: Optional[SharedSnapshot], control_queue: CONTROL_QUEUE_TYPE, game_id: str,
+                 engine: EngineWrapper) -> None:
+        """
+        :param snapshot: The levels published by the main process, or `None` if `cpu_scheduler` is disabled.
+        :param control_queue: Where the game's clock is reported.
+        :param game_id: The game's ID.
+        :param engine: The game's engine.
+        """
+        self.snapshot = snapshot
+        self.control_queue = control_queue
+        self.game_id = game_id
+        self.engine = engine
+
+    def level(self) -> str:
+        """Get the game's level."""
+        return NORMAL if self.snapshot is None else self.snapshot.read().get(self.game_id, NORMAL)
+
+    def report(self, seconds_left: float) -> None:
+        """Tell the main process how much time the bot has left."""
+        if self.snapshot is not None:
+            self.control_queue.put_nowait({"type": "game_clock",
+                                           "game": {"id": self.game_id, "secondsLeft": int(seconds_left)}})
+
+    def may_ponder(self) -> bool:
+        """Whether the engine may ponder after its move."""
+        return self.level() != RELAXED
+
+    def before_search(self) -> None:
+        """Set the engine's priority for its search."""
+        level = self.level()
+        self.set_niceness(URGENT_NICENESS if level == URGENT else RELAXED_NICENESS if level == RELAXED else 0)
+
+    def while_waiting(self) -> None:
+        """Set the engine's priority while it waits for the opponent, and stop pondering in a relaxed game."""
+        if self.level() == RELAXED:
+            self.engine.stop_pondering()
+            self.set_niceness(RELAXED_NICENESS)
+        else:
+            self.set_niceness(0)
+
+    def set_niceness(self, niceness: int) -> None:
+        """Set the niceness of the engine. Without control over the priority, the niceness is only ever raised."""
+        global priority_control_available
+        if priority_control_available is None:
+            priority_control_available = self.engine.set_niceness(-1) and self.engine.set_niceness(0)
+            if not priority_control_available:
+                logger.debug("The priority of engines can't be raised on this system. Only the engines of relaxed games "
+                             "will have their priority lowered.")
+        if priority_control_available or niceness > self.engine.niceness:
+            self.engine.set_niceness(niceness)
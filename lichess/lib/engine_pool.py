@@ -0,0 +1,167 @@
+"""Keep engines running between games, so that a new game doesn't wait for its engine to start."""
+import atexit
+import contextlib
+import logging
+import threading
+from collections.abc import Iterator
+from typing import Optional
+from lib import model
+from lib.config import Configuration
+from lib.engine_wrapper import EngineWrapper, MinimalEngine, create_engine
+
+logger = logging.getLogger(__name__)
+
+
+class EnginePool:
+    """
+    Engines that are started ahead of time and leased to games.
+
+    An engine that finishes a game is checked with a ping and kept for the next game played by this process, until it
+    has played `max_games_per_engine` games. Before it is leased again, it gets the options of the new game and is told
+    that a new game is starting. An engine that fails its check is replaced by a new one.
+
+    Engine processes can't move between processes, so each game process has its own pool. Homemade engines aren't
+    pooled since they don't start a process.
+
+    A pooled engine keeps its memory (e.g. its hash table) while it waits for the next game. With `game_runner: pool`,
+    there can be one idle engine in each of the `challenge.concurrency` + 1 game processes. With `engine.pool.prelaunch`,
+    up to `challenge.concurrency` of them are started before any game, so an idle bot uses that much memory from the
+    start. Disable `engine.pool` to only run engines during games.
+    """
+
+    def __init__(self, config: Configuration, max_idle: int) -> None:
+        """
+        Create an empty pool.
+
+        :param config: The config that the engines are started with.
+        :param max_idle: The most engines kept running while no game is using them.
+        """
+        self.config = config
+        self.max_idle = max_idle
+        self.max_games_per_engine: int = config.engine.pool.max_games_per_engine
+        self.idle: list[EngineWrapper] = []
+        self.games_played: dict[EngineWrapper, int] = {}
+        self.lock = threading.Lock()
+
+    def prelaunch(self, count: int) -> None:
+        """Start engines so that they're ready for the first games."""
+        if self.config.engine.protocol == "homemade":
+            return
+        for _ in range(min(count, self.max_idle) - len(self.idle)):
+            engine = create_engine(self.config)
+            engine.__enter__()
+            with self.lock:
+                self.games_played[engine] = 0
+                self.idle.append(engine)
+        logger.debug(f"Started {len(self.idle)} engines ahead of time.")
+
+    @contextlib.contextmanager
+    def lease(self, game: model.Game) -> Iterator[EngineWrapper]:
+        """
+        Lend an engine to a game. Use in a with-block, like `create_engine`.
+
+        The engine goes back to the pool when the with-block exits normally. If it exits due to an error, the engine is
+        closed.
+        """
+        engine = self.acquire(game)
+        try:
+            yield engine
+        except BaseException as error:
+            self.games_played.pop(engine, None)
+            engine.__exit__(type(error), error, error.__traceback__)
+            raise
+        self.release(engine)
+
+    def acquire(self, game: model.Game) -> EngineWrapper:
+        """Get a working engine from the pool, or start a new one, and get it ready for the game."""
+        while True:
+            with self.lock:
+                engine = self.idle.pop() if self.idle else None
+            if engine is None:
+                break
+            if engine.is_alive():
+                try:
+                    engine.new_game(game)
+                except Exception:
+                    logger.warning("Could not set up a pooled engine for a new game. Starting a new engine.", exc_info=True)
+                    self.close_engine(engine)
+                    continue
+                logger.debug(f"Reusing engine {engine.get_pid()} for game {game.id}.")
+                return engine
+            logger.info("A pooled engine stopped responding. Starting a new engine.")
+            self.close_engine(engine)
+
+        engine = create_engine(self.config, game)
+        engine.__enter__()
+        if not isinstance(engine, MinimalEngine):
+            self.games_played[engine] = 0
+        return engine
+
+    def release(self, engine: EngineWrapper) -> None:
+        """Take back an engine after a game. It is kept if it still works and hasn't played too many games."""
+        games_played = self.games_played.get(engine)
+        if games_played is None:
+            engine.__exit__(None, None, None)
+            return
+        self.games_played[engine] = games_played + 1
+        if not engine.set_niceness(0):
+            logger.debug(f"Retiring engine {engine.get_pid()} since its priority can't be restored.")
+            self.close_engine(engine)
+            return
+        with self.lock:
+            keep = self.games_played[engine] < self.max_games_per_engine and len(self.idle) < self.max_idle
+        if not keep:
+            logger.debug(f"Retiring engine {engine.get_pid()} after {self.games_played[engine]} games.")
+            self.games_played.pop(engine, None)
+            engine.__exit__(None, None, None)
+        elif engine.is_alive():  # This also stops pondering.
+            with self.lock:
+                self.idle.append(engine)
+        else:
+            self.close_engine(engine)
+
+    def close_engine(self, engine: EngineWrapper) -> None:
+        """Close an engine without waiting for it to quit."""
+        self.games_played.pop(engine, None)
+        with contextlib.suppress(Exception):
+            engine.engine.close()
+
+    def close(self) -> None:
+        """Quit all idle engines."""
+        with self.lock:
+            engines, self.idle = self.idle, []
+        for engine in engines:
+            self.games_played.pop(engine, None)
+            with contextlib.suppress(Exception):
+                engine.__exit__(None, None, None)
+
+
+# The engine pool of this process.
+process_engine_pool: Optional[EnginePool] = None
+
+
+def get_engine_pool(config: Configuration, max_idle: int = 1) -> EnginePool:
+    """
+    Get the engine pool of this process, creating it the first time.
+
+    :param config: The config that the engines are started with.
+    :param max_idle: The most engines kept running while no game is using them.
+    """
+    global process_engine_pool
+    if process_engine_pool is None:
+        process_engine_pool = EnginePool(config, max_idle)
+        atexit.register(process_engine_pool.close)
+    return process_engine_pool
+
+
+def lease_engine(config: Configuration, game: model.Game) -> contextlib.AbstractContextManager[EngineWrapper]:
+    """
+    Get an engine for a game. Use in a with-block.
+
+    :param config: The config the bot uses.
+    :param game: The game the engine will play.
+    :return: An engine from this process's pool, or a new engine if `engine.pool` is disabled.
+    """
+    if not config.engine.pool.enabled:
+        return create_engine(config, game)
+    return get_engine_pool(config).lease(game)
@@ -1,6 +1,7 @@
 """Provides communication with the engine."""
 from __future__ import annotations
 import os
+import atexit
 import chess.engine
 import chess.polyglot
 import chess.syzygy
@@ -13,9 +14,12 @@ import time
 import random
 import math
 import contextlib
-from collections import Counter
-from collections.abc import Callable
-from lib import model, lichess
+import threading
+from collections import Counter, OrderedDict
+from collections.abc import Callable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from lib import model, lichess, prefetch
+from lib.position_store import PositionStore, get_position_store, history_matters
 from lib.config import Configuration, change_value_to_list
 from lib.timer import Timer, msec, seconds, msec_str, sec_str, to_seconds
 from lib.lichess_types import (ReadableType, ChessDBMoveType, LichessEGTBMoveType, OPTIONS_GO_EGTB_TYPE, OPTIONS_TYPE,
@@ -31,6 +35,79 @@ logger = logging.getLogger(__name__)
 
 out_of_online_opening_book_moves: Counter[str] = Counter()
 
+# Scores of the moves in positions already probed in the local tablebases, so that positions that come up again (or
+# were prefetched during the opponent's turn) aren't probed twice.
+MAX_TABLEBASE_SCORES = 4096
+tablebase_scores: OrderedDict[tuple[str, str, str], dict[chess.Move, Union[int, float]]] = OrderedDict()
+tablebase_scores_lock = threading.Lock()
+
+# Opening books and tablebases opened by this process. They are kept open for all the moves and games played by the
+# process instead of being opened again for every move. Each tablebase has a lock, since they aren't safe to probe from
+# several threads (e.g. a game and its prefetcher) at once.
+open_books: dict[str, chess.polyglot.MemoryMappedReader] = {}
+open_tablebases: dict[tuple[str, ...], tuple[Union[chess.syzygy.Tablebase, chess.gaviota.PythonTablebase,
+                                                   chess.gaviota.NativeTablebase], threading.Lock]] = {}
+open_files_lock = threading.Lock()
+
+# The threads that ask the online opening books, shared by all games of this process and started the first time they're
+# needed. A request abandoned at its deadline finishes on one of these threads instead of leaving a thread behind for
+# every move. There is room for a few games (e.g. in a game host) to ask all sources at once.
+ONLINE_BOOK_THREADS = 8
+online_book_executor: Optional[ThreadPoolExecutor] = None
+online_book_executor_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def polyglot_reader(book: str) -> Iterator[chess.polyglot.MemoryMappedReader]:
+    """Get a reader for an opening book, opening the book the first time it is used by this process."""
+    with open_files_lock:
+        if book not in open_books:
+            open_books[book] = chess.polyglot.open_reader(book)
+        reader = open_books[book]
+    yield reader
+
+
+@contextlib.contextmanager
+def syzygy_tablebase(paths: list[str]) -> Iterator[chess.syzygy.Tablebase]:
+    """Get the syzygy tablebases in `paths`, opening them the first time they're used by this process."""
+    key = ("syzygy", *paths)
+    with open_files_lock:
+        if key not in open_tablebases:
+            tablebase = chess.syzygy.open_tablebase(paths[0])
+            for path in paths[1:]:
+                tablebase.add_directory(path)
+            open_tablebases[key] = (tablebase, threading.Lock())
+        tablebase, lock = open_tablebases[key]
+    with lock:
+        yield cast(chess.syzygy.Tablebase, tablebase)
+
+
+@contextlib.contextmanager
+def gaviota_tablebase(paths: list[str]) -> Iterator[Union[chess.gaviota.PythonTablebase, chess.gaviota.NativeTablebase]]:
+    """Get the gaviota tablebases in `paths`, opening them the first time they're used by this process."""
+    key = ("gaviota", *paths)
+    with open_files_lock:
+        if key not in open_tablebases:
+            tablebase = chess.gaviota.open_tablebase(paths[0])
+            for path in paths[1:]:
+                tablebase.add_directory(path)
+            open_tablebases[key] = (tablebase, threading.Lock())
+        tablebase, lock = open_tablebases[key]
+    with lock:
+        yield cast(Union[chess.gaviota.PythonTablebase, chess.gaviota.NativeTablebase], tablebase)
+
+
+@atexit.register
+def close_books_and_tablebases() -> None:
+    """Close the opening books and tablebases opened by this process."""
+    with open_files_lock:
+        for reader in open_books.values():
+            reader.close()
+        for tablebase, _ in open_tablebases.values():
+            tablebase.close()
+        open_books.clear()
+        open_tablebases.clear()
+
 
 def create_engine(engine_config: Configuration, game: Optional[model.Game] = None) -> EngineWrapper:
     """
@@ -67,7 +144,11 @@ def create_engine(engine_config: Configuration, game: Optional[model.Game] = Non
             f"    Invalid engine type: {engine_type}. Expected xboard, uci, or homemade.")
     options = remove_managed_options(cfg.lookup(f"{engine_type}_options") or Configuration({}))
     logger.debug(f"Starting engine: {commands}")
-    return Engine(commands, options, stderr, cfg.draw_or_resign, game, cwd=cfg.working_dir)
+    engine = Engine(commands, options, stderr, cfg.draw_or_resign, game, cwd=cfg.working_dir)
+    idle_analysis_cfg = engine_config.correspondence.idle_analysis
+    if idle_analysis_cfg.enabled:
+        engine.position_store = get_position_store(idle_analysis_cfg.position_store)
+    return engine
 
 
 def remove_managed_options(config: Configuration) -> OPTIONS_GO_EGTB_TYPE:
@@ -97,6 +178,15 @@ class EngineWrapper:
         self.go_commands = Configuration(cast(GO_COMMANDS_TYPE, options.pop("go_commands", {})) or {})
         self.move_commentary: list[InfoStrDict] = []
         self.comment_start_index = -1
+        self.prefetcher: Optional[prefetch.Prefetcher] = None
+        self.move_sent_at: Optional[float] = None
+        self.base_options: OPTIONS_GO_EGTB_TYPE = {}
+        self.game_options: OPTIONS_TYPE = {}
+        self.current_game_id: Optional[str] = None
+        self.position_store: Optional[PositionStore] = None
+        self.correspondence_depth: Optional[int] = None
+        self.niceness = 0
+        self.pondering = False
 
     def configure(self, options: OPTIONS_GO_EGTB_TYPE, game: Optional[model.Game]) -> None:
         """
@@ -112,6 +202,43 @@ class EngineWrapper:
         except Exception:
             self.engine.close()
             raise
+        self.base_options = options
+        self.game_options = extra_options
+        self.current_game_id = None if game is None else game.id
+
+    def new_game(self, game: model.Game, keep_hash: bool = False) -> None:
+        """
+        Get an engine that has already played a game ready for another one.
+
+        The options from `game_specific_options` are sent for the new game, and the options that were only set for the
+        last game go back to their defaults. Passing the new game's id to the engine's searches makes python-chess send
+        `ucinewgame` (or `new` for XBoard engines) before the first search.
+
+        :param game: The new game.
+        :param keep_hash: Whether to keep searching as if in the last game, so that the engine doesn't clear its hash
+            table. Used when one engine plays single moves in many correspondence games.
+        """
+        extra_options = game_specific_options(game)
+        reset_options = {name: self.engine.options[name].default
+                         for name in self.game_options.keys() - extra_options.keys() if name in self.engine.options}
+        self.engine.configure(cast(OPTIONS_TYPE, reset_options | self.base_options | extra_options))
+        self.game_options = extra_options
+        if not keep_hash:
+            self.current_game_id = game.id
+        self.scores = []
+        self.move_commentary = []
+        self.comment_start_index = -1
+        self.move_sent_at = None
+        self.pondering = False
+        self.set_niceness(0)
+
+    def is_alive(self) -> bool:
+        """Check whether the engine process is running and answers a ping."""
+        try:
+            self.ping()
+        except (chess.engine.EngineError, chess.engine.EngineTerminatedError, TimeoutError):
+            return False
+        return True
 
     def __enter__(self) -> EngineWrapper:  # noqa: PYI034 (return Self not available until 3.11)
         """Enter context so engine communication will be properly shutdown."""
@@ -153,6 +280,11 @@ class EngineWrapper:
         :param min_time: Minimum time to spend, in seconds.
         :return: The move to play.
         """
+        if self.prefetcher:
+            self.prefetcher.cancel()
+        li.warm_move_connection()
+        self.move_sent_at = None
+
         polyglot_cfg = engine_cfg.polyglot
         online_moves_cfg = engine_cfg.online_moves
         draw_or_resign_cfg = engine_cfg.draw_or_resign
@@ -174,7 +306,13 @@ class EngineWrapper:
                                         online_moves_cfg,
                                         draw_or_resign_cfg)
 
-        if isinstance(best_move, list) or best_move.move is None:
+        stored_move = None
+        if is_correspondence and (isinstance(best_move, list) or best_move.move is None):
+            stored_move = self.get_stored_move(board, best_move)
+
+        if stored_move is not None:
+            best_move = stored_move
+        elif isinstance(best_move, list) or best_move.move is None:
             draw_offered = check_for_draw_offer(game)
 
             time_limit, can_ponder = move_time(board, game, can_ponder,
@@ -193,6 +331,9 @@ class EngineWrapper:
                 game_ender(game.id)
                 return
 
+            if is_correspondence:
+                self.store_analysis(board, best_move)
+
         # Heed min_time
         elapsed = setup_timer.time_since_reset()
         if elapsed < min_time:
@@ -203,7 +344,46 @@ class EngineWrapper:
         if best_move.resigned and len(board.move_stack) >= 2:
             li.resign(game.id)
         else:
+            self.move_sent_at = time.perf_counter()
             li.make_move(game.id, best_move)
+            if engine_cfg.prefetch.enabled and not is_correspondence:
+                self.prefetcher = self.prefetcher or create_prefetcher(li, engine_cfg)
+                self.prefetcher.start(board, game, best_move)
+
+    def get_stored_move(self, board: chess.Board, root_moves: MOVE) -> Optional[chess.engine.PlayResult]:
+        """
+        Get the move from the analysis in the position store, if it is deeper than a correspondence search would be.
+
+        The depth of a correspondence search is the depth reached by this engine's last correspondence search, so the
+        first correspondence move of an engine is always searched. A stored move isn't used where repetitions or the
+        fifty-move rule could matter (see `history_matters`).
+
+        :param board: The current position.
+        :param root_moves: If it is a list, the stored move is only used if it is in `root_moves`.
+        :return: The stored move, or `None` if there is no deep enough stored analysis.
+        """
+        if self.position_store is None or self.correspondence_depth is None:
+            return None
+        stored = self.position_store.get(board)
+        if stored is None or stored.depth <= self.correspondence_depth:
+            return None
+        if isinstance(root_moves, list) and stored.move not in root_moves:
+            return None
+        if history_matters(board, stored.move):
+            logger.debug(f"Not using the stored move {stored.move}, since the earlier moves of the game could matter.")
+            return None
+        logger.info(f"Using stored analysis at depth {stored.depth} "
+                    f"(a search reaches about depth {self.correspondence_depth}).")
+        result = stored.play_result()
+        null_score = chess.engine.PovScore(chess.engine.Mate(1), board.turn)
+        self.scores.append(result.info.get("score", null_score))
+        return self.offer_draw_or_resign(result, board)
+
+    def store_analysis(self, board: chess.Board, result: chess.engine.PlayResult) -> None:
+        """Keep the depth of a correspondence search, and save its analysis in the position store."""
+        self.correspondence_depth = result.info.get("depth", self.correspondence_depth)
+        if self.position_store is not None:
+            self.position_store.put(board, result.info)
 
     def add_go_commands(self, time_limit: chess.engine.Limit) -> chess.engine.Limit:
         """Add extra commands to send to the engine. For example, to search for 1000 nodes or up to depth 10."""
@@ -262,10 +442,12 @@ class EngineWrapper:
         time_limit = self.add_go_commands(time_limit)
         result = self.engine.play(board,
                                   time_limit,
+                                  game=self.current_game_id,
                                   info=chess.engine.INFO_ALL,
                                   ponder=ponder,
                                   draw_offered=draw_offered,
                                   root_moves=root_moves if isinstance(root_moves, list) else None)
+        self.pondering = ponder and result.ponder is not None
         # Use null_score to have no effect on draw/resign decisions
         null_score = chess.engine.PovScore(chess.engine.Mate(1), board.turn)
         self.scores.append(result.info.get("score", null_score))
@@ -440,6 +622,33 @@ class EngineWrapper:
         """Ping the engine."""
         self.engine.ping()
 
+    def stop_pondering(self) -> None:
+        """Stop the engine's ponder search, if it is pondering. The engine can't ponder again until its next move."""
+        if self.pondering:
+            self.pondering = False
+            # Any new command stops the ponder search.
+            with contextlib.suppress(chess.engine.EngineError, chess.engine.EngineTerminatedError, TimeoutError):
+                self.ping()
+
+    def set_niceness(self, niceness: int) -> bool:
+        """
+        Set the niceness (OS scheduling priority) of the engine's process.
+
+        :param niceness: The niceness. Higher values mean a lower priority.
+        :return: Whether the niceness was set.
+        """
+        if niceness == self.niceness:
+            return True
+        pid = self.get_pid()
+        if not pid.isdigit() or not hasattr(os, "setpriority"):
+            return False
+        try:
+            os.setpriority(os.PRIO_PROCESS, int(pid), niceness)
+        except OSError:
+            return False
+        self.niceness = niceness
+        return True
+
     def send_game_result(self, game: model.Game, board: chess.Board) -> None:
         """
         Inform engine of the game ending.
@@ -471,6 +680,8 @@ class EngineWrapper:
 
     def quit(self) -> None:
         """Tell the engine to shut down."""
+        if self.prefetcher:
+            self.prefetcher.close()
         self.engine.quit()
 
 
@@ -750,7 +961,7 @@ def get_book_move(board: chess.Board, game: model.Game,
     books = polyglot_cfg.book.lookup(variant)
 
     for book in books:
-        with chess.polyglot.open_reader(book) as reader:
+        with polyglot_reader(book) as reader:
             try:
                 selection = polyglot_cfg.selection
                 min_weight = polyglot_cfg.min_weight
@@ -811,24 +1022,127 @@ def get_online_move(li: lichess.Lichess, board: chess.Board, game: model.Game, o
     if game_moves > max_opening_moves or out_of_online_opening_book_moves[game.id] >= max_out_of_book_moves:
         return chess.engine.PlayResult(None, None)
 
-    chessdb_cfg = online_moves_cfg.chessdb_book
-    lichess_cloud_cfg = online_moves_cfg.lichess_cloud_analysis
-    opening_explorer_cfg = online_moves_cfg.lichess_opening_explorer
-
-    for online_source, cfg in ((get_chessdb_move, chessdb_cfg),
-                               (get_lichess_cloud_move, lichess_cloud_cfg),
-                               (get_opening_explorer_move, opening_explorer_cfg)):
-        best_move, comment = online_source(li, board, game, cfg)
-        if best_move:
-            return chess.engine.PlayResult(chess.Move.from_uci(best_move), None, comment)
+    deadline = game.my_remaining_time() * online_moves_cfg.max_time_fraction
+    best_move, comment = get_online_book_move(li, board, game, online_moves_cfg, deadline)
+    if best_move:
+        return chess.engine.PlayResult(chess.Move.from_uci(best_move), None, comment)
 
     out_of_online_opening_book_moves[game.id] += 1
-    used_opening_books = chessdb_cfg.enabled or lichess_cloud_cfg.enabled or opening_explorer_cfg.enabled
+    used_opening_books = any(online_moves_cfg.lookup(source).enabled for source in online_book_sources)
     if out_of_online_opening_book_moves[game.id] == max_out_of_book_moves and used_opening_books:
         logger.info(f"Will stop using online opening books for game {game.id}.")
     return chess.engine.PlayResult(None, None)
 
 
+def get_online_book_move(li: lichess.Lichess, board: chess.Board, game: model.Game, online_moves_cfg: Configuration,
+                         deadline: datetime.timedelta) -> tuple[Optional[str], chess.engine.InfoDict]:
+    """
+    Ask all enabled online opening books at the same time.
+
+    The answers are taken in the order of `online_moves_cfg.priority`: a source is used as soon as all of the sources
+    before it have answered without a move. When the deadline passes, the best answer so far is used, and the requests
+    that haven't finished are cancelled.
+
+    :param deadline: How long to wait for the online books in total.
+    """
+    enabled_sources = [source for source in online_moves_cfg.priority if online_moves_cfg.lookup(source).enabled]
+    if not enabled_sources:
+        return None, {}
+
+    deadline_timer = Timer(deadline)
+    executor = get_online_book_executor()
+    request_sources = {executor.submit(online_book_sources[source], li, board.copy(), game,
+                                       online_moves_cfg.lookup(source)): source
+                       for source in enabled_sources}
+    answers: dict[str, tuple[Optional[str], chess.engine.InfoDict]] = {}
+    pending: set[Future[tuple[Optional[str], chess.engine.InfoDict]]] = set(request_sources)
+    try:
+        while pending:
+            done, pending = wait(pending, timeout=max(to_seconds(deadline_timer.time_until_expiration()), 0),
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for request in done:
+                answers[request_sources[request]] = online_book_answer(request, request_sources[request], game)
+            for source in enabled_sources:
+                if source not in answers:
+                    break
+                if answers[source][0]:
+                    return answers[source]
+    finally:
+        for request in pending:
+            request.cancel()
+
+    for source in enabled_sources:
+        if source not in answers:
+            logger.info(f"No answer from {source} within {sec_str(deadline)} seconds for game {game.id}.")
+        elif answers[source][0]:
+            return answers[source]
+    return None, {}
+
+
+def online_book_answer(request: Future[tuple[Optional[str], chess.engine.InfoDict]], source: str,
+                       game: model.Game) -> tuple[Optional[str], chess.engine.InfoDict]:
+    """Get the answer of an online opening book. A request that failed counts as an answer without a move."""
+    try:
+        return request.result()
+    except Exception:
+        logger.debug(f"Could not get a move from {source} for game {game.id}.", exc_info=True)
+        return None, {}
+
+
+def get_online_book_executor() -> ThreadPoolExecutor:
+    """Get the threads that ask the online opening books, starting them the first time."""
+    global online_book_executor
+    with online_book_executor_lock:
+        if online_book_executor is None:
+            online_book_executor = ThreadPoolExecutor(max_workers=ONLINE_BOOK_THREADS, thread_name_prefix="online-book")
+        return online_book_executor
+
+
+def create_prefetcher(li: lichess.Lichess, engine_cfg: Configuration) -> prefetch.Prefetcher:
+    """
+    Create a prefetcher that looks up the opponent's likely replies in the sources that `EngineWrapper.play_move` uses.
+
+    The "Got move ..." messages that the sources log while prefetching are hidden.
+
+    :param li: Provides communication with lichess.org and the online move sources.
+    :param engine_cfg: The engine section of the config.
+    """
+    prefetch.quiet_prefetch_threads(logger)
+    explorer_cfg = engine_cfg.online_moves.lichess_opening_explorer
+
+    def explorer_move(board: chess.Board, game: model.Game) -> Optional[str]:
+        return get_opening_explorer_move(li, board, game, explorer_cfg)[0]
+
+    def warm(board: chess.Board, game: model.Game) -> None:
+        warm_move_sources(li, board, game, engine_cfg)
+
+    return prefetch.Prefetcher(engine_cfg.prefetch.max_replies, warm, explorer_move)
+
+
+def warm_move_sources(li: lichess.Lichess, board: chess.Board, game: model.Game, engine_cfg: Configuration) -> None:
+    """Look up a position in the same sources that `EngineWrapper.play_move` uses, so their answers are cached."""
+    tbs_cfg = engine_cfg.lichess_bot_tbs
+    get_syzygy(board.copy(), game, tbs_cfg.syzygy)
+    get_gaviota(board.copy(), game, tbs_cfg.gaviota)
+
+    if not li.online_cache:
+        return
+
+    online_moves_cfg = engine_cfg.online_moves
+    get_online_egtb_move(li, board, game, online_moves_cfg.online_egtb)
+
+    max_opening_moves = online_moves_cfg.max_depth * 2 - 1
+    if (len(board.move_stack) > max_opening_moves
+            or out_of_online_opening_book_moves[game.id] >= online_moves_cfg.max_out_of_book_moves):
+        return
+    for source in online_moves_cfg.priority:
+        source_cfg = online_moves_cfg.lookup(source)
+        if source_cfg.enabled:
+            online_book_sources[source](li, board, game, source_cfg)
+
+
 def get_chessdb_move(li: lichess.Lichess, board: chess.Board, game: model.Game,
                      chessdb_cfg: Configuration) -> tuple[Optional[str], chess.engine.InfoDict]:
     """Get a move from chessdb.cn's opening book."""
@@ -973,6 +1287,14 @@ def get_opening_explorer_move(li: lichess.Lichess, board: chess.Board, game: mod
     return move, comment
 
 
+online_book_sources: dict[str, Callable[[lichess.Lichess, chess.Board, model.Game, Configuration],
+                                        tuple[Optional[str], chess.engine.InfoDict]]] = {
+    "chessdb_book": get_chessdb_move,
+    "lichess_cloud_analysis": get_lichess_cloud_move,
+    "lichess_opening_explorer": get_opening_explorer_move
+}
+
+
 def get_online_egtb_move(li: lichess.Lichess, board: chess.Board, game: model.Game, online_egtb_cfg: Configuration
                          ) -> tuple[Union[str, list[str], None], int, chess.engine.InfoDict]:
     """
@@ -1161,10 +1483,7 @@ def get_syzygy(board: chess.Board, game: model.Game,
     move: Union[chess.Move, list[chess.Move]]
     move_quality = syzygy_cfg.move_quality
 
-    with chess.syzygy.open_tablebase(syzygy_cfg.paths[0]) as tablebase:
-        for path in syzygy_cfg.paths[1:]:
-            tablebase.add_directory(path)
-
+    with syzygy_tablebase(syzygy_cfg.paths) as tablebase:
         try:
             moves = score_syzygy_moves(board, dtz_scorer, tablebase)
 
@@ -1243,10 +1562,7 @@ def get_gaviota(board: chess.Board, game: model.Game,
     # because dtm >= dtz, so if abs(dtm) < 100 => abs(dtz) < 100, so wdl=2/-2.
     min_dtm_to_consider_as_wdl_1 = gaviota_cfg.min_dtm_to_consider_as_wdl_1
 
-    with chess.gaviota.open_tablebase(gaviota_cfg.paths[0]) as tablebase:
-        for path in gaviota_cfg.paths[1:]:
-            tablebase.add_directory(path)
-
+    with gaviota_tablebase(gaviota_cfg.paths) as tablebase:
         try:
             moves = score_gaviota_moves(board, dtm_scorer, tablebase)
 
@@ -1375,11 +1691,15 @@ def score_syzygy_moves(board: chess.Board,
                                      Callable[[chess.syzygy.Tablebase, chess.Board], Union[int, float]]],
                        tablebase: chess.syzygy.Tablebase) -> dict[chess.Move, Union[int, float]]:
     """Score all the moves using syzygy egtbs."""
-    moves = {}
-    for move in board.legal_moves:
-        board.push(move)
-        moves[move] = scorer(tablebase, board)
-        board.pop()
+    key = (f"syzygy:{scorer.__name__}", board.uci_variant or "chess", tablebase_position_key(board))
+    moves = remembered_tablebase_scores(key)
+    if moves is None:
+        moves = {}
+        for move in board.legal_moves:
+            board.push(move)
+            moves[move] = scorer(tablebase, board)
+            board.pop()
+        remember_tablebase_scores(key, moves)
     return moves
 
 
@@ -1389,9 +1709,38 @@ def score_gaviota_moves(board: chess.Board,
                         tablebase: Union[chess.gaviota.NativeTablebase, chess.gaviota.PythonTablebase]
                         ) -> dict[chess.Move, int]:
     """Score all the moves using gaviota egtbs."""
+    key = (f"gaviota:{scorer.__name__}", board.uci_variant or "chess", tablebase_position_key(board))
+    remembered_moves = remembered_tablebase_scores(key)
+    if remembered_moves is not None:
+        return cast(dict[chess.Move, int], remembered_moves)
     moves = {}
     for move in board.legal_moves:
         board.push(move)
         moves[move] = scorer(tablebase, board)
         board.pop()
+    remember_tablebase_scores(key, cast(dict[chess.Move, Union[int, float]], moves))
     return moves
+
+
+def tablebase_position_key(board: chess.Board) -> str:
+    """Get the FEN of a position without the move number, which doesn't change the tablebase scores."""
+    return board.fen().rsplit(" ", 1)[0]
+
+
+def remembered_tablebase_scores(key: tuple[str, str, str]) -> Optional[dict[chess.Move, Union[int, float]]]:
+    """Get the tablebase scores of the moves in a position if it was already probed."""
+    with tablebase_scores_lock:
+        moves = tablebase_scores.get(key)
+        if moves is not None:
+            tablebase_scores.move_to_end(key)
+            return dict(moves)
+        return None
+
+
+def remember_tablebase_scores(key: tuple[str, str, str], moves: dict[chess.Move, Union[int, float]]) -> None:
+    """Store the tablebase scores of the moves in a position. The least recently used positions are forgotten."""
+    with tablebase_scores_lock:
+        tablebase_scores[key] = dict(moves)
+        tablebase_scores.move_to_end(key)
+        while len(tablebase_scores) > MAX_TABLEBASE_SCORES:
+            tablebase_scores.popitem(last=False)
@@ -0,0 +1,752 @@
+"""
+A local stand-in for the lichess.org bot API, for load and soak testing lichess-bot without lichess.org.
+
+Run it with `python -m lib.fake_lichess --games 20 --concurrent 4` and set `url: "http://localhost:8080/"` in the bot's
+config. The server challenges the bot, plays random moves against it, and keeps the event and game streams open like
+lichess.org does. Every endpoint in `lib.lichess.ENDPOINTS` is served.
+"""
+from __future__ import annotations
+import argparse
+import itertools
+import json
+import logging
+import queue
+import random
+import re
+import statistics
+import threading
+import time
+import chess
+import chess.pgn
+from collections.abc import Callable
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional
+from urllib.parse import parse_qs, urlsplit
+from lib.lichess import ENDPOINTS
+
+logger = logging.getLogger(__name__)
+
+JSON_TYPE = dict[str, Any]
+STREAM_TYPE = queue.Queue  # queue.Queue[Optional[JSON_TYPE]]
+
+KEEP_ALIVE_PERIOD = 6  # lichess.org sends an empty line on idle streams every few seconds.
+SPEEDS = ["ultraBullet", "bullet", "blitz", "rapid", "classical"]
+
+
+def game_speed(initial: int, increment: int) -> str:
+    """Get the lichess.org speed of a time control from its estimated duration (initial + 40 * increment)."""
+    duration = initial + 40 * increment
+    for speed, limit in (("ultraBullet", 29), ("bullet", 179), ("blitz", 479), ("rapid", 1499)):
+        if duration <= limit:
+            return speed
+    return "classical"
+
+
+def endpoint_patterns() -> list[tuple[str, re.Pattern[str]]]:
+    """Turn the path templates of `ENDPOINTS` into regular expressions. The longest templates are tried first."""
+    templates = sorted(ENDPOINTS.items(), key=lambda item: len(item[1]), reverse=True)
+    return [(name, re.compile("^" + re.escape(template).replace(r"\{\}", "([^/]+)") + "$"))
+            for name, template in templates]
+
+
+class Scenario:
+    """The settings of a simulation."""
+
+    def __init__(self, username: str = "FakeBot", games: int = 10, concurrent: int = 2, initial: int = 60,
+                 increment: int = 0, challenge_interval: float = 1.0, latency: float = 0.0, latency_jitter: float = 0.0,
+                 opponent_move_time: tuple[float, float] = (0.1, 1.0), max_moves: int = 80,
+                 rate_limit_probability: float = 0.0, online_bots: int = 20, accept_probability: float = 0.8) -> None:
+        """
+        Describe a simulation.
+
+        :param username: The bot's username.
+        :param games: How many challenges to send the bot in total.
+        :param concurrent: How many challenges and games can be in progress at the same time.
+        :param initial: The initial time on the clock in seconds.
+        :param increment: The increment in seconds.
+        :param challenge_interval: How many seconds to wait between challenges.
+        :param latency: How many seconds to wait before answering each request.
+        :param latency_jitter: A random amount of extra latency, up to this many seconds.
+        :param opponent_move_time: The least and most time (in seconds) the opponent takes to move.
+        :param max_moves: The number of moves (by each side) after which the opponent resigns.
+        :param rate_limit_probability: The fraction of requests (except streams and moves) answered with a 429.
+        :param online_bots: The number of bots listed by `/api/bot/online`, for matchmaking.
+        :param accept_probability: The fraction of the bot's own challenges that are accepted.
+        """
+        self.username = username
+        self.games = games
+        self.concurrent = concurrent
+        self.initial = initial
+        self.increment = increment
+        self.challenge_interval = challenge_interval
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.opponent_move_time = opponent_move_time
+        self.max_moves = max_moves
+        self.rate_limit_probability = rate_limit_probability
+        self.online_bots = online_bots
+        self.accept_probability = accept_probability
+
+
+class FakeGame:
+    """A game between the bot and a fake opponent that plays random moves."""
+
+    def __init__(self, server: FakeLichess, game_id: str, opponent: str, bot_is_white: bool, initial: int,
+                 increment: int) -> None:
+        """
+        Start a game.
+
+        :param server: The fake server that the game belongs to.
+        :param game_id: The ID of the game.
+        :param opponent: The username of the opponent.
+        :param bot_is_white: Whether the bot plays white.
+        :param initial: The initial time on the clock in seconds.
+        :param increment: The increment in seconds.
+        """
+        self.server = server
+        self.id = game_id
+        self.opponent = opponent
+        self.bot_is_white = bot_is_white
+        self.board = chess.Board()
+        self.initial = initial * 1000
+        self.increment = increment * 1000
+        self.times = {chess.WHITE: self.initial, chess.BLACK: self.initial}
+        self.turn_started = time.monotonic()
+        self.status = "started"
+        self.winner: Optional[str] = None
+        self.created_at = int(time.time() * 1000)
+        self.streams: list[STREAM_TYPE] = []
+        self.timers: list[threading.Timer] = []
+        self.response_times: list[float] = []
+
+    @property
+    def bot_color(self) -> chess.Color:
+        """The color the bot plays."""
+        return chess.WHITE if self.bot_is_white else chess.BLACK
+
+    @property
+    def speed(self) -> str:
+        """The speed of the game's time control."""
+        return game_speed(self.initial // 1000, self.increment // 1000)
+
+    def player(self, color: chess.Color) -> JSON_TYPE:
+        """Describe a player in the format of `gameFull`."""
+        name = self.server.scenario.username if color == self.bot_color else self.opponent
+        return {"id": name.lower(), "name": name, "title": "BOT", "rating": 1500, "provisional": False}
+
+    def state(self) -> JSON_TYPE:
+        """The `gameState` message for the current position."""
+        state: JSON_TYPE = {"type": "gameState",
+                            "moves": " ".join(move.uci() for move in self.board.move_stack),
+                            "wtime": max(self.current_time(chess.WHITE), 0),
+                            "btime": max(self.current_time(chess.BLACK), 0),
+                            "winc": self.increment,
+                            "binc": self.increment,
+                            "status": self.status}
+        if self.winner:
+            state["winner"] = self.winner
+        return state
+
+    def full(self) -> JSON_TYPE:
+        """The `gameFull` message that starts the game stream."""
+        return {"type": "gameFull",
+                "id": self.id,
+                "rated": False,
+                "variant": {"key": "standard", "name": "Standard", "short": "Std"},
+                "clock": {"initial": self.initial, "increment": self.increment},
+                "speed": self.speed,
+                "perf": {"name": self.speed.capitalize()},
+                "createdAt": self.created_at,
+                "white": self.player(chess.WHITE),
+                "black": self.player(chess.BLACK),
+                "initialFen": "startpos",
+                "state": self.state()}
+
+    def summary(self) -> JSON_TYPE:
+        """The game as listed by `/api/account/playing` and the `gameStart` and `gameFinish` events."""
+        return {"gameId": self.id,
+                "id": self.id,
+                "fullId": self.id + "0000",
+                "color": "white" if self.bot_is_white else "black",
+                "fen": self.board.fen(),
+                "hasMoved": len(self.board.move_stack) > (0 if self.bot_is_white else 1),
+                "isMyTurn": self.board.turn == self.bot_color and self.status == "started",
+                "lastMove": self.board.peek().uci() if self.board.move_stack else "",
+                "opponent": {"id": self.opponent.lower(), "username": self.opponent, "rating": 1500},
+                "perf": self.speed,
+                "rated": False,
+                "secondsLeft": max(self.current_time(self.bot_color), 0) // 1000,
+                "source": "friend",
+                "speed": self.speed,
+                "variant": {"key": "standard", "name": "Standard"},
+                "compat": {"bot": True, "board": True}}
+
+    def clocks_running(self) -> bool:
+        """The clocks start after each side has made a move."""
+        return len(self.board.move_stack) >= 2
+
+    def current_time(self, color: chess.Color) -> int:
+        """The time (in milliseconds) left on a player's clock right now."""
+        if color == self.board.turn and self.clocks_running() and self.status == "started":
+            return self.times[color] - int((time.monotonic() - self.turn_started) * 1000)
+        return self.times[color]
+
+    def start(self) -> None:
+        """Let the opponent move if it plays white."""
+        self.after_move()
+
+    def move(self, uci: str, by_bot: bool) -> bool:
+        """
+        Play a move.
+
+        :param uci: The move.
+        :param by_bot: Whether the bot is making the move (instead of the opponent).
+        :return: Whether the move was played.
+        """
+        with self.server.lock:
+            if self.status != "started" or (self.board.turn == self.bot_color) != by_bot:
+                return False
+            try:
+                move = chess.Move.from_uci(uci)
+            except ValueError:
+                return False
+            if move not in self.board.legal_moves:
+                return False
+
+            now = time.monotonic()
+            mover = self.board.turn
+            if by_bot:
+                self.response_times.append(now - self.turn_started)
+            if self.clocks_running():
+                self.times[mover] -= int((now - self.turn_started) * 1000)
+                if self.times[mover] <= 0:
+                    self.end("outoftime", not mover)
+                    return False
+                self.times[mover] += self.increment
+            self.board.push(move)
+            self.turn_started = now
+
+            outcome = self.board.outcome(claim_draw=True)
+            if outcome:
+                status = "mate" if outcome.termination == chess.Termination.CHECKMATE else "draw"
+                self.end(status, outcome.winner)
+            else:
+                self.publish(self.state())
+                self.after_move()
+            return True
+
+    def after_move(self) -> None:
+        """Start the opponent's move or the bot's flag timer."""
+        if self.board.turn == self.bot_color:
+            if self.clocks_running():
+                self.schedule(self.times[self.bot_color] / 1000 + 0.05, self.flag)
+            return
+
+        if len(self.board.move_stack) >= 2 * self.server.scenario.max_moves:
+            self.schedule(0, lambda: self.resign(by_bot=False))
+            return
+        low, high = self.server.scenario.opponent_move_time
+        think_time = random.uniform(low, high)
+        if self.clocks_running():
+            think_time = min(think_time, self.times[not self.bot_color] / 2000)
+        self.schedule(think_time, self.opponent_move)
+
+    def schedule(self, delay: float, action: Callable[[], Any]) -> None:
+        """Run something after a delay unless the game ends first."""
+        timer = threading.Timer(delay, action)
+        timer.daemon = True
+        self.timers = [t for t in self.timers if t.is_alive()] + [timer]
+        timer.start()
+
+    def opponent_move(self) -> None:
+        """Play a random legal move for the opponent."""
+        with self.server.lock:
+            if self.status != "started":
+                return
+            move = random.choice(list(self.board.legal_moves))
+        self.move(move.uci(), by_bot=False)
+
+    def flag(self) -> None:
+        """End the game if the bot ran out of time."""
+        with self.server.lock:
+            if self.status == "started" and self.board.turn == self.bot_color and self.current_time(self.bot_color) <= 0:
+                self.end("outoftime", not self.bot_color)
+
+    def resign(self, by_bot: bool) -> bool:
+        """End the game by resignation."""
+        with self.server.lock:
+            if self.status != "started":
+                return False
+            loser = self.bot_color if by_bot else not self.bot_color
+            self.end("resign", not loser)
+            return True
+
+    def abort(self) -> bool:
+        """Abort the game if neither side has moved twice."""
+        with self.server.lock:
+            if self.status != "started" or len(self.board.move_stack) >= 2:
+                return False
+            self.end("aborted", None)
+            return True
+
+    def end(self, status: str, winner: Optional[chess.Color]) -> None:
+        """End the game and tell everyone. The server lock must be held."""
+        self.times[self.board.turn] = self.current_time(self.board.turn)
+        self.status = status
+        self.winner = None if winner is None else ("white" if winner == chess.WHITE else "black")
+        for timer in self.timers:
+            timer.cancel()
+        self.publish(self.state())
+        for stream in self.streams:
+            stream.put_nowait(None)
+        self.streams.clear()
+        self.server.game_over(self)
+
+    def publish(self, message: JSON_TYPE) -> None:
+        """Send a message to every open game stream."""
+        for stream in self.streams:
+            stream.put_nowait(message)
+
+    def pgn(self) -> str:
+        """The PGN of the game."""
+        game = chess.pgn.Game.from_board(self.board)
+        game.headers["Event"] = "Fake lichess game"
+        game.headers["Site"] = self.id
+        game.headers["White"] = self.player(chess.WHITE)["name"]
+        game.headers["Black"] = self.player(chess.BLACK)["name"]
+        return str(game) + "\n\n"
+
+
+class FakeLichess:
+    """The state of the fake server: the bot's games and challenges, and the open event streams."""
+
+    def __init__(self, scenario: Scenario) -> None:
+        """:param scenario: The settings of the simulation."""
+        self.scenario = scenario
+        self.lock = threading.RLock()
+        self.ids = (f"{n:08d}" for n in itertools.count(1))
+        self.event_streams: list[STREAM_TYPE] = []
+        self.games: dict[str, FakeGame] = {}
+        self.finished_games: dict[str, FakeGame] = {}
+        self.challenges: dict[str, JSON_TYPE] = {}
+        self.challenges_sent = 0
+        self.rate_limited = 0
+        self.requests: dict[str, int] = dict.fromkeys(ENDPOINTS, 0)
+        self.bots = [f"FakeOpponent{n}" for n in range(1, scenario.online_bots + 1)]
+        self.stop = threading.Event()
+
+    def challenger_loop(self) -> None:
+        """Challenge the bot until `scenario.games` challenges are sent, keeping `scenario.concurrent` in progress."""
+        while not self.stop.wait(self.scenario.challenge_interval) and self.challenges_sent < self.scenario.games:
+            with self.lock:
+                if len(self.games) + len(self.challenges) < self.scenario.concurrent:
+                    self.challenges_sent += 1
+                    challenge = self.new_challenge(random.choice(self.bots), self.scenario.username,
+                                                   self.scenario.initial, self.scenario.increment)
+                    self.publish_event({"type": "challenge", "challenge": challenge})
+
+    def new_challenge(self, challenger: str, dest: str, initial: int, increment: int) -> JSON_TYPE:
+        """Create a challenge."""
+        challenge_id = next(self.ids)
+        speed = game_speed(initial, increment)
+        challenge = {"id": challenge_id,
+                     "url": f"http://localhost/{challenge_id}",
+                     "status": "created",
+                     "challenger": {"id": challenger.lower(), "name": challenger, "title": "BOT", "rating": 1500},
+                     "destUser": {"id": dest.lower(), "name": dest, "title": "BOT", "rating": 1500},
+                     "variant": {"key": "standard", "name": "Standard", "short": "Std"},
+                     "rated": False,
+                     "speed": speed,
+                     "timeControl": {"type": "clock", "limit": initial, "increment": increment,
+                                     "show": f"{initial // 60}+{increment}"},
+                     "color": "random",
+                     "finalColor": random.choice(["white", "black"]),
+                     "perf": {"icon": "", "name": speed.capitalize()},
+                     "compat": {"bot": True, "board": True}}
+        self.challenges[challenge_id] = challenge
+        return challenge
+
+    def start_game(self, challenge: JSON_TYPE) -> FakeGame:
+        """Start the game of an accepted challenge. The server lock must be held."""
+        self.challenges.pop(challenge["id"], None)
+        bot_is_challenger = challenge["challenger"]["name"] == self.scenario.username
+        opponent = challenge["destUser"]["name"] if bot_is_challenger else challenge["challenger"]["name"]
+        challenger_is_white = challenge["finalColor"] == "white"
+        game = FakeGame(self, challenge["id"], opponent, challenger_is_white == bot_is_challenger,
+                        challenge["timeControl"]["limit"], challenge["timeControl"]["increment"])
+        self.games[game.id] = game
+        self.publish_event({"type": "gameStart", "game": game.summary()})
+        game.start()
+        return game
+
+    def game_over(self, game: FakeGame) -> None:
+        """Move a game to the finished games and send `gameFinish`. The server lock must be held."""
+        self.games.pop(game.id, None)
+        self.finished_games[game.id] = game
+        self.publish_event({"type": "gameFinish", "game": game.summary()})
+        logger.info(f"Game {game.id} ended: {game.status} after {len(game.board.move_stack)} plies.")
+
+    def publish_event(self, event: JSON_TYPE) -> None:
+        """Send an event to every open event stream."""
+        for stream in self.event_streams:
+            stream.put_nowait(event)
+
+    def find_game(self, game_id: str) -> Optional[FakeGame]:
+        """Find an ongoing or finished game."""
+        return self.games.get(game_id) or self.finished_games.get(game_id)
+
+    def report(self) -> str:
+        """Summarize the simulation."""
+        games = list(self.finished_games.values()) + list(self.games.values())
+        response_times = [t for game in games for t in game.response_times]
+        lines = [f"Challenges sent: {self.challenges_sent}. Games finished: {len(self.finished_games)}. "
+                 f"Games in progress: {len(self.games)}. Requests answered with 429: {self.rate_limited}."]
+        if response_times:
+            lines.append(f"Bot response time per move: median {statistics.median(response_times):0.3f} s, "
+                         f"max {max(response_times):0.3f} s over {len(response_times)} moves.")
+        lines.append("Requests: " + ", ".join(f"{name}={count}" for name, count in self.requests.items() if count))
+        return "\n".join(lines)
+
+
+class FakeLichessHandler(BaseHTTPRequestHandler):
+    """Answer the requests of lichess-bot."""
+
+    protocol_version = "HTTP/1.1"
+    server: FakeLichessServer
+    patterns = endpoint_patterns()
+
+    @property
+    def lichess(self) -> FakeLichess:
+        """The state of the fake server."""
+        return self.server.lichess
+
+    def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+        """Log requests at the debug level instead of printing them."""
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    def do_GET(self) -> None:
+        """Handle a GET request."""
+        self.route()
+
+    def do_POST(self) -> None:
+        """Handle a POST request."""
+        self.route()
+
+    def do_HEAD(self) -> None:
+        """Answer the connection checks of the move sender."""
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def route(self) -> None:
+        """Find the endpoint of the request and call its handler."""
+        url = urlsplit(self.path)
+        self.query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        self.body = self.rfile.read(length).decode("utf-8") if length else ""
+        for name, pattern in self.patterns:
+            match = pattern.match(url.path)
+            if match and hasattr(self, f"{self.command.lower()}_{name}"):
+                self.lichess.requests[name] += 1
+                self.delay()
+                if name not in ("stream", "stream_event", "move") and self.should_rate_limit():
+                    self.send_json({"error": "Too many requests. Try again later."}, 429)
+                    return
+                getattr(self, f"{self.command.lower()}_{name}")(*match.groups())
+                return
+        self.send_json({"error": "Not found."}, 404)
+
+    def delay(self) -> None:
+        """Wait as long as the scenario's latency."""
+        scenario = self.lichess.scenario
+        latency = scenario.latency + random.uniform(0, scenario.latency_jitter)
+        if latency > 0:
+            time.sleep(latency)
+
+    def should_rate_limit(self) -> bool:
+        """Decide whether to answer this request with a 429."""
+        if random.random() < self.lichess.scenario.rate_limit_probability:
+            self.lichess.rate_limited += 1
+            return True
+        return False
+
+    def send_json(self, data: Any, status: int = 200) -> None:
+        """Send a JSON response."""
+        self.send_body(json.dumps(data).encode("utf-8"), "application/json", status)
+
+    def send_body(self, body: bytes, content_type: str, status: int = 200) -> None:
+        """Send a response with a body of known length."""
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def ok(self, success: bool = True) -> None:
+        """Send the response of a POST that succeeded or failed."""
+        if success:
+            self.send_json({"ok": True})
+        else:
+            self.send_json({"error": "Not your turn, or game already over"}, 400)
+
+    def stream(self, messages: STREAM_TYPE, first_messages: list[JSON_TYPE], on_close: Callable[[], None]) -> None:
+        """
+        Send an NDJSON stream with chunked transfer encoding until a `None` is received or the client disconnects.
+
+        :param messages: The queue of messages to send.
+        :param first_messages: The messages sent as soon as the stream opens.
+        :param on_close: Called when the stream ends.
+        """
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for message in first_messages:
+                self.send_chunk(json.dumps(message).encode("utf-8") + b"\n")
+            while not self.lichess.stop.is_set():
+                try:
+                    message = messages.get(timeout=KEEP_ALIVE_PERIOD)
+                except queue.Empty:
+                    self.send_chunk(b"\n")
+                    continue
+                if message is None:
+                    break
+                self.send_chunk(json.dumps(message).encode("utf-8") + b"\n")
+            self.send_chunk(b"")
+        except OSError:
+            pass
+        finally:
+            on_close()
+            self.close_connection = True
+
+    def send_chunk(self, data: bytes) -> None:
+        """Send a chunk of a chunked response. An empty chunk ends the response."""
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def get_stream_event(self) -> None:
+        """Stream the events. Like lichess.org, start with the ongoing games and open challenges."""
+        messages: STREAM_TYPE = queue.Queue()
+        with self.lichess.lock:
+            first_messages = ([{"type": "gameStart", "game": game.summary()} for game in self.lichess.games.values()]
+                              + [{"type": "challenge", "challenge": challenge}
+                                 for challenge in self.lichess.challenges.values()
+                                 if challenge["destUser"]["name"] == self.lichess.scenario.username])
+            self.lichess.event_streams.append(messages)
+        self.stream(messages, first_messages, lambda: self.lichess.event_streams.remove(messages))
+
+    def get_stream(self, game_id: str) -> None:
+        """Stream a game, starting with `gameFull`."""
+        messages: STREAM_TYPE = queue.Queue()
+        with self.lichess.lock:
+            game = self.lichess.find_game(game_id)
+            if game is None:
+                self.send_json({"error": "No such game"}, 404)
+                return
+            first_messages = [game.full()]
+            if game.status == "started":
+                game.streams.append(messages)
+            else:
+                messages.put_nowait(None)
+
+        def close() -> None:
+            with self.lichess.lock:
+                if messages in game.streams:
+                    game.streams.remove(messages)
+        self.stream(messages, first_messages, close)
+
+    def post_token_test(self) -> None:
+        """Say that the token can play as a bot."""
+        self.send_json({self.body: {"scopes": "bot:play,challenge:read,challenge:write",
+                                    "userId": self.lichess.scenario.username.lower(),
+                                    "expires": None}})
+
+    def profile(self, username: str) -> JSON_TYPE:
+        """The public profile of a bot."""
+        perfs = {speed: {"games": 100, "rating": 1500, "rd": 60, "prog": 0, "prov": False} for speed in SPEEDS}
+        return {"id": username.lower(), "username": username, "title": "BOT", "perfs": perfs, "blocking": False}
+
+    def get_profile(self) -> None:
+        """Send the bot's profile."""
+        self.send_json(self.profile(self.lichess.scenario.username))
+
+    def get_playing(self) -> None:
+        """List the bot's ongoing games."""
+        with self.lichess.lock:
+            self.send_json({"nowPlaying": [game.summary() for game in self.lichess.games.values()]})
+
+    def post_move(self, game_id: str, move: str) -> None:
+        """Play the bot's move."""
+        game = self.lichess.games.get(game_id)
+        self.ok(game is not None and game.move(move, by_bot=True))
+
+    def post_takeback(self, game_id: str, answer: str) -> None:  # noqa: ARG002
+        """Answer a takeback request. The fake opponent never asks for one."""
+        self.ok(game_id in self.lichess.games)
+
+    def post_chat(self, game_id: str) -> None:
+        """Accept a chat message."""
+        self.ok(self.lichess.find_game(game_id) is not None)
+
+    def post_abort(self, game_id: str) -> None:
+        """Abort a game."""
+        game = self.lichess.games.get(game_id)
+        self.ok(game is not None and game.abort())
+
+    def post_resign(self, game_id: str) -> None:
+        """Resign a game for the bot."""
+        game = self.lichess.games.get(game_id)
+        self.ok(game is not None and game.resign(by_bot=True))
+
+    def post_accept(self, challenge_id: str) -> None:
+        """Accept a challenge and start its game."""
+        with self.lichess.lock:
+            challenge = self.lichess.challenges.get(challenge_id)
+            if challenge is None:
+                self.send_json({"error": "Challenge not found"}, 404)
+                return
+            self.lichess.start_game(challenge)
+        self.ok()
+
+    def post_decline(self, challenge_id: str) -> None:
+        """Decline a challenge."""
+        with self.lichess.lock:
+            challenge = self.lichess.challenges.pop(challenge_id, None)
+        if challenge is None:
+            self.send_json({"error": "Challenge not found"}, 404)
+        else:
+            self.ok()
+
+    def post_upgrade(self) -> None:
+        """The bot is already a bot account."""
+        self.ok()
+
+    def get_export(self, game_id: str) -> None:
+        """Send the PGN of a game."""
+        game = self.lichess.find_game(game_id)
+        if game is None:
+            self.send_json({"error": "No such game"}, 404)
+        else:
+            self.send_body(game.pgn().encode("utf-8"), "application/x-chess-pgn")
+
+    def get_online_bots(self) -> None:
+        """List the fake opponents as online bots."""
+        lines = [json.dumps(self.profile(bot)) for bot in self.lichess.bots]
+        self.send_body(("\n".join(lines) + "\n").encode("utf-8"), "application/x-ndjson")
+
+    def post_challenge(self, username: str) -> None:
+        """Create the bot's challenge. The opponent accepts or declines it after a short while."""
+        payload = json.loads(self.body or "{}")
+        with self.lichess.lock:
+            challenge = self.lichess.new_challenge(self.lichess.scenario.username, username,
+                                                   int(payload.get("clock.limit") or self.lichess.scenario.initial),
+                                                   int(payload.get("clock.increment") or 0))
+
+        def answer() -> None:
+            with self.lichess.lock:
+                if challenge["id"] not in self.lichess.challenges:
+                    return
+                if random.random() < self.lichess.scenario.accept_probability:
+                    self.lichess.start_game(challenge)
+                else:
+                    self.lichess.challenges.pop(challenge["id"])
+                    declined = dict(challenge, status="declined", declineReason="I'm not accepting challenges "
+                                    "at the moment.", declineReasonKey="generic")
+                    self.lichess.publish_event({"type": "challengeDeclined", "challenge": declined})
+
+        timer = threading.Timer(random.uniform(0.5, 2.0), answer)
+        timer.daemon = True
+        timer.start()
+        self.send_json(challenge)
+
+    def post_cancel(self, challenge_id: str) -> None:
+        """Cancel the bot's challenge."""
+        with self.lichess.lock:
+            self.lichess.challenges.pop(challenge_id, None)
+        self.ok()
+
+    def get_status(self) -> None:
+        """Say that every user asked about is online."""
+        ids = [user_id for user_id in self.query.get("ids", "").split(",") if user_id]
+        self.send_json([{"id": user_id.lower(), "name": user_id, "online": True} for user_id in ids])
+
+    def get_public_data(self, username: str) -> None:
+        """Send the public profile of a user."""
+        self.send_json(self.profile(username))
+
+
+class FakeLichessServer(ThreadingHTTPServer):
+    """An HTTP server that holds the state of the fake lichess.org."""
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], lichess: FakeLichess) -> None:
+        """
+        Start listening.
+
+        :param address: The host and port to listen on.
+        :param lichess: The state of the fake server.
+        """
+        super().__init__(address, FakeLichessHandler)
+        self.lichess = lichess
+
+
+def run(scenario: Scenario, host: str = "localhost", port: int = 8080) -> FakeLichessServer:
+    """
+    Start the fake server and its challenges in background threads.
+
+    :param scenario: The settings of the simulation.
+    :param host: The host to listen on.
+    :param port: The port to listen on.
+    :return: The server. Call `shutdown()` and set `server.lichess.stop` to stop it.
+    """
+    server = FakeLichessServer((host, port), FakeLichess(scenario))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    threading.Thread(target=server.lichess.challenger_loop, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    """Run the fake server until Ctrl-C is pressed, then print a summary."""
+    parser = argparse.ArgumentParser(description="A local stand-in for lichess.org for load testing lichess-bot.")
+    parser.add_argument("--host", default="localhost", help="The host to listen on.")
+    parser.add_argument("--port", type=int, default=8080, help="The port to listen on.")
+    parser.add_argument("--username", default="FakeBot", help="The bot's username.")
+    parser.add_argument("--games", type=int, default=10, help="How many challenges to send the bot.")
+    parser.add_argument("--concurrent", type=int, default=2, help="How many games can be in progress at once.")
+    parser.add_argument("--initial", type=int, default=60, help="The initial clock time in seconds.")
+    parser.add_argument("--increment", type=int, default=0, help="The increment in seconds.")
+    parser.add_argument("--challenge-interval", type=float, default=1.0, help="Seconds between challenges.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before answering each request.")
+    parser.add_argument("--latency-jitter", type=float, default=0.0, help="Random extra latency in seconds.")
+    parser.add_argument("--opponent-move-time", type=float, nargs=2, default=[0.1, 1.0], metavar=("MIN", "MAX"),
+                        help="The least and most seconds the opponent takes to move.")
+    parser.add_argument("--max-moves", type=int, default=80, help="The opponent resigns after this many moves.")
+    parser.add_argument("--rate-limit-probability", type=float, default=0.0,
+                        help="The fraction of requests answered with a 429.")
+    parser.add_argument("--online-bots", type=int, default=20, help="The number of bots listed for matchmaking.")
+    parser.add_argument("--accept-probability", type=float, default=0.8,
+                        help="The fraction of the bot's challenges that are accepted.")
+    parser.add_argument("-v", action="store_true", help="Log every request.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.v else logging.INFO, format="%(asctime)s %(message)s")
+    scenario = Scenario(args.username, args.games, args.concurrent, args.initial, args.increment,
+                        args.challenge_interval, args.latency, args.latency_jitter, tuple(args.opponent_move_time),
+                        args.max_moves, args.rate_limit_probability, args.online_bots, args.accept_probability)
+    server = run(scenario, args.host, args.port)
+    logger.info(f"Fake lichess.org listening on http://{args.host}:{args.port}/")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.lichess.stop.set()
+        server.shutdown()
+        logger.info(server.lichess.report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""Play many games in one process by reading all of their game streams with a single asyncio event loop."""
+from __future__ import annotations
+import asyncio
+import contextlib
+import json
+import logging
+import multiprocessing
+import backoff
+from collections.abc import AsyncIterator, Callable, Coroutine
+from concurrent.futures import ThreadPoolExecutor
+from http.client import RemoteDisconnected
+from requests.exceptions import ChunkedEncodingError, ConnectionError as RequestsConnectionError, HTTPError, ReadTimeout
+from typing import Any, Optional, TypeVar, Union, cast
+import chess.engine
+from lib import engine_pool, lichess, lichess_bot, model, ndjson
+from lib.async_lichess import AsyncLichess, AsyncResponse
+from lib.lichess_types import OnlineType
+from lib.timer import seconds
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+GAME_QUEUE_TYPE = multiprocessing.Queue  # multiprocessing.Queue[Optional[str]]
+
+
+class GameHostPool:
+    """
+    Run games in a single game host process instead of a process per game.
+
+    This has the parts of the `multiprocessing.pool.Pool` interface used by `lichess_bot.lichess_bot_main`, so the two
+    can be swapped with the `game_runner` config option.
+    """
+
+    def __init__(self, play_game_args: lichess_bot.PlayGameArgsType, max_games: int) -> None:
+        """
+        Start the game host process.
+
+        :param play_game_args: The args passed to `play_game` (except for `game_id`).
+        :param max_games: The maximum number of games played at the same time.
+        """
+        self.host_args = lichess_bot.PlayGameArgsType(**{key: value for key, value in play_game_args.items()
+                                                         if key != "game_id"})
+        self.max_games = max_games
+        # The games sent to the game host that may still be playing.
+        self.games: set[str] = set()
+        self.start()
+
+    def start(self) -> None:
+        """Start the game host process with a new game queue."""
+        self.game_queue: GAME_QUEUE_TYPE = multiprocessing.Queue()
+        self.host = multiprocessing.Process(target=run_game_host, args=(self.game_queue, self.host_args, self.max_games))
+        self.host.start()
+
+    def start_game(self, game_id: str) -> None:
+        """Send a game to the game host."""
+        self.games.add(game_id)
+        self.game_queue.put_nowait(game_id)
+
+    def restart_if_dead(self, active_games: set[str]) -> list[str]:
+        """
+        Start the game host again if its process died (e.g. it was killed for using too much memory).
+
+        :param active_games: The games that are being played. Other games sent to the game host are over.
+        :return: The games that were being played by the game host that died. They need to be started again.
+        """
+        self.games.intersection_update(active_games)
+        if self.host.is_alive():
+            return []
+        lost_games = list(self.games)
+        logger.error(f"The game host stopped unexpectedly with exit code {self.host.exitcode}. Restarting it and "
+                     f"{len(lost_games)} game(s): {lost_games or None}")
+        self.host.join()
+        self.games.clear()
+        self.start()
+        return lost_games
+
+    def close(self) -> None:
+        """Tell the game host to exit once all of its games are over."""
+        self.game_queue.put_nowait(None)
+
+    def join(self) -> None:
+        """Wait for the game host to exit."""
+        self.host.join()
+
+    def terminate(self) -> None:
+        """Stop the game host and all of its games immediately."""
+        self.host.terminate()
+        self.host.join()
+
+    def __enter__(self) -> GameHostPool:  # noqa: PYI034 (return Self not available until 3.11)
+        """Enter context like `multiprocessing.pool.Pool`."""
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        """Stop the game host when exiting the context, like `multiprocessing.pool.Pool`."""
+        self.terminate()
+
+
+def run_game_host(game_queue: GAME_QUEUE_TYPE, play_game_args: lichess_bot.PlayGameArgsType, max_games: int) -> None:
+    """
+    Play every game sent through the game queue until a `None` is received.
+
+    :param game_queue: The queue with the IDs of the games to play.
+    :param play_game_args: The args passed to `play_game` (except for `game_id`).
+    :param max_games: The maximum number of games played at the same time.
+    """
+    lichess_bot.thread_logging_configurer(play_game_args["logging_queue"], play_game_args["logging_level"])
+    config = play_game_args["config"]
+    pool = engine_pool.get_engine_pool(config, max_games)
+    if config.engine.pool.enabled and config.engine.pool.prelaunch:
+        try:
+            pool.prelaunch(max_games)
+        except Exception:
+            logger.exception("Could not start the engines ahead of time. They will be started when games begin.")
+    asyncio.run(GameHost(play_game_args, max_games).run(game_queue))
+
+
+async def chain_lines(first_line: bytes, lines: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Put a line in front of the rest of a stream."""
+    yield first_line
+    async for line in lines:
+        yield line
+
+
+class HostedLichess:
+    """
+    The `lib.lichess.Lichess` used by the games of the game host.
+
+    Requests of the games (moves, chat messages, aborts, resignations, PGN records, online moves) are sent by the
+    game host's `AsyncLichess` on the event loop, so the game threads only wait for the answers. Everything else is taken
+    from the `lib.lichess.Lichess` of the main process. These methods must not be called from the event loop itself.
+    """
+
+    def __init__(self, li: lichess.Lichess, async_li: AsyncLichess, loop: asyncio.AbstractEventLoop) -> None:
+        """
+        Send the requests of the games with `async_li` on `loop`.
+
+        :param li: Communication with lichess.org that is used for everything other than requests.
+        :param async_li: Sends the requests.
+        :param loop: The event loop of the game host.
+        """
+        self.li = li
+        self.async_li = async_li
+        self.loop = loop
+
+    def __getattr__(self, name: str) -> Any:
+        """Use the `lib.lichess.Lichess` of the main process for everything that isn't a request."""
+        return getattr(self.li, name)
+
+    def run(self, coroutine: Coroutine[Any, Any, T]) -> T:
+        """Run a request on the event loop and wait for it to finish."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def make_move(self, game_id: str, move: chess.engine.PlayResult) -> None:
+        """Make a move."""
+        self.run(self.async_li.make_move(game_id, move))
+
+    def warm_move_connection(self) -> None:
+        """Do nothing. Moves are sent over the connections of the game host's session, which aren't checked ahead."""
+
+    def accept_takeback(self, game_id: str, accept: bool) -> bool:
+        """Answer an opponent's move takeback request."""
+        return self.run(self.async_li.accept_takeback(game_id, accept))
+
+    def chat(self, game_id: str, room: str, text: str) -> None:
+        """Send a message to the chat."""
+        self.run(self.async_li.chat(game_id, room, text))
+
+    def abort(self, game_id: str) -> None:
+        """Abort a game."""
+        self.run(self.async_li.abort(game_id))
+
+    def resign(self, game_id: str) -> None:
+        """Resign a game."""
+        self.run(self.async_li.resign(game_id))
+
+    def get_game_pgn(self, game_id: str) -> str:
+        """Get the PGN (Portable Game Notation) record of a game."""
+        return self.run(self.async_li.get_game_pgn(game_id))
+
+    def online_book_get(self, path: str, params: Optional[dict[str, Union[str, int]]] = None,
+                        stream: bool = False) -> OnlineType:
+        """Get an external move from online sources (chessdb or lichess.org)."""
+        return self.run(self.async_li.online_book_get(path, params, stream))
+
+
+class GameHost:
+    """
+    Read the game streams of all games in one event loop and pass each update to the `lichess_bot.GameHandler` of its game.
+
+    Engines are still separate processes. Engine searches run in a thread, one at a time for each game, so that a long
+    search doesn't delay the updates of other games. The requests of the games are sent by the event loop
+    (see `HostedLichess`).
+    """
+
+    def __init__(self, play_game_args: lichess_bot.PlayGameArgsType, max_games: int) -> None:
+        """
+        Get ready to host games.
+
+        :param play_game_args: The args passed to `play_game` (except for `game_id`).
+        :param max_games: The maximum number of games played at the same time.
+        """
+        self.li = play_game_args["li"]
+        self.config = play_game_args["config"]
+        self.user_profile = play_game_args["user_profile"]
+        self.control_queue = play_game_args["control_queue"]
+        self.challenge_snapshot = play_game_args["challenge_snapshot"]
+        self.pgn_queue = play_game_args["pgn_queue"]
+        self.ongoing_games = play_game_args["ongoing_games"]
+        self.cpu_snapshot = play_game_args["cpu_snapshot"]
+        self.executor = ThreadPoolExecutor(max_workers=max(max_games, 1), thread_name_prefix="game")
+        self.async_li = AsyncLichess(self.config.token, self.li.baseUrl, self.li.version, self.li.logging_level,
+                                     self.li.max_retries, self.li.online_cache)
+        self.async_li.set_user_agent(self.user_profile["username"])
+        self.async_li.token_buckets = self.li.token_buckets
+        self.async_li.move_sender = self.li.move_sender
+
+    async def run(self, game_queue: GAME_QUEUE_TYPE) -> None:
+        """Start a task for each game from the game queue. Wait for all games to end after a `None` is received."""
+        loop = asyncio.get_running_loop()
+        self.li = cast(lichess.Lichess, HostedLichess(self.li, self.async_li, loop))
+        games: set[asyncio.Task[None]] = set()
+        try:
+            while (game_id := await loop.run_in_executor(None, game_queue.get)) is not None:
+                game = asyncio.create_task(self.host_game(game_id))
+                games.add(game)
+                game.add_done_callback(games.discard)
+
+            if games:
+                await asyncio.wait(games)
+        finally:
+            self.async_li.close()
+            self.executor.shutdown(wait=False)
+
+    async def in_thread(self, function: Callable[..., T], *args: Any) -> T:
+        """Run a blocking function in one of the game threads."""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    async def host_game(self, game_id: str) -> None:
+        """Play a game and report to the main process if it ended due to an error."""
+        try:
+            await self.play_game(game_id)
+        except Exception as error:
+            await self.in_thread(lichess_bot.end_game_after_error, error, game_id, self.li, self.control_queue,
+                                 self.pgn_queue, self.ongoing_games)
+
+    async def reopen_game_stream(self, game: model.Game) -> tuple[AsyncResponse, AsyncIterator[bytes]]:
+        """Open the stream of a game again after it failed. This does the same as `lichess_bot.reopen_game_stream`."""
+        logger.info(f"Reconnecting to the stream of game {game.id}")
+        response = await self.async_li.get_game_stream(game.id)
+        lines = ndjson.aiter_lines(response.iter_chunks())
+        game_full = ndjson.decode(await lines.__anext__())
+        return response, chain_lines(json.dumps(game_full["state"]).encode("utf-8"), lines)
+
+    @backoff.on_exception(backoff.expo, Exception, max_time=600, giveup=lichess.is_final,  # type: ignore[arg-type]
+                          on_backoff=lichess.backoff_handler)
+    async def play_game(self, game_id: str) -> None:
+        """Play a game. This does the same as `lichess_bot.play_game` without blocking the other games."""
+        response = await self.async_li.get_game_stream(game_id)
+        lines = ndjson.aiter_lines(response.iter_chunks())
+        engine_stack = contextlib.ExitStack()
+        try:
+            # Initial response of stream will be the full game info. Store it.
+            initial_state = ndjson.decode(await lines.__anext__())
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Initial state: {initial_state}")
+            game = model.Game(initial_state, self.user_profile["username"], self.li.baseUrl,
+                              seconds(self.config.abort_time))
+
+            engine = await self.in_thread(lambda: engine_stack.enter_context(engine_pool.lease_engine(self.config, game)))
+            handler = await self.in_thread(lichess_bot.GameHandler, self.li, game, engine, self.config,
+                                           self.challenge_snapshot, self.ongoing_games, self.control_queue,
+                                           self.cpu_snapshot)
+            game_stream = chain_lines(json.dumps(game.state).encode("utf-8"), lines)
+            while handler.keep_playing():
+                try:
+                    upd = lichess_bot.parse_update(await game_stream.__anext__())
+                    await self.in_thread(handler.handle_update, upd)
+                except (HTTPError, ReadTimeout, RemoteDisconnected, ChunkedEncodingError, RequestsConnectionError,
+                        StopAsyncIteration) as e:
+                    stopped = isinstance(e, StopAsyncIteration)
+                    await self.in_thread(handler.handle_stream_error, stopped)
+                    if not stopped and handler.keep_playing():
+                        await response.aclose()
+                        response, game_stream = await self.reopen_game_stream(game)
+
+            pgn_record = await self.in_thread(lichess_bot.try_get_pgn_game_record, self.li, self.config, game,
+                                              handler.board, engine)
+        finally:
+            await response.aclose()
+            await self.in_thread(engine_stack.close)
+
+        lichess_bot.log_move_latency_stats(self.li, game)
+        await self.in_thread(lichess_bot.final_queue_entries, self.control_queue, game, handler.board,
+                             handler.is_correspondence, pgn_record, self.pgn_queue)
+        lichess_bot.delete_takeback_record(game)
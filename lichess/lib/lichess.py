@@ -2,19 +2,28 @@
 import json
 import requests
 from urllib.parse import urljoin
+from requests.adapters import BaseAdapter
 from requests.exceptions import ConnectionError as RequestsConnectionError, HTTPError, ReadTimeout
 from http.client import RemoteDisconnected
 import backoff
 import logging
+import multiprocessing
+import threading
+import time
 import traceback
 from collections import defaultdict
 import datetime
 import contextlib
+from lib import recording
 from lib.timer import Timer, seconds, sec_str
-from typing import Optional, Union, cast
+from lib.online_cache import OnlineCache, has_move
+from lib.move_sender import MoveSender
+from lib.move_overhead import ClockLagTracker
+from typing import Any, Generic, Optional, Union, Protocol, TypeVar, cast
 import chess.engine
 from lib.lichess_types import (UserProfileType, REQUESTS_PAYLOAD_TYPE, GameType, PublicDataType, OnlineType,
-                       ChallengeType, TOKEN_TESTS_TYPE, BackoffDetails)
+                       ChallengeType, TOKEN_TESTS_TYPE, BackoffDetails, RateLimitStatsType,
+                               MoveLatencyStatsType)
 
 
 ENDPOINTS = {
@@ -40,9 +49,49 @@ ENDPOINTS = {
 }
 
 
+# Token bucket sizes and refill rates (requests per second) that keep each endpoint below lichess.org's limits.
+# Endpoints that aren't listed (game streams, moves, token test) aren't paced.
+ENDPOINT_RATES: dict[str, tuple[int, float]] = {
+    "profile": (5, 1 / 2),
+    "playing": (10, 1),
+    "takeback": (5, 1 / 2),
+    "chat": (4, 1 / 3),
+    "abort": (5, 1 / 2),
+    "accept": (5, 1 / 2),
+    "decline": (5, 1 / 2),
+    "upgrade": (1, 1 / 60),
+    "resign": (5, 1 / 2),
+    "export": (5, 1 / 2),
+    "online_bots": (2, 1 / 10),
+    "challenge": (3, 1 / 6),
+    "cancel": (3, 1 / 3),
+    "status": (5, 1 / 2),
+    "public_data": (5, 1 / 2)
+}
+
+# Endpoints that are called right before a move (greetings in the chat) or from the main loop, where waiting for a token
+# would hold up games. When their bucket is empty, `RateLimitedError` is raised instead, and the caller drops the request
+# or tries again later.
+NO_WAIT_ENDPOINTS = {"chat", "decline", "accept", "challenge", "online_bots", "status", "public_data"}
+
+
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
 MAX_CHAT_MESSAGE_LEN = 140  # The maximum characters in a chat message.
+MAX_STATUS_IDS = 100  # The maximum number of users in one request to the status endpoint.
+USER_STATUS_TTL = seconds(60)
+PUBLIC_DATA_TTL = seconds(600)
+
+
+class ResponseType(Protocol):
+    """The parts of an HTTP response (from `requests` or `AsyncLichess`) used when handling rate limits."""
+
+    status_code: int
+
+    def json(self) -> Any:
+        """Decode the JSON body of the response."""
 
 
 class Stop:
@@ -67,11 +116,36 @@ class RateLimitedError(RuntimeError):
         self.timeout = timeout
 
 
-def is_new_rate_limit(response: requests.models.Response) -> bool:
+def is_new_rate_limit(response: ResponseType) -> bool:
     """Check if the status code is 429, which means that we are rate limited."""
     return response.status_code == 429
 
 
+def get_rate_limit_delay(endpoint_name: str) -> datetime.timedelta:
+    """How long to wait before calling an endpoint again after a GET request was rate limited."""
+    return seconds(1 if endpoint_name == "move" else 60)
+
+
+def post_rate_limit_delay(endpoint_name: str, response: ResponseType) -> datetime.timedelta:
+    """
+    How long to wait before calling an endpoint again after a POST request was rate limited.
+
+    :param endpoint_name: The name of the endpoint.
+    :param response: The rate-limited response. Challenges may tell us how long the rate limit lasts.
+    """
+    delay = seconds(60)
+    try:
+        if endpoint_name == "challenge":
+            body = response.json()
+            rate_limit = body.get("ratelimit", {})
+            key = rate_limit.get("key", "")
+            if key == "bot.vsBot.day":
+                delay = seconds(rate_limit["seconds"])
+    except requests.exceptions.JSONDecodeError:
+        pass
+    return delay
+
+
 def is_final(exception: Exception) -> bool:
     """If `is_final` returns True then we won't retry."""
     return (isinstance(exception, HTTPError) and exception.response is not None and exception.response.status_code < 500
@@ -89,11 +163,201 @@ def backoff_handler(details: BackoffDetails) -> None:
     logger.debug(f"Exception: {traceback.format_exc()}")
 
 
+class TokenBucket:
+    """
+    Pace requests to an endpoint so that lichess.org doesn't rate limit us.
+
+    Each request takes a token. Tokens are added back at a steady rate up to the size of the bucket. When the bucket is
+    empty, requests wait in line for the next token, or aren't sent at all (see `take_if_available`).
+
+    The tokens are kept in shared memory, so a bucket created before the game processes start limits the requests of all
+    processes together. The statistics are kept by each process.
+    """
+
+    def __init__(self, capacity: int, rate: float) -> None:
+        """
+        Start with a full bucket.
+
+        :param capacity: The number of requests that can be sent at once.
+        :param rate: The number of tokens added back per second.
+        """
+        self.capacity = capacity
+        self.rate = rate
+        # The number of tokens and the `time.monotonic()` time when they were counted.
+        self.shared_state = multiprocessing.Array("d", [float(capacity), time.monotonic()])
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.waits = 0
+        self.dropped = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def refill(self) -> float:
+        """
+        Add the tokens earned since the last refill. Call with the lock of `shared_state` held.
+
+        :return: The number of tokens.
+        """
+        now = time.monotonic()
+        tokens, last_refill = self.shared_state[:]
+        tokens = min(float(self.capacity), tokens + (now - last_refill) * self.rate)
+        self.shared_state[:] = [tokens, now]
+        return tokens
+
+    def reserve(self) -> float:
+        """
+        Take a token.
+
+        :return: How many seconds to wait before sending the request.
+        """
+        with self.shared_state.get_lock():
+            tokens = self.refill() - 1
+            self.shared_state[0] = tokens
+        wait = max(0.0, -tokens / self.rate)
+        with self.lock:
+            self.requests += 1
+            if wait > 0:
+                self.waits += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+        return wait
+
+    def take_if_available(self) -> float:
+        """
+        Take a token if there is one, without waiting in line.
+
+        :return: 0 if a token was taken. Otherwise, how many seconds until there will be a token.
+        """
+        with self.shared_state.get_lock():
+            tokens = self.refill()
+            if tokens >= 1:
+                self.shared_state[0] = tokens - 1
+        with self.lock:
+            if tokens >= 1:
+                self.requests += 1
+                return 0.0
+            self.dropped += 1
+        return (1 - tokens) / self.rate
+
+    def stats(self) -> RateLimitStatsType:
+        """Get the number of requests and how long they had to wait in line."""
+        with self.lock:
+            return RateLimitStatsType(requests=self.requests, waits=self.waits, dropped=self.dropped,
+                                      total_wait=self.total_wait, max_wait=self.max_wait,
+                                      mean_wait=self.total_wait / self.waits if self.waits else 0.0)
+
+    def __getstate__(self) -> dict[str, Any]:
+        """Leave out the lock of the statistics when sending the bucket to another process. The tokens stay shared."""
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        """Create a new lock for the statistics in the other process."""
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+
+class UserDataCache(Generic[T]):
+    """Recently fetched data about users, so that the same user isn't looked up again for a short time."""
+
+    def __init__(self, ttl: datetime.timedelta) -> None:
+        """:param ttl: How long the data about a user is kept."""
+        self.ttl = ttl
+        self.entries: dict[str, tuple[Timer, T]] = {}
+
+    def get(self, user_id: str) -> Optional[T]:
+        """Get the data about a user if it hasn't expired."""
+        timer, data = self.entries.get(user_id.lower(), (None, None))
+        return data if timer and not timer.is_expired() else None
+
+    def put(self, user_id: str, data: T) -> None:
+        """Store the data about a user."""
+        self.entries[user_id.lower()] = (Timer(self.ttl), data)
+        if len(self.entries) > 1000:
+            self.entries = {key: entry for key, entry in self.entries.items() if not entry[0].is_expired()}
+
+
+class RateLimitedClient:
+    """
+    Keep track of the lichess.org endpoints that are rate limited. Shared by `Lichess` and `AsyncLichess`.
+
+    Requests are paced with a `TokenBucket` for each endpoint in `ENDPOINT_RATES` so that we rarely get a 429. The copies
+    of a client that are sent to other processes when they start share its buckets, so the requests of all processes are
+    paced together. Requests to the `NO_WAIT_ENDPOINTS` don't wait for a token.
+    """
+
+    def __init__(self) -> None:
+        """Start with no endpoints rate limited."""
+        self.rate_limit_timers: defaultdict[str, Timer] = defaultdict(Timer)
+        self.token_buckets = {endpoint_name: TokenBucket(capacity, rate)
+                              for endpoint_name, (capacity, rate) in ENDPOINT_RATES.items()}
+
+    def reserve_request(self, endpoint_name: str) -> float:
+        """
+        Take a token from the bucket of an endpoint.
+
+        Raises `RateLimitedError` if the endpoint is one of the `NO_WAIT_ENDPOINTS` and its bucket is empty.
+
+        :param endpoint_name: The name of the endpoint.
+        :return: How many seconds to wait before sending the request.
+        """
+        bucket = self.token_buckets.get(endpoint_name)
+        if bucket and endpoint_name in NO_WAIT_ENDPOINTS:
+            wait = bucket.take_if_available()
+            if wait > 0:
+                raise RateLimitedError(f"Not calling {endpoint_name} to stay below the rate limit. "
+                                       f"Try again in {wait:0.1f} seconds.", seconds(wait))
+            return 0.0
+        wait = bucket.reserve() if bucket else 0.0
+        if wait > 0:
+            logger.debug(f"Waiting {wait:0.1f} seconds before calling {endpoint_name} to stay below the rate limit.")
+        return wait
+
+    def rate_limit_stats(self) -> dict[str, RateLimitStatsType]:
+        """Get the number of requests to each paced endpoint and how long they waited in line."""
+        return {endpoint_name: bucket.stats() for endpoint_name, bucket in self.token_buckets.items()}
+
+    def get_path_template(self, endpoint_name: str) -> str:
+        """
+        Get the path template given the endpoint name. Will raise an exception if the path template is rate limited.
+
+        :param endpoint_name: The name of the endpoint.
+        :return: The path template.
+        """
+        path_template = ENDPOINTS[endpoint_name]
+        if self.is_rate_limited(path_template):
+            raise RateLimitedError(f"{path_template} is rate-limited. "
+                                   f"Will retry in {sec_str(self.rate_limit_time_left(path_template))} seconds.",
+                                   self.rate_limit_time_left(path_template))
+        return path_template
+
+    def set_rate_limit_delay(self, path_template: str, delay_time: datetime.timedelta) -> None:
+        """
+        Set a delay to a path template if it was rate limited.
+
+        :param path_template: The path template.
+        :param delay_time: How long we won't call this endpoint.
+        """
+        logger.warning(f"Endpoint {path_template} is rate limited. Waiting {sec_str(delay_time)} seconds until next request.")
+        self.rate_limit_timers[path_template] = Timer(delay_time)
+
+    def is_rate_limited(self, path_template: str) -> bool:
+        """Check if a path template is rate limited."""
+        return not self.rate_limit_timers[path_template].is_expired()
+
+    def rate_limit_time_left(self, path_template: str) -> datetime.timedelta:
+        """How much time is left until we can use the path template normally."""
+        return self.rate_limit_timers[path_template].time_until_expiration()
+
+
 # Docs: https://lichess.org/api.
-class Lichess:
+class Lichess(RateLimitedClient):
     """Communication with lichess.org (and chessdb.cn for getting moves)."""
 
-    def __init__(self, token: str, url: str, version: str, logging_level: int, max_retries: int) -> None:
+    def __init__(self, token: str, url: str, version: str, logging_level: int, max_retries: int,
+                 online_cache: Optional[OnlineCache] = None, move_sender: Optional[MoveSender] = None,
+                 adapter: Optional[BaseAdapter] = None) -> None:
         """
         Communication with lichess.org (and chessdb.cn for getting moves).
 
@@ -102,7 +366,11 @@ class Lichess:
         :param version: The lichess-bot version running.
         :param logging_level: The logging level (logging.INFO or logging.DEBUG).
         :param max_retries: The maximum amount of retries for online moves (e.g. chessdb's opening book).
+        :param online_cache: Where responses from online move sources are stored. Nothing is stored if it is `None`.
+        :param move_sender: Sends the bot's moves. One with the default settings is created if it is `None`.
+        :param adapter: If given, all requests are sent through this transport adapter (e.g. to record or replay them).
         """
+        super().__init__()
         self.version = version
         self.header = {
             "Authorization": f"Bearer {token}"
@@ -111,10 +379,17 @@ class Lichess:
         self.session = requests.Session()
         self.session.headers.update(self.header)
         self.other_session = requests.Session()
+        self.move_sender = move_sender or MoveSender()
+        self.clock_lag = ClockLagTracker()
+        if adapter:
+            for session in (self.session, self.other_session, self.move_sender.session):
+                recording.mount(session, adapter)
         self.set_user_agent("?")
         self.logging_level = logging_level
         self.max_retries = max_retries
-        self.rate_limit_timers: defaultdict[str, Timer] = defaultdict(Timer)
+        self.online_cache = online_cache
+        self.user_status_cache: UserDataCache[UserProfileType] = UserDataCache(USER_STATUS_TTL)
+        self.public_data_cache: UserDataCache[PublicDataType] = UserDataCache(PUBLIC_DATA_TTL)
 
         # Confirm that the OAuth token has the proper permission to play on lichess
         token_response = cast(TOKEN_TESTS_TYPE, self.api_post("token_test", data=token))
@@ -154,12 +429,12 @@ class Lichess:
         """
         logging.getLogger("backoff").setLevel(self.logging_level)
         path_template = self.get_path_template(endpoint_name)
+        time.sleep(self.reserve_request(endpoint_name))
         url = urljoin(self.baseUrl, path_template.format(*template_args))
         response = self.session.get(url, params=params, timeout=timeout, stream=stream)
 
         if is_new_rate_limit(response):
-            delay = seconds(1 if endpoint_name == "move" else 60)
-            self.set_rate_limit_delay(path_template, delay)
+            self.set_rate_limit_delay(path_template, get_rate_limit_delay(endpoint_name))
 
         response.raise_for_status()
         response.encoding = "utf-8"
@@ -237,21 +512,12 @@ class Lichess:
         """
         logging.getLogger("backoff").setLevel(self.logging_level)
         path_template = self.get_path_template(endpoint_name)
+        time.sleep(self.reserve_request(endpoint_name))
         url = urljoin(self.baseUrl, path_template.format(*template_args))
         response = self.session.post(url, data=data, headers=headers, params=params, json=payload, timeout=2)
 
         if is_new_rate_limit(response):
-            delay = seconds(60)
-            try:
-                if endpoint_name == "challenge":
-                    body = response.json()
-                    rate_limit = body.get("ratelimit", {})
-                    key = rate_limit.get("key", "")
-                    if key == "bot.vsBot.day":
-                        delay = seconds(rate_limit["seconds"])
-            except requests.exceptions.JSONDecodeError:
-                pass
-            self.set_rate_limit_delay(path_template, delay)
+            self.set_rate_limit_delay(path_template, post_rate_limit_delay(endpoint_name, response))
 
         if raise_for_status:
             response.raise_for_status()
@@ -259,51 +525,43 @@ class Lichess:
         json_response: Union[ChallengeType, Optional[TOKEN_TESTS_TYPE]] = response.json()
         return json_response
 
-    def get_path_template(self, endpoint_name: str) -> str:
-        """
-        Get the path template given the endpoint name. Will raise an exception if the path template is rate limited.
-
-        :param endpoint_name: The name of the endpoint.
-        :return: The path template.
-        """
-        path_template = ENDPOINTS[endpoint_name]
-        if self.is_rate_limited(path_template):
-            raise RateLimitedError(f"{path_template} is rate-limited. "
-                                   f"Will retry in {sec_str(self.rate_limit_time_left(path_template))} seconds.",
-                                   self.rate_limit_time_left(path_template))
-        return path_template
-
-    def set_rate_limit_delay(self, path_template: str, delay_time: datetime.timedelta) -> None:
-        """
-        Set a delay to a path template if it was rate limited.
-
-        :param path_template: The path template.
-        :param delay_time: How long we won't call this endpoint.
-        """
-        logger.warning(f"Endpoint {path_template} is rate limited. Waiting {sec_str(delay_time)} seconds until next request.")
-        self.rate_limit_timers[path_template] = Timer(delay_time)
-
-    def is_rate_limited(self, path_template: str) -> bool:
-        """Check if a path template is rate limited."""
-        return not self.rate_limit_timers[path_template].is_expired()
-
-    def rate_limit_time_left(self, path_template: str) -> datetime.timedelta:
-        """How much time is left until we can use the path template normally."""
-        return self.rate_limit_timers[path_template].time_until_expiration()
-
     def upgrade_to_bot_account(self) -> None:
         """Upgrade the account to a BOT account."""
         self.api_post("upgrade")
 
+    @backoff.on_exception(backoff.constant,
+                          (RemoteDisconnected, RequestsConnectionError, HTTPError, ReadTimeout),
+                          max_time=60,
+                          interval=0.1,
+                          giveup=is_final,
+                          on_backoff=backoff_handler,
+                          backoff_log_level=logging.DEBUG,
+                          giveup_log_level=logging.DEBUG)
     def make_move(self, game_id: str, move: chess.engine.PlayResult) -> None:
         """
-        Make a move.
+        Make a move. Moves are sent by the `MoveSender`, which has its own connections to lichess.org.
 
         :param game_id: The id of the game.
         :param move: The move to make.
         """
-        self.api_post("move", game_id, str(move.move),
-                      params={"offeringDraw": str(move.draw_offered).lower()})
+        logging.getLogger("backoff").setLevel(self.logging_level)
+        path_template = self.get_path_template("move")
+        time.sleep(self.reserve_request("move"))
+        url = urljoin(self.baseUrl, path_template.format(game_id, str(move.move)))
+        response = self.move_sender.send(url, params={"offeringDraw": str(move.draw_offered).lower()}, timeout=2)
+
+        if is_new_rate_limit(response):
+            self.set_rate_limit_delay(path_template, post_rate_limit_delay("move", response))
+
+        response.raise_for_status()
+
+    def warm_move_connection(self) -> None:
+        """Make sure the connection used for moves is ready while the engine is thinking."""
+        self.move_sender.warm(self.baseUrl)
+
+    def move_latency_stats(self) -> MoveLatencyStatsType:
+        """Get how long lichess.org took to accept the bot's moves."""
+        return self.move_sender.stats()
 
     def accept_takeback(self, game_id: str, accept: bool) -> bool:
         """Answer an opponent's move takeback request."""
@@ -331,7 +589,10 @@ class Lichess:
             logger.warning(f"Message: {text}")
 
         data = {"room": room, "text": text}
-        self.api_post("chat", game_id, data=data)
+        try:
+            self.api_post("chat", game_id, data=data)
+        except RateLimitedError:
+            logger.info(f"Chat message not sent to stay below the rate limit: {text}")
 
     def abort(self, game_id: str) -> None:
         """Aborts a game."""
@@ -350,7 +611,7 @@ class Lichess:
         self.api_post("accept", challenge_id)
 
     def decline_challenge(self, challenge_id: str, reason: str = "generic") -> None:
-        """Decline a challenge."""
+        """Decline a challenge. If too many challenges were declined recently, the challenge is left to expire."""
         with contextlib.suppress(Exception):
             self.api_post("decline", challenge_id,
                           data=f"reason={reason}",
@@ -364,12 +625,17 @@ class Lichess:
         return profile
 
     def get_ongoing_games(self) -> list[GameType]:
-        """Get the bot's ongoing games."""
-        ongoing_games: list[GameType] = []
-        with contextlib.suppress(Exception):
+        """Get the bot's ongoing games. An empty list is returned if lichess.org couldn't be asked."""
+        return self.fetch_ongoing_games() or []
+
+    def fetch_ongoing_games(self) -> Optional[list[GameType]]:
+        """Get the bot's ongoing games, or `None` if lichess.org couldn't be asked."""
+        try:
             response = cast(dict[str, list[GameType]], self.api_get_json("playing"))
-            ongoing_games = response["nowPlaying"]
-        return ongoing_games
+            return response["nowPlaying"]
+        except Exception:
+            logger.debug("Could not get the ongoing games.", exc_info=True)
+            return None
 
     def resign(self, game_id: str) -> None:
         """Resign a game."""
@@ -379,6 +645,7 @@ class Lichess:
         """Set the user agent for communication with lichess.org."""
         self.header.update({"User-Agent": f"lichess-bot/{self.version} user:{username}"})
         self.session.headers.update(self.header)
+        self.move_sender.session.headers.update(self.header)
 
     def get_game_pgn(self, game_id: str) -> str:
         """Get the PGN (Portable Game Notation) record of a game."""
@@ -407,7 +674,12 @@ class Lichess:
 
     def online_book_get(self, path: str, params: Optional[dict[str, Union[str, int]]] = None,
                         stream: bool = False) -> OnlineType:
-        """Get an external move from online sources (chessdb or lichess.org)."""
+        """Get an external move from online sources (chessdb or lichess.org). Responses are cached if enabled."""
+        if self.online_cache:
+            cached_response = self.online_cache.get(path, params)
+            if cached_response is not None:
+                return cached_response
+
         @backoff.on_exception(backoff.constant,
                               (RemoteDisconnected, RequestsConnectionError, HTTPError, ReadTimeout),
                               max_time=60,
@@ -417,16 +689,56 @@ class Lichess:
                               on_backoff=backoff_handler,
                               backoff_log_level=logging.DEBUG,
                               giveup_log_level=logging.DEBUG)
-        def online_book_get() -> OnlineType:
-            json_response: OnlineType = self.other_session.get(path, timeout=2, params=params, stream=stream).json()
-            return json_response
-        return online_book_get()
+        def online_book_get() -> tuple[int, OnlineType]:
+            response = self.other_session.get(path, timeout=2, params=params, stream=stream)
+            if response.status_code >= 500:
+                response.raise_for_status()
+            json_response: OnlineType = response.json()
+            return response.status_code, json_response
+
+        status_code, json_response = online_book_get()
+        if self.online_cache and has_move(status_code, json_response):
+            self.online_cache.put(path, params, json_response)
+        return json_response
 
     def is_online(self, user_id: str) -> bool:
         """Check if lichess.org thinks the bot is online or not."""
-        user = self.api_get_list("status", params={"ids": user_id})
+        user = self.get_users_status([user_id], use_cache=False)
         return bool(user and user[0].get("online"))
 
+    def get_users_status(self, user_ids: list[str], use_cache: bool = True) -> list[UserProfileType]:
+        """
+        Get the status (e.g. whether they are online) of many users with as few requests as possible.
+
+        :param user_ids: The ids of the users.
+        :param use_cache: Whether a status fetched in the last minute can be used.
+        :return: The status of each user that lichess.org knows about.
+        """
+        statuses = {}
+        missing_ids = []
+        for user_id in user_ids:
+            status = self.user_status_cache.get(user_id) if use_cache else None
+            if status is None:
+                missing_ids.append(user_id)
+            else:
+                statuses[user_id.lower()] = status
+
+        for start in range(0, len(missing_ids), MAX_STATUS_IDS):
+            ids = ",".join(missing_ids[start:start + MAX_STATUS_IDS])
+            for status in self.api_get_list("status", params={"ids": ids}):
+                self.user_status_cache.put(status["id"], status)
+                statuses[status["id"]] = status
+
+        return [statuses[user_id.lower()] for user_id in user_ids if user_id.lower() in statuses]
+
+    def get_cached_public_data(self, user_name: str) -> Optional[PublicDataType]:
+        """Get the public data of a bot if it was fetched in the last few minutes, without asking lichess.org."""
+        return self.public_data_cache.get(user_name)
+
     def get_public_data(self, user_name: str) -> PublicDataType:
-        """Get the public data of a bot."""
-        return cast(PublicDataType, self.api_get_json("public_data", user_name))
+        """Get the public data of a bot. Data fetched in the last few minutes is reused."""
+        public_data = self.public_data_cache.get(user_name)
+        if public_data is None:
+            public_data = cast(PublicDataType, self.api_get_json("public_data", user_name))
+            self.public_data_cache.put(user_name, public_data)
+        return public_data
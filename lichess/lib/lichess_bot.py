@@ -2,19 +2,18 @@
 import argparse
 import chess
 import chess.pgn
-from chess.variant import find_variant
-from lib import engine_wrapper, model, lichess, matchmaking
+from lib import engine_wrapper, engine_pool, model, lichess, matchmaking, game_host, ndjson, correspondence_worker
 import json
 import logging
 import logging.handlers
 import multiprocessing
+import multiprocessing.sharedctypes
 import signal
 import time
 import datetime
 import backoff
 import os
 import io
-import copy
 import math
 import sys
 import yaml
@@ -22,27 +21,39 @@ import traceback
 import itertools
 import glob
 import platform
+import random
 import importlib.metadata
 import contextlib
 from lib.config import load_config, Configuration, log_config
 from lib.conversation import Conversation, ChatLine
 from lib.timer import Timer, seconds, msec, hours, to_seconds
 from lib.lichess import stop
+from lib.ongoing_games import OngoingGames, SNAPSHOT_CAPACITY as ONGOING_GAMES_SNAPSHOT_CAPACITY
+from lib.online_cache import OnlineCache
+from lib.move_sender import MoveSender
+from lib.move_overhead import AdaptiveMoveOverhead
+from lib.recording import RecordingAdapter, ReplayAdapter, TrafficRecorder
+from lib.shared_snapshot import SharedSnapshot
+from lib.log_listener import LogListener
+from lib.board_tracker import BoardTracker
+from lib.correspondence_scheduler import CorrespondenceScheduler
+from lib.cpu_scheduler import CpuScheduler, GameCpuPolicy, SNAPSHOT_CAPACITY as CPU_SNAPSHOT_CAPACITY
 from lib.lichess_types import (UserProfileType, EventType, GameType, GameEventType, CONTROL_QUEUE_TYPE,
-                               CORRESPONDENCE_QUEUE_TYPE, LOGGING_QUEUE_TYPE, PGN_QUEUE_TYPE)
+                               LOGGING_QUEUE_TYPE, PGN_QUEUE_TYPE)
+import requests
+from requests.adapters import BaseAdapter
 from requests.exceptions import (ChunkedEncodingError, ConnectionError as RequestsConnectionError, HTTPError, ReadTimeout,
                                  RequestException)
 from rich.logging import RichHandler
 from collections import defaultdict
-from collections.abc import Iterator, MutableSequence
+from collections.abc import Iterator
 from http.client import RemoteDisconnected
 from queue import Empty
 from multiprocessing.pool import Pool
-from collections import Counter
 from typing import Optional, Union, TypedDict, cast
 from types import FrameType
-MULTIPROCESSING_LIST_TYPE = MutableSequence[model.Challenge]
-POOL_TYPE = Pool
+CHALLENGE_QUEUE_TYPE = list[model.Challenge]
+POOL_TYPE = Union[Pool, "game_host.GameHostPool"]
 
 
 class PlayGameArgsType(TypedDict, total=False):
@@ -52,13 +63,19 @@ class PlayGameArgsType(TypedDict, total=False):
     control_queue: CONTROL_QUEUE_TYPE
     user_profile: UserProfileType
     config: Configuration
-    challenge_queue: MULTIPROCESSING_LIST_TYPE
-    correspondence_queue: CORRESPONDENCE_QUEUE_TYPE
+    challenge_snapshot: SharedSnapshot
     logging_queue: LOGGING_QUEUE_TYPE
+    logging_level: int
     pgn_queue: PGN_QUEUE_TYPE
+    ongoing_games: OngoingGames
+    cpu_snapshot: SharedSnapshot
     game_id: str
 
 
+# The `play_game_args` (except for `game_id`) that a game process of the pool was started with.
+game_process_args = PlayGameArgsType()
+
+
 class VersioningType(TypedDict):
     """Type hint for the versioning information from lib/versioning.yml."""
 
@@ -75,6 +92,12 @@ with open("lib/versioning.yml") as version_file:
 
 __version__ = versioning_info["lichess_bot_version"]
 
+CONTROL_STREAM_MIN_BACKOFF = seconds(1)
+CONTROL_STREAM_MAX_BACKOFF = seconds(60)
+
+# How long to wait for the logging listener to write the records queued before shutdown.
+LOGGING_LISTENER_SHUTDOWN_TIMEOUT = seconds(10)
+
 
 def should_restart() -> bool:
     """Decide whether to restart lichess-bot when exiting main program."""
@@ -114,44 +137,80 @@ def upgrade_account(li: lichess.Lichess) -> bool:
     return True
 
 
+def is_transient_stream_error(error: Exception) -> bool:
+    """Whether an error from the event stream is worth reconnecting after (network problems and server errors)."""
+    if isinstance(error, HTTPError) and error.response is not None:
+        return error.response.status_code >= 500 or error.response.status_code == 429
+    return isinstance(error, (RequestException, RemoteDisconnected, lichess.RateLimitedError))
+
+
+def control_stream_backoff(attempt: int) -> datetime.timedelta:
+    """How long to wait before reconnecting to the event stream, with jitter so that the bots don't all reconnect at once."""
+    delay = min(CONTROL_STREAM_MIN_BACKOFF * 2 ** attempt, CONTROL_STREAM_MAX_BACKOFF)
+    return delay * random.uniform(0.5, 1.0)
+
+
 def watch_control_stream(control_queue: CONTROL_QUEUE_TYPE, li: lichess.Lichess) -> None:
-    """Put the events in a queue."""
+    """
+    Put the events in a queue.
+
+    If the stream ends or fails due to a network problem, reconnect with exponential backoff and put a `reconnected`
+    event in the queue so that the main process can catch up on anything it missed. Other errors end the bot with a
+    `terminated` event.
+    """
     error = None
+    attempt = 0
+    disconnect_reason: Optional[str] = None
     while not stop.terminated:
         try:
             response = li.get_event_stream()
-            lines = response.iter_lines()
-            for line in lines:
-                if line:
-                    event = json.loads(line.decode("utf-8"))
-                    control_queue.put_nowait(event)
-                else:
-                    control_queue.put_nowait({"type": "ping"})
-        except Exception:
-            error = traceback.format_exc()
-            break
+            if disconnect_reason is not None:
+                control_queue.put_nowait({"type": "reconnected", "error": disconnect_reason})
+                disconnect_reason = None
+            attempt = 0
+            for line in ndjson.iter_lines(response.iter_content(chunk_size=None)):
+                control_queue.put_nowait(ndjson.decode(line) or {"type": "ping"})
+            disconnect_reason = "The event stream ended."
+        except Exception as e:
+            if not is_transient_stream_error(e):
+                error = traceback.format_exc()
+                break
+            disconnect_reason = traceback.format_exc()
+            time.sleep(to_seconds(control_stream_backoff(attempt)))
+            attempt += 1
 
     control_queue.put_nowait({"type": "terminated", "error": error})
 
 
-def do_correspondence_ping(control_queue: CONTROL_QUEUE_TYPE, period: datetime.timedelta) -> None:
+def resume_after_reconnect(li: lichess.Lichess, ongoing_games: OngoingGames, active_games: set[str]) -> set[str]:
     """
-    Tell the engine to check the correspondence games.
+    Catch up with lichess.org after the event stream reconnected.
+
+    lichess.org sends a `gameStart` event for every ongoing game when the event stream connects. This finds the games that
+    don't need to be started again: the games that are being played, and the correspondence games we already knew about,
+    which are waiting in the correspondence scheduler. If the ongoing games can't be fetched, the index is left as it is
+    and the correspondence games in it are used. Games that are being played are skipped by `start_game` either way.
 
-    :param period: How many seconds to wait before sending a correspondence ping.
+    :param li: Provides communication with lichess.org.
+    :param ongoing_games: The index of the bot's ongoing games. It is reconciled with lichess.org.
+    :param active_games: The games that are being played.
+    :return: The IDs of the games whose next `gameStart` event should be ignored.
     """
-    while not stop.terminated:
-        time.sleep(to_seconds(period))
-        control_queue.put_nowait({"type": "correspondence_ping"})
+    known_games = dict(ongoing_games.games)
+    all_games = li.fetch_ongoing_games()
+    if all_games is None:
+        return {game_id for game_id, (_, speed) in known_games.items() if speed == "correspondence"}
+    ongoing_games.reconcile(all_games)
+    return {game["gameId"] for game in all_games
+            if game["gameId"] in active_games
+            or (game["speed"] == "correspondence" and game["gameId"] in known_games)}
 
 
 def write_pgn_records(pgn_queue: PGN_QUEUE_TYPE, config: Configuration, username: str) -> None:
     """Write PGN records to files as games finish."""
     while True:
-        mark_task_done = False
         try:
             event = pgn_queue.get()
-            mark_task_done = True
             if event:
                 save_pgn_record(event, config, username)
         except InterruptedError:
@@ -159,9 +218,6 @@ def write_pgn_records(pgn_queue: PGN_QUEUE_TYPE, config: Configuration, username
         except Exception:
             logger.exception("Could not write PGN to file")
 
-        if mark_task_done:
-            pgn_queue.task_done()
-
 
 def logging_configurer(level: int, filename: Optional[str], disable_auto_logs: bool) -> None:
     """
@@ -177,10 +233,12 @@ def logging_configurer(level: int, filename: Optional[str], disable_auto_logs: b
     console_handler.setLevel(level)
     all_handlers: list[logging.Handler] = [console_handler]
 
+    # The log files share a formatter, so that the logging listener formats each record once for all of them.
+    FORMAT = "%(asctime)s %(name)s (%(filename)s:%(lineno)d) %(levelname)s %(message)s"
+    file_formatter = logging.Formatter(FORMAT)
+
     if filename:
         file_handler = logging.FileHandler(filename, delay=True, encoding="utf-8")
-        FORMAT = "%(asctime)s %(name)s (%(filename)s:%(lineno)d) %(levelname)s %(message)s"
-        file_formatter = logging.Formatter(FORMAT)
         file_handler.setFormatter(file_formatter)
         file_handler.setLevel(level)
         all_handlers.append(file_handler)
@@ -196,9 +254,6 @@ def logging_configurer(level: int, filename: Optional[str], disable_auto_logs: b
                                                                       when="midnight",
                                                                       backupCount=7)
         auto_file_handler.setLevel(logging.DEBUG)
-
-        FORMAT = "%(asctime)s %(name)s (%(filename)s:%(lineno)d) %(levelname)s %(message)s"
-        file_formatter = logging.Formatter(FORMAT)
         auto_file_handler.setFormatter(file_formatter)
         all_handlers.append(auto_file_handler)
 
@@ -213,35 +268,35 @@ def logging_listener_proc(queue: LOGGING_QUEUE_TYPE, level: int, log_filename: O
     Handle events from the logging queue.
 
     This allows the logs from inside a thread to be printed.
-    They are added to the queue, so they are printed outside the thread.
+    They are added to the queue, so they are printed outside the thread. The listener stops when `None` is received.
     """
     logging_configurer(level, log_filename, disable_auto_logging)
-    logger = logging.getLogger()
-    while True:
-        task: Optional[logging.LogRecord] = None
-        try:
-            task = queue.get(block=False)
-        except Empty:
-            time.sleep(0.1)
-        except InterruptedError:
-            pass
-        except Exception:  # noqa: S110
-            pass
+    LogListener(queue, logging.getLogger().handlers).run()
 
-        if task is None:
-            continue
 
-        logger.handle(task)
-        queue.task_done()
+def lowest_logged_level(level: int, disable_auto_logs: bool) -> int:
+    """
+    Get the lowest level of the messages written by any of the handlers set up by `logging_configurer`.
 
+    :param level: The logging level. Either `logging.INFO` or `logging.DEBUG`.
+    :param disable_auto_logs: Whether the automatic log file, which gets all messages, is disabled.
+    """
+    return level if disable_auto_logs else logging.DEBUG
 
-def thread_logging_configurer(queue: LOGGING_QUEUE_TYPE) -> None:
-    """Configure the game logger."""
+
+def thread_logging_configurer(queue: LOGGING_QUEUE_TYPE, level: int) -> None:
+    """
+    Configure the game logger.
+
+    :param queue: The logging queue. Used by `logging_listener_proc`.
+    :param level: The lowest level of the messages that are written (see `lowest_logged_level`). Other messages aren't
+        sent to the logging queue, and `logger.isEnabledFor` tells whether a message is worth building.
+    """
     h = logging.handlers.QueueHandler(queue)
     root = logging.getLogger()
     root.handlers.clear()
     root.addHandler(h)
-    root.setLevel(logging.DEBUG)
+    root.setLevel(level)
 
 
 def start(li: lichess.Lichess, user_profile: UserProfileType, config: Configuration, logging_level: int,
@@ -258,18 +313,13 @@ def start(li: lichess.Lichess, user_profile: UserProfileType, config: Configurat
     :param one_game: Whether the bot should play only one game. Only used in `test_bot/test_bot.py` to test lichess-bot.
     """
     logger.info(f"You're now connected to {config.url} and awaiting challenges.")
-    manager = multiprocessing.Manager()
-    challenge_queue: MULTIPROCESSING_LIST_TYPE = manager.list()
-    control_queue: CONTROL_QUEUE_TYPE = manager.Queue()
+    challenge_queue: CHALLENGE_QUEUE_TYPE = []
+    challenge_snapshot = SharedSnapshot([])
+    control_queue: CONTROL_QUEUE_TYPE = multiprocessing.Queue()
     control_stream = multiprocessing.Process(target=watch_control_stream, args=(control_queue, li))
     control_stream.start()
-    correspondence_pinger = multiprocessing.Process(target=do_correspondence_ping,
-                                                    args=(control_queue,
-                                                          seconds(config.correspondence.checkin_period)))
-    correspondence_pinger.start()
-    correspondence_queue: CORRESPONDENCE_QUEUE_TYPE = manager.Queue()
 
-    logging_queue = manager.Queue()
+    logging_queue: LOGGING_QUEUE_TYPE = multiprocessing.Queue()
     logging_listener = multiprocessing.Process(target=logging_listener_proc,
                                                args=(logging_queue,
                                                      logging_level,
@@ -277,36 +327,47 @@ def start(li: lichess.Lichess, user_profile: UserProfileType, config: Configurat
                                                      disable_auto_logging))
     logging_listener.start()
 
-    pgn_queue = manager.Queue()
+    pgn_queue: PGN_QUEUE_TYPE = multiprocessing.Queue()
     pgn_listener = multiprocessing.Process(target=write_pgn_records,
                                            args=(pgn_queue,
                                                  config,
                                                  user_profile["username"]))
     pgn_listener.start()
 
-    thread_logging_configurer(logging_queue)
+    ongoing_games = OngoingGames(li, SharedSnapshot({}, ONGOING_GAMES_SNAPSHOT_CAPACITY))
+    cpu_scheduler = CpuScheduler(config.cpu_scheduler, SharedSnapshot({}, CPU_SNAPSHOT_CAPACITY))
+
+    game_logging_level = lowest_logged_level(logging_level, disable_auto_logging)
+    thread_logging_configurer(logging_queue, game_logging_level)
 
     try:
         lichess_bot_main(li,
                          user_profile,
                          config,
                          challenge_queue,
+                         challenge_snapshot,
                          control_queue,
-                         correspondence_queue,
                          logging_queue,
+                         game_logging_level,
                          pgn_queue,
+                         ongoing_games,
+                         cpu_scheduler,
                          one_game)
     finally:
         control_stream.terminate()
         control_stream.join()
-        correspondence_pinger.terminate()
-        correspondence_pinger.join()
-        time.sleep(1.0)  # Allow final messages in logging_queue to be handled.
+        # The listener writes everything queued before the `None` and then exits.
+        logging_queue.put_nowait(None)
+        logging_listener.join(to_seconds(LOGGING_LISTENER_SHUTDOWN_TIMEOUT))
+        if logging_listener.is_alive():
+            logging_listener.terminate()
+            logging_listener.join()
         logging_configurer(logging_level, log_filename, disable_auto_logging)
-        logging_listener.terminate()
-        logging_listener.join()
         pgn_listener.terminate()
         pgn_listener.join()
+        # Don't wait at exit to flush records that the stopped listeners will never read.
+        logging_queue.cancel_join_thread()
+        pgn_queue.cancel_join_thread()
 
 
 def log_proc_count(change: str, active_games: set[str]) -> None:
@@ -323,11 +384,14 @@ def log_proc_count(change: str, active_games: set[str]) -> None:
 def lichess_bot_main(li: lichess.Lichess,
                      user_profile: UserProfileType,
                      config: Configuration,
-                     challenge_queue: MULTIPROCESSING_LIST_TYPE,
+                     challenge_queue: CHALLENGE_QUEUE_TYPE,
+                     challenge_snapshot: SharedSnapshot,
                      control_queue: CONTROL_QUEUE_TYPE,
-                     correspondence_queue: CORRESPONDENCE_QUEUE_TYPE,
                      logging_queue: LOGGING_QUEUE_TYPE,
+                     logging_level: int,
                      pgn_queue: PGN_QUEUE_TYPE,
+                     ongoing_games: OngoingGames,
+                     cpu_scheduler: CpuScheduler,
                      one_game: bool) -> None:
     """
     Handle all the games and challenges.
@@ -336,9 +400,13 @@ def lichess_bot_main(li: lichess.Lichess,
     :param user_profile: Information on our bot.
     :param config: The config that the bot will use.
     :param challenge_queue: The queue containing the challenges.
+    :param challenge_snapshot: Where the challengers in the challenge queue are published for the game processes.
     :param control_queue: The queue containing all the events.
-    :param correspondence_queue: The queue containing the correspondence games.
     :param logging_queue: The logging queue. Used by `logging_listener_proc`.
+    :param logging_level: The lowest level of the messages that are written. Messages below it aren't sent by the game
+        processes.
+    :param ongoing_games: The index of the bot's ongoing games.
+    :param cpu_scheduler: Decides which games' engines get the CPU first.
     :param one_game: Whether the bot should play only one game. Only used in `test_bot/test_bot.py` to test lichess-bot.
     """
     max_games = config.challenge.concurrency
@@ -346,6 +414,7 @@ def lichess_bot_main(li: lichess.Lichess,
     one_game_completed = False
 
     all_games = li.get_ongoing_games()
+    ongoing_games.reconcile(all_games)
     prune_takeback_records(all_games)
     startup_correspondence_games = [game["gameId"]
                                     for game in all_games
@@ -353,44 +422,77 @@ def lichess_bot_main(li: lichess.Lichess,
     active_games = {game["gameId"]
                     for game in all_games
                     if game["gameId"] not in startup_correspondence_games}
+    # The games in `active_games` that have a game process. The others are waiting for their `gameStart` event.
+    started_games: set[str] = set()
     low_time_games: list[GameType] = []
+    correspondence_scheduler = CorrespondenceScheduler(seconds(config.correspondence.checkin_period))
+    streamed_correspondence_games: list[str] = []
 
     last_check_online_time = Timer(hours(1))
     matchmaker = matchmaking.Matchmaking(li, config, user_profile)
     matchmaker.show_earliest_challenge_time()
 
     play_game_args = PlayGameArgsType(li=li, control_queue=control_queue, user_profile=user_profile,
-                                      config=config, challenge_queue=challenge_queue,
-                                      correspondence_queue=correspondence_queue, logging_queue=logging_queue,
-                                      pgn_queue=pgn_queue)
+                                      config=config, challenge_snapshot=challenge_snapshot, logging_queue=logging_queue,
+                                      logging_level=logging_level, pgn_queue=pgn_queue, ongoing_games=ongoing_games,
+                                      cpu_snapshot=cpu_scheduler.snapshot)
 
     recent_bot_challenges: defaultdict[str, list[Timer]] = defaultdict(list)
+    resumed_games: set[str] = set()
 
     if config.quit_after_all_games_finish:
         logger.info("When quitting, lichess-bot will first wait for all running games to finish.")
         logger.info("Press Ctrl-C twice to quit immediately.")
 
-    with multiprocessing.pool.Pool(max_games + 1) as pool:
+    with (create_game_pool(config, max_games, play_game_args) as pool,
+          correspondence_worker.create_correspondence_worker(config, play_game_args) as corr_worker):
         while not (stop.terminated or (one_game and one_game_completed) or stop.restart):
-            event = next_event(control_queue)
+            event = next_event(control_queue, correspondence_scheduler.time_until_next())
             if not event:
                 continue
 
             if event["type"] == "terminated":
                 stop.restart = True
                 logger.debug(f"Terminating exception:\n{event['error']}")
-                control_queue.task_done()
                 break
 
+            if event["type"] == "reconnected":
+                logger.info("Reconnected to the event stream.")
+                logger.debug(f"The event stream was disconnected by:\n{event['error']}")
+                resumed_games = resume_after_reconnect(li, ongoing_games, active_games)
+
+            ongoing_games.update(event)
+            cpu_scheduler.update(event)
             if event["type"] == "local_game_done":
                 active_games.discard(event["game"]["id"])
+                started_games.discard(event["game"]["id"])
+                if event["game"].get("speed") == "correspondence":
+                    correspondence_scheduler.add(event["game"])
                 matchmaker.game_done()
                 log_proc_count("Freed", active_games)
                 one_game_completed = True
             elif event["type"] == "challenge":
-                handle_challenge(event, li, challenge_queue, config.challenge, user_profile, recent_bot_challenges)
+                handle_challenge(event, li, challenge_queue, config.challenge, user_profile, recent_bot_challenges,
+                                 ongoing_games)
             elif event["type"] == "challengeDeclined":
                 matchmaker.declined_challenge(event)
+            elif event["type"] == "gameFinish":
+                correspondence_scheduler.discard(event["game"]["id"])
+            elif event["type"] == "correspondence_checked":
+                correspondence_scheduler.add(event["game"])
+                if corr_worker:
+                    corr_worker.game_done(event["game"]["id"])
+            elif event["type"] == "correspondence_stream":
+                streamed_correspondence_games.append(event["game"]["id"])
+                if corr_worker:
+                    corr_worker.game_done(event["game"]["id"])
+            elif event["type"] == "correspondence_batch_done" and corr_worker:
+                corr_worker.batch_done()
+            elif event["type"] == "correspondence_analysis_done" and corr_worker:
+                corr_worker.analysis_done()
+            elif event["type"] == "gameStart" and event["game"]["id"] in resumed_games:
+                resumed_games.discard(event["game"]["id"])
+                logger.debug(f"Game {event['game']['id']} was already started before the event stream reconnected.")
             elif event["type"] == "gameStart":
                 matchmaker.accepted_challenge(event)
                 start_game(event,
@@ -398,26 +500,112 @@ def lichess_bot_main(li: lichess.Lichess,
                            play_game_args,
                            config,
                            startup_correspondence_games,
-                           correspondence_queue,
+                           correspondence_scheduler,
                            active_games,
+                           started_games,
                            low_time_games)
 
-            start_low_time_games(low_time_games, active_games, max_games, pool, play_game_args)
+            if corr_worker:
+                streamed_correspondence_games.extend(corr_worker.restart_if_dead())
+            if isinstance(pool, game_host.GameHostPool):
+                for game_id in pool.restart_if_dead(active_games):
+                    start_game_thread(active_games, started_games, game_id, play_game_args, pool)
+            game_slots = max_games - (1 if corr_worker and corr_worker.busy else 0)
+            start_low_time_games(low_time_games, active_games, started_games, game_slots, pool, play_game_args)
             check_in_on_correspondence_games(pool,
-                                             event,
-                                             correspondence_queue,
+                                             correspondence_scheduler,
+                                             corr_worker,
+                                             streamed_correspondence_games,
                                              challenge_queue,
                                              play_game_args,
                                              active_games,
-                                             max_games)
-            accept_challenges(li, challenge_queue, active_games, max_games)
-            matchmaker.challenge(active_games, challenge_queue, max_games)
+                                             started_games,
+                                             game_slots)
+            game_slots = max_games - (1 if corr_worker and corr_worker.busy else 0)
+            accept_challenges(li, challenge_queue, active_games, game_slots)
+            matchmaker.challenge(active_games, challenge_queue, game_slots)
+            challenge_snapshot.publish([challenge.challenger.name for challenge in challenge_queue])
             check_online_status(li, user_profile, last_check_online_time)
-
-            control_queue.task_done()
+            ongoing_games.reconcile_if_due()
 
         close_pool(pool, active_games, config)
 
+    log_rate_limit_stats(li)
+
+
+def log_rate_limit_stats(li: lichess.Lichess) -> None:
+    """Log how long the requests from the main process waited to stay below lichess.org's rate limits."""
+    for endpoint_name, stats in li.rate_limit_stats().items():
+        if stats["waits"]:
+            logger.debug(f"Rate limiting of {endpoint_name}: {stats['waits']} of {stats['requests']} requests waited, "
+                         f"{stats['mean_wait']:0.1f} seconds on average and {stats['max_wait']:0.1f} seconds at most.")
+        if stats["dropped"]:
+            logger.debug(f"Rate limiting of {endpoint_name}: {stats['dropped']} requests weren't sent.")
+
+
+def log_move_latency_stats(li: lichess.Lichess, game: model.Game) -> None:
+    """Log how long lichess.org took to accept the moves sent by this process."""
+    stats = li.move_latency_stats()
+    if stats["moves"]:
+        logger.debug(f"Move submission after game {game.id}: {stats['moves']} moves, median {stats['median']:0.0f} ms, "
+                     f"90th percentile {stats['p90']:0.0f} ms, max {stats['max']:0.0f} ms. "
+                     f"{stats['hedged']} moves were sent twice and the second copy was accepted first "
+                     f"{stats['hedge_wins']} times.")
+
+
+def create_game_pool(config: Configuration, max_games: int, play_game_args: PlayGameArgsType) -> POOL_TYPE:
+    """
+    Create the pool that runs the games.
+
+    With `game_runner: pool`, each game gets its own process. With `game_runner: multiplexed`, all games are played by
+    one process that reads all game streams at once.
+    """
+    if config.game_runner == "multiplexed":
+        return game_host.GameHostPool(play_game_args, max_games)
+    shared_args = PlayGameArgsType(**{key: value for key, value in play_game_args.items()
+                                      if key != "game_id"})
+    # The number of game processes that may still start an engine ahead of time.
+    prelaunch_slots = multiprocessing.Value("i", max_games)
+    return multiprocessing.pool.Pool(max_games + 1, initializer=init_game_process,
+                                     initargs=(shared_args, prelaunch_slots))
+
+
+def init_game_process(shared_args: PlayGameArgsType, prelaunch_slots: "multiprocessing.sharedctypes.Synchronized[int]"
+                      ) -> None:
+    """
+    Get a game process of the pool ready for its games.
+
+    Everything that `play_game` needs except the game id is sent once, when the process starts, and kept for all of its
+    games. This includes the `Lichess` object, so its connections and caches are reused from game to game. If
+    `engine.pool.prelaunch` is enabled, an engine is started ahead of the first game, by at most `max_games` of the
+    processes.
+
+    :param shared_args: The args passed to `play_game` (except for `game_id`).
+    :param prelaunch_slots: The number of game processes that may still start an engine ahead of time.
+    """
+    game_process_args.update(shared_args)
+    thread_logging_configurer(shared_args["logging_queue"], shared_args["logging_level"])
+    pool_cfg = shared_args["config"].engine.pool
+    if pool_cfg.enabled and pool_cfg.prelaunch and take_prelaunch_slot(prelaunch_slots):
+        try:
+            engine_pool.get_engine_pool(shared_args["config"]).prelaunch(1)
+        except Exception:
+            logger.exception("Could not start an engine ahead of time. It will be started when a game begins.")
+
+
+def take_prelaunch_slot(prelaunch_slots: "multiprocessing.sharedctypes.Synchronized[int]") -> bool:
+    """Whether this game process may start an engine ahead of time. Each slot is taken by one process."""
+    with prelaunch_slots.get_lock():
+        if prelaunch_slots.value <= 0:
+            return False
+        prelaunch_slots.value -= 1
+        return True
+
+
+def play_pooled_game(game_id: str) -> None:
+    """Play a game sent to a game process of the pool, with the arguments the process was started with."""
+    play_game(game_id=game_id, **game_process_args)
+
 
 def close_pool(pool: POOL_TYPE, active_games: set[str], config: Configuration) -> None:
     """Shut down pool after possibly waiting on games to finish depending on the configuration."""
@@ -428,65 +616,89 @@ def close_pool(pool: POOL_TYPE, active_games: set[str], config: Configuration) -
         pool.join()
 
 
-def next_event(control_queue: CONTROL_QUEUE_TYPE) -> EventType:
-    """Get the next event from the control queue."""
+def next_event(control_queue: CONTROL_QUEUE_TYPE, timeout: Optional[datetime.timedelta] = None) -> EventType:
+    """
+    Get the next event from the control queue.
+
+    :param control_queue: The queue containing all the events.
+    :param timeout: How long to wait for an event. If no event arrives in time, a `correspondence_ping` is returned so
+        that the correspondence games that are due can be started. If `None`, wait until an event arrives.
+    """
     try:
-        event = control_queue.get()
+        event = control_queue.get(timeout=None if timeout is None else to_seconds(timeout))
         if event is None:
             return {}
+    except Empty:
+        return {"type": "correspondence_ping"}
     except InterruptedError:
         return {}
 
     if "type" not in event:
         logger.warning("Unable to handle response from lichess.org:")
         logger.warning(event)
-        control_queue.task_done()
         return {}
 
-    if event.get("type") != "ping":
+    if event.get("type") != "ping" and logger.isEnabledFor(logging.DEBUG):
         logger.debug(f"Event: {event}")
 
     return event
 
 
-correspondence_games_to_start = 0
-
-
 def check_in_on_correspondence_games(pool: POOL_TYPE,
-                                     event: EventType,
-                                     correspondence_queue: CORRESPONDENCE_QUEUE_TYPE,
-                                     challenge_queue: MULTIPROCESSING_LIST_TYPE,
+                                     correspondence_scheduler: CorrespondenceScheduler,
+                                     corr_worker: Optional["correspondence_worker.CorrespondenceWorker"],
+                                     streamed_correspondence_games: list[str],
+                                     challenge_queue: CHALLENGE_QUEUE_TYPE,
                                      play_game_args: PlayGameArgsType,
                                      active_games: set[str],
+                                     started_games: set[str],
                                      max_games: int) -> None:
-    """Start correspondence games."""
-    global correspondence_games_to_start
+    """
+    Check in on the correspondence games that are due, most urgent first.
 
-    if event["type"] == "correspondence_ping":
-        correspondence_games_to_start = correspondence_queue.qsize()
-    elif event["type"] != "local_game_done":
-        return
+    With the correspondence worker, the due games are sent to the worker in batches, one batch at a time. Like a game, a
+    batch needs a free slot and no challenges waiting, and the worker takes up a slot while it plays its batch, so its
+    engine doesn't compete with more than `max_games` games. The games that the worker hands back, and all due games
+    without the worker, are started with a game stream if there are free slots and no challenges. While the worker has
+    nothing to do and there are free slots, it analyzes the waiting games.
+
+    :param max_games: The number of game slots, not counting a slot taken by the worker.
+    """
+    if corr_worker is not None:
+        if not corr_worker.busy and len(active_games) < max_games and not challenge_queue:
+            game_ids = correspondence_scheduler.pop_due(correspondence_worker.MAX_BATCH_SIZE)
+            if game_ids:
+                corr_worker.check_in(game_ids)
+                max_games -= 1
+        if len(active_games) < max_games and not challenge_queue:
+            corr_worker.analyze_when_idle(correspondence_scheduler)
+        else:
+            corr_worker.stop_idle_analysis()
 
     if challenge_queue:
         return
 
-    while len(active_games) < max_games and correspondence_games_to_start > 0:
-        game_id = correspondence_queue.get_nowait()
-        correspondence_games_to_start -= 1
-        correspondence_queue.task_done()
-        start_game_thread(active_games, game_id, play_game_args, pool)
+    while streamed_correspondence_games and len(active_games) < max_games:
+        game_id = streamed_correspondence_games.pop(0)
+        if game_id not in active_games:
+            start_game_thread(active_games, started_games, game_id, play_game_args, pool)
+
+    if corr_worker is None and len(active_games) < max_games:
+        for game_id in correspondence_scheduler.pop_due(max_games - len(active_games)):
+            if game_id not in active_games:
+                start_game_thread(active_games, started_games, game_id, play_game_args, pool)
 
 
-def start_low_time_games(low_time_games: list[GameType], active_games: set[str], max_games: int,
-                         pool: POOL_TYPE, play_game_args: PlayGameArgsType) -> None:
+def start_low_time_games(low_time_games: list[GameType], active_games: set[str], started_games: set[str],
+                         max_games: int, pool: POOL_TYPE, play_game_args: PlayGameArgsType) -> None:
     """Start the games based on how much time we have left."""
     low_time_games.sort(key=lambda g: g.get("secondsLeft", math.inf))
     while low_time_games and len(active_games) < max_games:
         game_id = low_time_games.pop(0)["id"]
-        start_game_thread(active_games, game_id, play_game_args, pool)
+        start_game_thread(active_games, started_games, game_id, play_game_args, pool)
 
 
-def accept_challenges(li: lichess.Lichess, challenge_queue: MULTIPROCESSING_LIST_TYPE, active_games: set[str],
+def accept_challenges(li: lichess.Lichess, challenge_queue: CHALLENGE_QUEUE_TYPE, active_games: set[str],
                       max_games: int) -> None:
     """Accept a challenge."""
     while len(active_games) < max_games and challenge_queue:
@@ -499,6 +711,10 @@ def accept_challenges(li: lichess.Lichess, challenge_queue: MULTIPROCESSING_LIST
             li.accept_challenge(chlng.id)
             active_games.add(chlng.id)
             log_proc_count("Queued", active_games)
+        except lichess.RateLimitedError as exception:
+            logger.info(f"Will accept {chlng} later. {exception}")
+            challenge_queue.insert(0, chlng)
+            break
         except (HTTPError, ReadTimeout) as exception:
             if isinstance(exception, HTTPError) and exception.response is not None and exception.response.status_code == 404:
                 logger.info(f"Skip missing {chlng}")
@@ -512,11 +728,11 @@ def check_online_status(li: lichess.Lichess, user_profile: UserProfileType, last
                 logger.info("Will restart lichess-bot")
                 stop.restart = True
             last_check_online_time.reset()
-        except (HTTPError, ReadTimeout):
+        except (HTTPError, ReadTimeout, lichess.RateLimitedError):
             pass
 
 
-def sort_challenges(challenge_queue: MULTIPROCESSING_LIST_TYPE, challenge_config: Configuration) -> None:
+def sort_challenges(challenge_queue: CHALLENGE_QUEUE_TYPE, challenge_config: Configuration) -> None:
     """
     Sort the challenges.
 
@@ -524,71 +740,86 @@ def sort_challenges(challenge_queue: MULTIPROCESSING_LIST_TYPE, challenge_config
     or by time (the first challenger is accepted first). The bot can also
     prioritize playing against humans or bots.
     """
-    challenge_list = list(challenge_queue)
     if challenge_config.sort_by == "best":
-        challenge_list.sort(key=lambda challenger: challenger.score(), reverse=True)
+        challenge_queue.sort(key=lambda challenger: challenger.score(), reverse=True)
     if challenge_config.preference != "none":
-        challenge_list.sort(key=lambda challenger: challenger.challenger.is_bot, reverse=challenge_config.preference == "bot")
-    challenge_queue[:] = challenge_list
-
+        challenge_queue.sort(key=lambda challenger: challenger.challenger.is_bot, reverse=challenge_config.preference == "bot")
 
-def game_is_active(li: lichess.Lichess, game_id: str) -> bool:
-    """Determine if a game is still being played."""
-    return game_id in (ongoing_game["gameId"] for ongoing_game in li.get_ongoing_games())
 
+def start_game_thread(active_games: set[str], started_games: set[str], game_id: str, play_game_args: PlayGameArgsType,
+                      pool: POOL_TYPE) -> None:
+    """
+    Start a game thread.
 
-def start_game_thread(active_games: set[str], game_id: str, play_game_args: PlayGameArgsType, pool: POOL_TYPE) -> None:
-    """Start a game thread."""
+    :param active_games: The games that are being played or are about to start.
+    :param started_games: The games that have been started and haven't ended. The game is added to them.
+    :param game_id: The ID of the game.
+    :param play_game_args: The args passed to `play_game`.
+    :param pool: The pool that plays the game.
+    """
     active_games.add(game_id)
+    started_games.add(game_id)
     log_proc_count("Used", active_games)
-    play_game_args["game_id"] = game_id
+
+    if isinstance(pool, game_host.GameHostPool):
+        pool.start_game(game_id)
+        return
 
     def game_error_handler(error: BaseException) -> None:
-        logger.exception("Game ended due to error:", exc_info=error)
-        control_queue = play_game_args["control_queue"]
-        pgn_queue = play_game_args["pgn_queue"]
-        li = play_game_args["li"]
-        control_queue.put_nowait({"type": "local_game_done", "game": {"id": game_id}})
-        pgn_queue.put_nowait({"game": {"id": game_id,
-                                       "pgn": li.get_game_pgn(game_id),
-                                       "complete": not game_is_active(li, game_id)}})
-
-    pool.apply_async(play_game,
-                     kwds=play_game_args,
+        end_game_after_error(error, game_id, play_game_args["li"], play_game_args["control_queue"],
+                             play_game_args["pgn_queue"], play_game_args["ongoing_games"])
+
+    pool.apply_async(play_pooled_game,
+                     args=(game_id,),
                      error_callback=game_error_handler)
 
 
+def end_game_after_error(error: BaseException, game_id: str, li: lichess.Lichess, control_queue: CONTROL_QUEUE_TYPE,
+                         pgn_queue: PGN_QUEUE_TYPE, ongoing_games: OngoingGames) -> None:
+    """Log the error that ended a game, and send the `local_game_done` event and the PGN record of the game."""
+    logger.exception("Game ended due to error:", exc_info=error)
+    control_queue.put_nowait({"type": "local_game_done", "game": {"id": game_id}})
+    pgn_queue.put_nowait({"game": {"id": game_id,
+                                   "pgn": li.get_game_pgn(game_id),
+                                   "complete": not ongoing_games.is_active(game_id)}})
+
+
 def start_game(event: EventType,
                pool: POOL_TYPE,
                play_game_args: PlayGameArgsType,
                config: Configuration,
                startup_correspondence_games: list[str],
-               correspondence_queue: CORRESPONDENCE_QUEUE_TYPE,
+               correspondence_scheduler: CorrespondenceScheduler,
                active_games: set[str],
+               started_games: set[str],
                low_time_games: list[GameType]) -> None:
     """
-    Start a game.
+    Start a game. A game that was already started isn't started again (e.g. when the event stream reconnects).
 
     :param event: The gameStart event.
     :param pool: The thread pool that the game is added to, so they can be run asynchronously.
     :param play_game_args: The args passed to `play_game`.
     :param config: The config the bot will use.
     :param startup_correspondence_games: A list of correspondence games that have to be started.
-    :param correspondence_queue: The queue that correspondence games are added to, to be started.
+    :param correspondence_scheduler: Where correspondence games wait to be started.
     :param active_games: A set of all the games that aren't correspondence games.
+    :param started_games: The games that have been started and haven't ended.
     :param low_time_games: A list of games, in which we don't have much time remaining.
     """
     game_id = event["game"]["id"]
-    if game_id in startup_correspondence_games:
+    if game_id in started_games:
+        logger.debug(f"Game {game_id} is already being played.")
+    elif game_id in startup_correspondence_games:
         if enough_time_to_queue(event, config):
             logger.info(f"--- Enqueue {config.url + game_id}")
-            correspondence_queue.put_nowait(game_id)
+            correspondence_scheduler.add(event["game"])
         else:
             logger.info(f"--- Will start {config.url + game_id} as soon as possible")
             low_time_games.append(event["game"])
         startup_correspondence_games.remove(game_id)
     else:
-        start_game_thread(active_games, game_id, play_game_args, pool)
+        correspondence_scheduler.discard(game_id)
+        start_game_thread(active_games, started_games, game_id, play_game_args, pool)
 
 
 def enough_time_to_queue(event: EventType, config: Configuration) -> bool:
@@ -599,15 +830,15 @@ def enough_time_to_queue(event: EventType, config: Configuration) -> bool:
     return not game["isMyTurn"] or game.get("secondsLeft", math.inf) > minimum_time
 
 
-def handle_challenge(event: EventType, li: lichess.Lichess, challenge_queue: MULTIPROCESSING_LIST_TYPE,
+def handle_challenge(event: EventType, li: lichess.Lichess, challenge_queue: CHALLENGE_QUEUE_TYPE,
                      challenge_config: Configuration, user_profile: UserProfileType,
-                     recent_bot_challenges: defaultdict[str, list[Timer]]) -> None:
+                     recent_bot_challenges: defaultdict[str, list[Timer]], ongoing_games: OngoingGames) -> None:
     """Handle incoming challenges. It either accepts, declines, or queues them to accept later."""
     chlng = model.Challenge(event["challenge"], user_profile)
     if chlng.from_self:
         return
 
-    opponent_engagements = Counter(game["opponent"]["username"] for game in li.get_ongoing_games())
+    opponent_engagements = ongoing_games.opponent_engagements()
     opponent_engagements.update(challenge.challenger.name for challenge in challenge_queue)
 
     is_supported, decline_reason = chlng.is_supported(challenge_config, recent_bot_challenges, opponent_engagements)
@@ -628,10 +859,12 @@ def play_game(li: lichess.Lichess,
               control_queue: CONTROL_QUEUE_TYPE,
               user_profile: UserProfileType,
               config: Configuration,
-              challenge_queue: MULTIPROCESSING_LIST_TYPE,
-              correspondence_queue: CORRESPONDENCE_QUEUE_TYPE,
+              challenge_snapshot: SharedSnapshot,
               logging_queue: LOGGING_QUEUE_TYPE,
-              pgn_queue: PGN_QUEUE_TYPE) -> None:
+              logging_level: int,
+              pgn_queue: PGN_QUEUE_TYPE,
+              ongoing_games: OngoingGames,
+              cpu_snapshot: SharedSnapshot) -> None:
     """
     Play a game.
 
@@ -640,111 +873,206 @@ def play_game(li: lichess.Lichess,
     :param control_queue: The control queue that contains events (adds `local_game_done` to the queue).
     :param user_profile: Information on our bot.
     :param config: The config that the bot will use.
-    :param challenge_queue: The queue containing the challenges.
-    :param correspondence_queue: The queue containing the correspondence games.
+    :param challenge_snapshot: The challengers in the challenge queue, published by the main process.
     :param logging_queue: The logging queue. Used by `logging_listener_proc`.
+    :param logging_level: The lowest level of the messages that are written.
+    :param ongoing_games: The index of the bot's ongoing games.
+    :param cpu_snapshot: The CPU priority of each game, published by the main process.
     """
-    thread_logging_configurer(logging_queue)
+    thread_logging_configurer(logging_queue, logging_level)
     logger = logging.getLogger(__name__)
 
     response = li.get_game_stream(game_id)
-    lines = response.iter_lines()
+    lines = ndjson.iter_lines(response.iter_content(chunk_size=None))
 
     # Initial response of stream will be the full game info. Store it.
-    initial_state = json.loads(next(lines).decode("utf-8"))
-    logger.debug(f"Initial state: {initial_state}")
-    abort_time = seconds(config.abort_time)
-    game = model.Game(initial_state, user_profile["username"], li.baseUrl, abort_time)
+    initial_state = ndjson.decode(next(lines))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Initial state: {initial_state}")
+    game = model.Game(initial_state, user_profile["username"], li.baseUrl, seconds(config.abort_time))
+
+    with engine_pool.lease_engine(config, game) as engine:
+        handler = GameHandler(li, game, engine, config, challenge_snapshot, ongoing_games, control_queue, cpu_snapshot)
+        game_stream = itertools.chain([json.dumps(game.state).encode("utf-8")], lines)
+        while handler.keep_playing():
+            try:
+                handler.handle_update(next_update(game_stream))
+            except (HTTPError, ReadTimeout, RemoteDisconnected, ChunkedEncodingError, RequestsConnectionError,
+                    StopIteration) as e:
+                stopped = isinstance(e, StopIteration)
+                handler.handle_stream_error(stopped)
+                if not stopped and handler.keep_playing():
+                    response.close()
+                    response, game_stream = reopen_game_stream(li, game)
+
+        pgn_record = try_get_pgn_game_record(li, config, game, handler.board, engine)
+    log_move_latency_stats(li, game)
+    final_queue_entries(control_queue, game, handler.board, handler.is_correspondence, pgn_record, pgn_queue)
+    delete_takeback_record(game)
+
+
+def reopen_game_stream(li: lichess.Lichess, game: model.Game) -> tuple[requests.models.Response, Iterator[bytes]]:
+    """
+    Open the stream of a game again after it failed.
+
+    The game's engine and handler are kept. The state in the new stream's `gameFull` is put in front of the stream, so the
+    handler catches up on any moves that were missed while disconnected.
+
+    :param li: Provides communication with lichess.org.
+    :param game: The game being played.
+    :return: The new response and its lines.
+    """
+    logger.info(f"Reconnecting to the stream of game {game.id}")
+    response = li.get_game_stream(game.id)
+    lines = ndjson.iter_lines(response.iter_content(chunk_size=None))
+    game_full = ndjson.decode(next(lines))
+    return response, itertools.chain([json.dumps(game_full["state"]).encode("utf-8")], lines)
+
+
+class GameHandler:
+    """
+    Respond to the updates from the stream of a single game.
+
+    The handler doesn't read the game stream itself, so the same handler is used whether a game has its own
+    process (`play_game`) or shares a process with other games (`lib.game_host`).
+    """
+
+    def __init__(self, li: lichess.Lichess, game: model.Game, engine: engine_wrapper.EngineWrapper,
+                 config: Configuration, challenge_snapshot: SharedSnapshot, ongoing_games: OngoingGames,
+                 control_queue: CONTROL_QUEUE_TYPE, cpu_snapshot: SharedSnapshot) -> None:
+        """
+        Prepare to play a game.
+
+        :param li: Provides communication with lichess.org.
+        :param game: The game, created from the first message of the game stream.
+        :param engine: The engine that plays the game.
+        :param config: The config that the bot will use.
+        :param challenge_snapshot: The challengers in the challenge queue, published by the main process.
+        :param ongoing_games: The index of the bot's ongoing games.
+        :param control_queue: Where the game's clock is reported to the main process.
+        :param cpu_snapshot: The CPU priority of each game, published by the main process.
+        """
+        self.li = li
+        self.ongoing_games = ongoing_games
+        self.game = game
+        self.engine = engine
+        self.config = config
 
-    with engine_wrapper.create_engine(config, game) as engine:
         engine.get_opponent_info(game)
-        logger.debug(f"The engine for game {game_id} has pid={engine.get_pid()}")
-        conversation = Conversation(game, engine, li, __version__, challenge_queue)
+        logger.debug(f"The engine for game {game.id} has pid={engine.get_pid()}")
+        self.conversation = Conversation(game, engine, li, __version__, challenge_snapshot)
 
         logger.info(f"+++ {game}")
 
-        is_correspondence = game.speed == "correspondence"
+        self.is_correspondence = game.speed == "correspondence"
         correspondence_cfg = config.correspondence
-        correspondence_move_time = seconds(correspondence_cfg.move_time)
-        correspondence_disconnect_time = seconds(correspondence_cfg.disconnect_time)
+        self.correspondence_move_time = seconds(correspondence_cfg.move_time)
+        self.correspondence_disconnect_time = seconds(correspondence_cfg.disconnect_time)
 
-        engine_cfg = config.engine
-        ponder_cfg = correspondence_cfg if is_correspondence else engine_cfg
-        can_ponder = ponder_cfg.uci_ponder or ponder_cfg.ponder
-        move_overhead = msec(config.move_overhead)
-        delay = msec(config.rate_limiting_delay)
+        self.engine_cfg = config.engine
+        ponder_cfg = correspondence_cfg if self.is_correspondence else self.engine_cfg
+        self.can_ponder = ponder_cfg.uci_ponder or ponder_cfg.ponder
+        self.cpu_policy = GameCpuPolicy(cpu_snapshot if config.cpu_scheduler.enabled else None, control_queue, game.id,
+                                        engine)
+        self.move_overhead = AdaptiveMoveOverhead(li.clock_lag, config.adaptive_move_overhead, msec(config.move_overhead))
+        self.delay = msec(config.rate_limiting_delay)
+        self.abort_time = seconds(config.abort_time)
 
-        takebacks_accepted = read_takeback_record(game)
-        max_takebacks_accepted = config.max_takebacks_accepted
+        self.takebacks_accepted = read_takeback_record(game)
+        self.max_takebacks_accepted = config.max_takebacks_accepted
 
         keyword_map: defaultdict[str, str] = defaultdict(str, me=game.me.name, opponent=game.opponent.name)
-        hello = get_greeting("hello", config.greeting, keyword_map)
-        goodbye = get_greeting("goodbye", config.greeting, keyword_map)
-        hello_spectators = get_greeting("hello_spectators", config.greeting, keyword_map)
-        goodbye_spectators = get_greeting("goodbye_spectators", config.greeting, keyword_map)
-
-        disconnect_time = correspondence_disconnect_time if not game.state.get("moves") else seconds(0)
-        prior_game = None
-        board = chess.Board()
-        game_stream = itertools.chain([json.dumps(game.state).encode("utf-8")], lines)
-        quit_after_all_games_finish = config.quit_after_all_games_finish
-        stay_in_game = True
-        while stay_in_game and (not stop.terminated or quit_after_all_games_finish) and not stop.force_quit:
-            move_attempted = False
-            try:
-                upd = next_update(game_stream)
-                u_type = upd["type"] if upd else "ping"
-                if u_type == "chatLine":
-                    conversation.react(ChatLine(upd))
-                elif u_type == "gameState":
-                    game.state = upd
-                    board = setup_board(game)
-                    takeback_field = game.state.get("btakeback") if game.is_white else game.state.get("wtakeback")
-
-                    if not is_game_over(game) and is_engine_move(game, prior_game, board):
-                        disconnect_time = correspondence_disconnect_time
-                        say_hello(conversation, hello, hello_spectators, board)
-                        setup_timer = Timer()
-                        print_move_number(board)
-                        move_attempted = True
-                        engine.play_move(board,
-                                         game,
-                                         li,
-                                         setup_timer,
-                                         move_overhead,
-                                         can_ponder,
-                                         is_correspondence,
-                                         correspondence_move_time,
-                                         engine_cfg,
-                                         fake_think_time(config, board, game))
-                        time.sleep(to_seconds(delay))
-                    elif is_game_over(game):
-                        tell_user_game_result(game, board)
-                        engine.send_game_result(game, board)
-                        conversation.send_message("player", goodbye)
-                        conversation.send_message("spectator", goodbye_spectators)
-                    elif (takeback_field
-                            and not bot_to_move(game, board)
-                            and li.accept_takeback(game.id, takebacks_accepted < max_takebacks_accepted)):
-                        takebacks_accepted += 1
-                        record_takeback(game, takebacks_accepted)
-                        engine.discard_last_move_commentary()
-
-                    wbtime = upd[engine_wrapper.wbtime(board)]
-                    wbinc = upd[engine_wrapper.wbinc(board)]
-                    terminate_time = msec(wbtime) + msec(wbinc) + seconds(60)
-                    game.ping(abort_time, terminate_time, disconnect_time)
-                    prior_game = copy.deepcopy(game)
-                elif u_type == "ping" and should_exit_game(board, game, prior_game, li, is_correspondence):
-                    stay_in_game = False
-            except (HTTPError, ReadTimeout, RemoteDisconnected, ChunkedEncodingError, RequestsConnectionError,
-                    StopIteration) as e:
-                stopped = isinstance(e, StopIteration)
-                stay_in_game = not stopped and (move_attempted or game_is_active(li, game.id))
-
-        pgn_record = try_get_pgn_game_record(li, config, game, board, engine)
-    final_queue_entries(control_queue, correspondence_queue, game, is_correspondence, pgn_record, pgn_queue)
-    delete_takeback_record(game)
+        self.hello = get_greeting("hello", config.greeting, keyword_map)
+        self.goodbye = get_greeting("goodbye", config.greeting, keyword_map)
+        self.hello_spectators = get_greeting("hello_spectators", config.greeting, keyword_map)
+        self.goodbye_spectators = get_greeting("goodbye_spectators", config.greeting, keyword_map)
+
+        self.disconnect_time = self.correspondence_disconnect_time if not game.state.get("moves") else seconds(0)
+        self.prior_game: Optional[model.GameSnapshot] = None
+        self.board_tracker = BoardTracker(game)
+        self.board = self.board_tracker.board
+        self.quit_after_all_games_finish = config.quit_after_all_games_finish
+        self.stay_in_game = True
+        self.move_attempted = False
+
+    def keep_playing(self) -> bool:
+        """Whether the game stream should still be read."""
+        return (self.stay_in_game
+                and (not stop.terminated or self.quit_after_all_games_finish)
+                and not stop.force_quit)
+
+    def handle_update(self, upd: GameEventType) -> None:
+        """
+        React to a message from the game stream.
+
+        :param upd: The message. An empty message is a keep-alive ping.
+        """
+        received_at = time.perf_counter()
+        self.move_attempted = False
+        game = self.game
+        u_type = upd["type"] if upd else "ping"
+        if u_type == "chatLine":
+            self.conversation.react(ChatLine(upd))
+        elif u_type == "gameState":
+            game.state = upd
+            self.board = board = self.board_tracker.update(game)
+            self.move_overhead.observe(len(board.move_stack), msec(upd["wtime" if game.is_white else "btime"]))
+            takeback_field = game.state.get("btakeback") if game.is_white else game.state.get("wtakeback")
+
+            if not is_game_over(game) and is_engine_move(game, self.prior_game, board):
+                self.disconnect_time = self.correspondence_disconnect_time
+                say_hello(self.conversation, self.hello, self.hello_spectators, board)
+                setup_timer = Timer()
+                print_move_number(board)
+                self.move_attempted = True
+                if not self.is_correspondence:
+                    self.move_overhead.start_turn(len(board.move_stack), msec(upd[engine_wrapper.wbtime(board)]),
+                                                  msec(upd[engine_wrapper.wbinc(board)]), received_at)
+                self.cpu_policy.before_search()
+                self.engine.play_move(board,
+                                      game,
+                                      self.li,
+                                      setup_timer,
+                                      self.move_overhead.current(),
+                                      self.can_ponder and self.cpu_policy.may_ponder(),
+                                      self.is_correspondence,
+                                      self.correspondence_move_time,
+                                      self.engine_cfg,
+                                      fake_think_time(self.config, board, game))
+                self.move_overhead.move_sent(self.engine.move_sent_at)
+                self.cpu_policy.report(to_seconds(game.my_remaining_time() - setup_timer.time_since_reset()))
+                time.sleep(to_seconds(self.delay))
+            elif is_game_over(game):
+                logger.debug(f"Move overhead at the end of game {game.id}: {self.move_overhead.summary()}")
+                tell_user_game_result(game, board)
+                self.engine.send_game_result(game, board)
+                self.conversation.send_message("player", self.goodbye)
+                self.conversation.send_message("spectator", self.goodbye_spectators)
+            elif (takeback_field
+                    and not bot_to_move(game, board)
+                    and self.li.accept_takeback(game.id, self.takebacks_accepted < self.max_takebacks_accepted)):
+                self.takebacks_accepted += 1
+                record_takeback(game, self.takebacks_accepted)
+                self.engine.discard_last_move_commentary()
+
+            wbtime = upd[engine_wrapper.wbtime(board)]
+            wbinc = upd[engine_wrapper.wbinc(board)]
+            terminate_time = msec(wbtime) + msec(wbinc) + seconds(60)
+            game.ping(self.abort_time, terminate_time, self.disconnect_time)
+            self.prior_game = game.snapshot()
+        elif u_type == "ping" and should_exit_game(self.board, game, self.prior_game, self.li, self.is_correspondence):
+            self.stay_in_game = False
+
+        if self.stay_in_game and not is_game_over(game):
+            self.cpu_policy.while_waiting()
+
+    def handle_stream_error(self, stopped: bool) -> None:
+        """
+        Decide whether to keep playing after the game stream ended or failed.
+
+        :param stopped: Whether the game stream ended normally.
+        """
+        self.stay_in_game = not stopped and (self.move_attempted or self.ongoing_games.is_active(self.game.id))
 
 
 def read_takeback_record(game: model.Game) -> int:
@@ -820,33 +1148,23 @@ def print_move_number(board: chess.Board) -> None:
 
 def next_update(lines: Iterator[bytes]) -> GameEventType:
     """Get the next game state."""
-    binary_chunk = next(lines)
-    upd = cast(GameEventType, json.loads(binary_chunk.decode("utf-8"))) if binary_chunk else {}
-    if upd:
+    return parse_update(next(lines))
+
+
+def parse_update(binary_chunk: bytes) -> GameEventType:
+    """Decode a line of the game stream. Empty lines (keep-alive pings) become an empty dict."""
+    upd = cast(GameEventType, ndjson.decode(binary_chunk))
+    if upd and logger.isEnabledFor(logging.DEBUG):
         logger.debug(f"Game state: {upd}")
     return upd
 
 
 def setup_board(game: model.Game) -> chess.Board:
-    """Set up the board."""
-    if game.variant_name.lower() == "chess960":
-        board = chess.Board(game.initial_fen, chess960=True)
-    elif game.variant_name == "From Position":
-        board = chess.Board(game.initial_fen)
-    else:
-        VariantBoard = find_variant(game.variant_name)
-        board = VariantBoard()
+    """Set up the board by playing all the moves of the game from the starting position."""
+    return BoardTracker(game).update(game)
 
-    for move in game.state["moves"].split():
-        try:
-            board.push_uci(move)
-        except ValueError:
-            logger.exception(f"Ignoring illegal move {move} on board {board.fen()}")
 
-    return board
-
-
-def is_engine_move(game: model.Game, prior_game: Optional[model.Game], board: chess.Board) -> bool:
+def is_engine_move(game: model.Game, prior_game: Optional[model.GameSnapshot], board: chess.Board) -> bool:
     """Check whether it is the engine's turn."""
     return game_changed(game, prior_game) and bot_to_move(game, board)
 
@@ -868,7 +1186,7 @@ def is_game_over(game: model.Game) -> bool:
     return status != "started"
 
 
-def should_exit_game(board: chess.Board, game: model.Game, prior_game: Optional[model.Game], li: lichess.Lichess,
+def should_exit_game(board: chess.Board, game: model.Game, prior_game: Optional[model.GameSnapshot], li: lichess.Lichess,
                      is_correspondence: bool) -> bool:
     """Whether we should exit a game."""
     if (is_correspondence
@@ -887,33 +1205,35 @@ def should_exit_game(board: chess.Board, game: model.Game, prior_game: Optional[
     return False
 
 
-def final_queue_entries(control_queue: CONTROL_QUEUE_TYPE, correspondence_queue: CORRESPONDENCE_QUEUE_TYPE,
-                        game: model.Game, is_correspondence: bool, pgn_record: str, pgn_queue: PGN_QUEUE_TYPE) -> None:
+def final_queue_entries(control_queue: CONTROL_QUEUE_TYPE, game: model.Game, board: chess.Board, is_correspondence: bool,
+                        pgn_record: str, pgn_queue: PGN_QUEUE_TYPE) -> None:
     """
     Log the game that ended or we disconnected from, and sends a `local_game_done` for the game.
 
-     If this is an unfinished correspondence game, put it in a queue to resume later.
+     If this is an unfinished correspondence game, the `local_game_done` says whose turn it is and how much time the bot
+     has left, so that the main process can schedule when to resume it.
     """
+    game_done: GameType = {"id": game.id}
     if is_correspondence and not is_game_over(game):
         logger.info(f"--- Disconnecting from {game.url()}")
-        correspondence_queue.put_nowait(game.id)
+        game_done.update(speed="correspondence",
+                         isMyTurn=bot_to_move(game, board),
+                         secondsLeft=int(to_seconds(game.my_remaining_time())))
     else:
         logger.info(f"--- {game.url()} Game over")
 
-    control_queue.put_nowait({"type": "local_game_done", "game": {"id": game.id}})
+    control_queue.put_nowait({"type": "local_game_done", "game": game_done})
     pgn_queue.put_nowait({"game": {"id": game.id,
                                    "pgn": pgn_record,
                                    "complete": is_game_over(game)}})
 
 
-def game_changed(current_game: model.Game, prior_game: Optional[model.Game]) -> bool:
-    """Check whether the current game state is different from the previous game state."""
+def game_changed(current_game: model.Game, prior_game: Optional[model.GameSnapshot]) -> bool:
+    """Check whether the moves of the current game state are different from the moves of the previous game state."""
     if prior_game is None:
         return True
 
-    current_game_moves_str = current_game.state["moves"]
-    prior_game_moves_str = prior_game.state["moves"]
-    return current_game_moves_str != prior_game_moves_str
+    return not current_game.snapshot().same_moves(prior_game)
 
 
 def tell_user_game_result(game: model.Game, board: chess.Board) -> None:
@@ -1167,6 +1487,12 @@ def start_lichess_bot() -> None:
     parser.add_argument("--config", help="Specify a configuration file (defaults to ./config.yml).")
     parser.add_argument("-l", "--logfile", help="Record all console output to a log file.", default=None)
     parser.add_argument("--disable_auto_logging", action="store_true", help="Disable automatic logging.")
+    traffic = parser.add_mutually_exclusive_group()
+    traffic.add_argument("--record", metavar="DIR", help="Record all communication with lichess to a directory.")
+    traffic.add_argument("--replay", metavar="DIR",
+                         help="Replay communication recorded with --record instead of connecting to lichess.")
+    parser.add_argument("--replay-speed", type=float, default=1.0,
+                        help="How many times faster than real time to replay (defaults to 1).")
     args = parser.parse_args()
 
     logging_level = logging.DEBUG if args.v else logging.INFO
@@ -1185,7 +1511,17 @@ def start_lichess_bot() -> None:
     max_retries = CONFIG.engine.online_moves.max_retries
     check_python_version()
     log_python_and_libraries()
-    li = lichess.Lichess(CONFIG.token, CONFIG.url, __version__, logging_level, max_retries)
+    online_cache = OnlineCache.from_config(CONFIG.engine.online_moves.cache)
+    move_sender = MoveSender.from_config(CONFIG.move_submission)
+    adapter: Optional[BaseAdapter] = None
+    if args.record:
+        logger.info(f"Recording communication with lichess to {args.record}")
+        adapter = RecordingAdapter(TrafficRecorder(args.record))
+    elif args.replay:
+        logger.info(f"Replaying communication with lichess from {args.replay} at {args.replay_speed}x speed")
+        adapter = ReplayAdapter(args.replay, args.replay_speed)
+    li = lichess.Lichess(CONFIG.token, CONFIG.url, __version__, logging_level, max_retries, online_cache, move_sender,
+                         adapter)
 
     user_profile = li.get_profile()
     username = user_profile["username"]
@@ -1195,7 +1531,14 @@ def start_lichess_bot() -> None:
     if args.u and not is_bot:
         is_bot = upgrade_account(li)
 
-    if is_bot:
+    if is_bot and args.replay:
+        # A replay runs once. Restarting would only replay the same recording again.
+        try:
+            start(li, user_profile, CONFIG, logging_level, args.logfile, args.disable_auto_logging)
+        except RequestException:
+            logger.exception("The replay ended with a network error:")
+        disable_restart()
+    elif is_bot:
         start(li, user_profile, CONFIG, logging_level, args.logfile, args.disable_auto_logging)
     else:
         logger.error(f"{username} is not a bot account. Please upgrade it to a bot account!")
@@ -2,15 +2,14 @@
 from typing import Any, Callable, Optional, Union, TypedDict, Literal
 from chess.engine import PovWdl, PovScore, PlayResult, Limit, Opponent
 from chess import Move, Board
-from queue import Queue
-import logging
+from multiprocessing.queues import Queue
 from enum import Enum
 from types import TracebackType
 
 COMMANDS_TYPE = list[str]
 MOVE = Union[PlayResult, list[Move]]
-CORRESPONDENCE_QUEUE_TYPE = Queue[str]
-LOGGING_QUEUE_TYPE = Queue[logging.LogRecord]
+# The queues between processes are `multiprocessing` queues, which can only be subscripted when type checking.
+LOGGING_QUEUE_TYPE = Queue  # Queue[logging.LogRecord]
 REQUESTS_PAYLOAD_TYPE = dict[str, Union[str, int, bool]]
 GO_COMMANDS_TYPE = dict[str, str]
 EGTPATH_TYPE = dict[str, str]
@@ -69,6 +68,8 @@ class UserProfileType(TypedDict, total=False):
     blocking: bool
     followsYou: bool
     count: dict[str, int]
+    disabled: bool
+    tosViolation: bool
 
 
 class ReadableType(TypedDict):
@@ -211,6 +212,8 @@ class GameStateType(TypedDict, total=False):
     binc: int
     wdraw: bool
     bdraw: bool
+    wtakeback: bool
+    btakeback: bool
     status: str
     winner: str
 
@@ -249,8 +252,8 @@ class GameEventType(TypedDict, total=False):
     btakeback: bool
 
 
-CONTROL_QUEUE_TYPE = Queue[EventType]
-PGN_QUEUE_TYPE = Queue[Optional[EventType]]
+CONTROL_QUEUE_TYPE = Queue  # Queue[EventType]
+PGN_QUEUE_TYPE = Queue  # Queue[Optional[EventType]]
 
 
 class PublicDataType(TypedDict, total=False):
@@ -454,5 +457,31 @@ class BackoffDetails(_BackoffDetails, total=False):
     value: Any  # present in the on_predicate decorator case
 
 
+class RateLimitStatsType(TypedDict):
+    """
+    How long requests to an endpoint waited, and how many weren't sent, to stay below the rate limit.
+
+    Times are in seconds.
+    """
+
+    requests: int
+    waits: int
+    dropped: int
+    total_wait: float
+    max_wait: float
+    mean_wait: float
+
+
+class MoveLatencyStatsType(TypedDict):
+    """How long lichess.org took to accept the bot's moves. Times are in milliseconds."""
+
+    moves: int
+    hedged: int
+    hedge_wins: int
+    median: float
+    p90: float
+    max: float
+
+
 ENGINE_INPUT_ARGS_TYPE = Union[None, OPTIONS_TYPE, type[BaseException], BaseException, TracebackType, Board, Limit, str, bool]
 ENGINE_INPUT_KWARGS_TYPE = Union[None, int, bool, list[Move], Opponent]
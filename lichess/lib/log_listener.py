@@ -0,0 +1,161 @@
+"""Write the log records that all of lichess-bot's processes send through the logging queue."""
+import logging
+import logging.handlers
+import sys
+import time
+import traceback
+from queue import Empty
+from typing import Optional
+from lib.lichess_types import LOGGING_QUEUE_TYPE
+
+logger = logging.getLogger(__name__)
+
+# The most records taken from the queue at once.
+MAX_BATCH_SIZE = 1000
+
+# When the oldest record of a batch is older than this (in seconds), the DEBUG records of the batch are dropped.
+DROP_DEBUG_LAG = 2.0
+
+# When the log is more than this many seconds behind, a warning is logged (at most once every `LAG_REPORT_PERIOD`).
+LAG_WARNING = 1.0
+LAG_REPORT_PERIOD = 30.0
+
+
+class LogListener:
+    """
+    Take the records from the logging queue in batches and write each batch with one write per log file.
+
+    The listener blocks on the queue until a record arrives, then takes all the waiting records. Each record is formatted
+    once for all the log files that share a formatter. If the listener falls behind by more than `DROP_DEBUG_LAG`
+    seconds, DEBUG records are dropped until it catches up. It stops after handling the `None` sent at shutdown.
+
+    Errors don't stop the listener, since the other processes would then fill the queue without bound. A record that
+    can't be written is passed to the handler's `handleError`, like `logging.Handler.emit` does.
+    """
+
+    def __init__(self, queue: LOGGING_QUEUE_TYPE, handlers: list[logging.Handler]) -> None:
+        """
+        Get ready to write the records.
+
+        :param queue: The logging queue.
+        :param handlers: Where the records are written (e.g. the handlers set up by `lichess_bot.logging_configurer`).
+        """
+        self.queue = queue
+        self.file_handlers = [handler for handler in handlers if isinstance(handler, logging.FileHandler)]
+        self.other_handlers = [handler for handler in handlers if not isinstance(handler, logging.FileHandler)]
+        self.dropped = 0
+        self.max_lag = 0.0
+        self.last_report = time.monotonic()
+
+    def run(self) -> None:
+        """Write records until the `None` sent at shutdown is received."""
+        while True:
+            try:
+                batch, stopping = self.next_batch()
+            except InterruptedError:
+                continue
+            except Exception:
+                # E.g. a record that couldn't be unpickled. The records after it can still be written.
+                traceback.print_exc(file=sys.stderr)
+                continue
+            self.handle_batch(batch)
+            self.report_lag()
+            if stopping:
+                return
+
+    def next_batch(self) -> tuple[list[logging.LogRecord], bool]:
+        """
+        Wait for a record, then take the records that are waiting behind it.
+
+        :return: The records and whether the `None` sent at shutdown was received.
+        """
+        batch: list[logging.LogRecord] = []
+        record: Optional[logging.LogRecord] = self.queue.get()
+        while record is not None:
+            batch.append(record)
+            if len(batch) >= MAX_BATCH_SIZE:
+                return batch, False
+            try:
+                record = self.queue.get_nowait()
+            except Empty:
+                return batch, False
+        return batch, True
+
+    def handle_batch(self, batch: list[logging.LogRecord]) -> None:
+        """Write a batch of records, dropping the DEBUG records if the listener has fallen behind."""
+        if not batch:
+            return
+        lag = time.time() - batch[0].created
+        self.max_lag = max(self.max_lag, lag)
+        if lag > DROP_DEBUG_LAG:
+            kept = [record for record in batch if record.levelno > logging.DEBUG]
+            self.dropped += len(batch) - len(kept)
+            batch = kept
+
+        for handler in self.other_handlers:
+            for record in batch:
+                if record.levelno >= handler.level:
+                    try:
+                        handler.handle(record)
+                    except Exception:
+                        handler.handleError(record)
+
+        formatted: dict[int, list[tuple[logging.LogRecord, str]]] = {}
+        for handler in self.file_handlers:
+            if not any(record.levelno >= handler.level for record in batch):
+                continue
+            formatter = handler.formatter or logging.Formatter()
+            key = id(formatter)
+            if key not in formatted:
+                formatted[key] = self.format_batch(handler, formatter, batch)
+            self.write(handler, [(record, text) for record, text in formatted[key] if record.levelno >= handler.level])
+
+    @staticmethod
+    def format_batch(handler: logging.Handler, formatter: logging.Formatter, batch: list[logging.LogRecord]
+                     ) -> list[tuple[logging.LogRecord, str]]:
+        """Format the records of a batch. A record that can't be formatted is passed to `handler.handleError`."""
+        formatted: list[tuple[logging.LogRecord, str]] = []
+        for record in batch:
+            try:
+                formatted.append((record, formatter.format(record)))
+            except Exception:
+                handler.handleError(record)
+        return formatted
+
+    def write(self, handler: logging.FileHandler, lines: list[tuple[logging.LogRecord, str]]) -> None:
+        """Write formatted records to a log file, with one write between rollovers of a rotating log file."""
+        handler.acquire()
+        try:
+            pending: list[str] = []
+            for record, text in lines:
+                if isinstance(handler, logging.handlers.BaseRotatingHandler) and handler.shouldRollover(record):
+                    self.flush(handler, pending)
+                    pending = []
+                    handler.doRollover()
+                pending.append(text)
+            self.flush(handler, pending)
+        except Exception:
+            handler.handleError(lines[0][0])
+        finally:
+            handler.release()
+
+    @staticmethod
+    def flush(handler: logging.FileHandler, texts: list[str]) -> None:
+        """Write lines to a log file at once."""
+        if not texts:
+            return
+        if handler.stream is None:
+            handler.stream = handler._open()  # noqa: SLF001 (opened like logging.FileHandler.emit does with delay=True)
+        handler.stream.write(handler.terminator.join(texts) + handler.terminator)
+        handler.stream.flush()
+
+    def report_lag(self) -> None:
+        """Warn every `LAG_REPORT_PERIOD` seconds if the log has fallen behind or records were dropped."""
+        if time.monotonic() - self.last_report < LAG_REPORT_PERIOD:
+            return
+        if self.max_lag > LAG_WARNING or self.dropped:
+            logger.warning(f"The log fell up to {self.max_lag:0.1f} seconds behind in the last {LAG_REPORT_PERIOD:0.0f} "
+                           f"seconds. {self.dropped} DEBUG records were dropped to catch up.")
+        self.max_lag = 0.0
+        self.dropped = 0
+        self.last_report = time.monotonic()
@@ -15,6 +15,8 @@ MULTIPROCESSING_LIST_TYPE = Sequence[model.Challenge]
 
 logger = logging.getLogger(__name__)
 
+MAX_CANDIDATES = 10  # The number of bots to check before giving up on creating a challenge.
+
 
 class Matchmaking:
     """Challenge other bots."""
@@ -195,20 +197,45 @@ class Matchmaking:
         weights = self.get_weights(online_bots, rating_preference, min_rating, max_rating, game_type)
 
         try:
-            bot = random.choices(online_bots, weights=weights)[0]
-            bot_profile = self.li.get_public_data(bot["username"])
-            if bot_profile.get("blocking"):
-                self.add_to_block_list(bot["username"])
-            else:
-                bot_username = bot["username"]
-        except Exception:
-            if online_bots:
-                logger.exception("Error:")
-            else:
+            candidates = weighted_sample(online_bots, weights, MAX_CANDIDATES)
+            bot_username = self.first_available_bot(candidates)
+            if not candidates:
                 logger.error("No suitable bots found to challenge.")
+        except Exception:
+            logger.exception("Error:")
 
         return bot_username, base_time, increment, days, variant, mode
 
+    def first_available_bot(self, candidates: list[UserProfileType]) -> Optional[str]:
+        """
+        Find the first candidate that can be challenged.
+
+        The candidates come from `/api/bot/online`, so they are online, and the accounts that are closed are skipped
+        using the same response. Whether a bot blocks us is only in its public data. The public data is fetched for at
+        most one candidate, and not at all while the request would go over the rate limit. The other candidates are only
+        checked if their public data is cached. A bot that blocks us without us knowing rejects the challenge and is then
+        added to the block list (see `handle_challenge_error_response`).
+
+        :param candidates: The bots to try, in order.
+        :return: The username of the bot to challenge, or `None` if none of the candidates can be challenged.
+        """
+        fetched = False
+        for bot in candidates:
+            if bot.get("disabled") or bot.get("tosViolation"):
+                continue
+            bot_profile = self.li.get_cached_public_data(bot["username"])
+            if bot_profile is None and not fetched:
+                fetched = True
+                try:
+                    bot_profile = self.li.get_public_data(bot["username"])
+                except RateLimitedError as e:
+                    logger.debug(f"Not checking whether {bot['username']} blocks us. {e}")
+            if bot.get("blocking") or (bot_profile and bot_profile.get("blocking")):
+                self.add_to_block_list(bot["username"])
+            else:
+                return bot["username"]
+        return None
+
     def get_random_config_value(self, config: Configuration, parameter: str, choices: list[str]) -> str:
         """Choose a random value from `choices` if the parameter value in the config is `random`."""
         value: str = config.lookup(parameter)
@@ -334,6 +361,18 @@ class Matchmaking:
         self.show_earliest_challenge_time()
 
 
+def weighted_sample(items: list[UserProfileType], weights: list[int], count: int) -> list[UserProfileType]:
+    """Choose up to `count` different items at random. Items with higher weights are more likely to be chosen first."""
+    items = list(items)
+    weights = list(weights)
+    sample = []
+    while items and len(sample) < count:
+        index = random.choices(range(len(items)), weights=weights)[0] if sum(weights) > 0 else random.randrange(len(items))
+        sample.append(items.pop(index))
+        weights.pop(index)
+    return sample
+
+
 def game_category(variant: str, base_time: int, increment: int, days: int) -> str:
     """
     Get the game type (e.g. bullet, atomic, classical). Lichess has one rating for every variant regardless of time control.
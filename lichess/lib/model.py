@@ -4,6 +4,7 @@ from urllib.parse import urljoin
 import logging
 import datetime
 from enum import Enum
+from typing import NamedTuple
 from lib.timer import Timer, msec, seconds, sec_str, to_msec, to_seconds, years
 from lib.config import Configuration
 from collections import defaultdict, Counter
@@ -259,6 +260,10 @@ class Game:
 
         return result.value
 
+    def snapshot(self) -> "GameSnapshot":
+        """Get the moves of the current game state, to be compared with later states."""
+        return GameSnapshot(moves=self.state["moves"])
+
     def __str__(self) -> str:
         """Get a string representation of `Game`."""
         return f"{self.url()} {self.perf_name} vs {self.opponent} ({self.id})"
@@ -268,6 +273,21 @@ class Game:
         return self.__str__()
 
 
+class GameSnapshot(NamedTuple):
+    """
+    A small, unchangeable record of the moves of a game state.
+
+    It is kept between updates of a game instead of a copy of the game. The moves string is shared with the game state,
+    not copied.
+    """
+
+    moves: str
+
+    def same_moves(self, other: "GameSnapshot") -> bool:
+        """Whether both states have the same moves. Moves of different lengths are told apart without comparing them."""
+        return len(self.moves) == len(other.moves) and self.moves == other.moves
+
+
 class Player:
     """Store information about a player."""
 
@@ -0,0 +1,123 @@
+"""Learn the move overhead from how much more time lichess.org takes off the clock than the bot spends on a move."""
+import datetime
+import logging
+from collections import deque
+from typing import Optional
+from lib.config import Configuration
+from lib.move_sender import percentile
+from lib.timer import msec, msec_str, seconds, to_seconds
+
+logger = logging.getLogger(__name__)
+
+# How many of the latest clock lag measurements are kept.
+CLOCK_LAG_HISTORY = 200
+
+
+class ClockLagTracker:
+    """
+    The clock lag measured on a connection to lichess.org.
+
+    The clock lag of a move is the time lichess.org took off the bot's clock minus the time between the bot receiving the
+    opponent's move and sending its own. It covers the network delay both ways and the time lichess.org takes to handle
+    the move. A `Lichess` object keeps one tracker, so the measurements of all games played over it are shared.
+    """
+
+    def __init__(self) -> None:
+        """Start with no measurements."""
+        self.lags: deque[float] = deque(maxlen=CLOCK_LAG_HISTORY)
+
+    def record(self, lag: datetime.timedelta) -> None:
+        """Add a measurement."""
+        self.lags.append(to_seconds(lag))
+
+    def count(self) -> int:
+        """The number of measurements."""
+        return len(self.lags)
+
+    def percentile(self, percent: float) -> datetime.timedelta:
+        """Get a percentile (0-100) of the measurements. There must be at least one measurement."""
+        return seconds(percentile(list(self.lags), percent))
+
+
+class AdaptiveMoveOverhead:
+    """
+    The move overhead of a game, taken from a percentile of the clock lag measured on its connection.
+
+    Until there are enough measurements, or if `adaptive_move_overhead` is disabled, the fixed `move_overhead` from the
+    config is used. After that, the move overhead follows the measurements, kept between `min_overhead` and
+    `max_overhead`, so that a fast connection doesn't lose the whole `move_overhead` on every move.
+    """
+
+    def __init__(self, tracker: ClockLagTracker, overhead_cfg: Configuration, fixed_overhead: datetime.timedelta) -> None:
+        """
+        Get ready to measure the clock lag of a game.
+
+        :param tracker: Where the measurements of the connection are kept.
+        :param overhead_cfg: The `adaptive_move_overhead` section of the config.
+        :param fixed_overhead: The `move_overhead` from the config.
+        """
+        self.tracker = tracker
+        self.enabled = overhead_cfg.enabled
+        self.percent = overhead_cfg.percentile
+        self.min_samples = overhead_cfg.min_samples
+        self.margin = msec(overhead_cfg.margin)
+        self.min_overhead = msec(overhead_cfg.min_overhead)
+        self.max_overhead = msec(overhead_cfg.max_overhead)
+        self.fixed_overhead = fixed_overhead
+        self.turn: Optional[tuple[int, datetime.timedelta, datetime.timedelta, float]] = None
+        self.sent_at: Optional[float] = None
+
+    def start_turn(self, ply: int, my_clock: datetime.timedelta, increment: datetime.timedelta, received_at: float) -> None:
+        """
+        Remember the clock at the start of the bot's turn.
+
+        :param ply: The number of moves played before the bot's move.
+        :param my_clock: The bot's time left according to lichess.org.
+        :param increment: The bot's increment.
+        :param received_at: When (`time.perf_counter()`) the opponent's move was received.
+        """
+        self.turn = (ply, my_clock, increment, received_at)
+        self.sent_at = None
+
+    def move_sent(self, sent_at: Optional[float]) -> None:
+        """Remember when (`time.perf_counter()`) the bot's move was sent, or `None` if no move was sent."""
+        self.sent_at = sent_at
+
+    def observe(self, ply: int, my_clock: datetime.timedelta) -> None:
+        """
+        Measure the clock lag of the bot's last move once lichess.org reports the clock after it.
+
+        :param ply: The number of moves played.
+        :param my_clock: The bot's time left according to lichess.org.
+        """
+        if self.turn is None or self.sent_at is None or ply <= self.turn[0]:
+            return
+        turn_ply, clock_before, increment, received_at = self.turn
+        self.turn = None
+        if ply != turn_ply + 1 or turn_ply < 2:
+            # The clocks don't run for the first move of each side, and a takeback leaves nothing to measure.
+            return
+        charged = clock_before + increment - my_clock
+        spent = seconds(self.sent_at - received_at)
+        if charged < seconds(0):
+            # Time was added to the bot's clock (e.g. by the opponent).
+            return
+        lag = max(seconds(0), charged - spent)
+        self.tracker.record(lag)
+        logger.debug(f"Clock lag: {msec_str(lag)} ms (lichess.org took {msec_str(charged)} ms, "
+                     f"the bot took {msec_str(spent)} ms).")
+
+    def current(self) -> datetime.timedelta:
+        """The move overhead to use for the next move."""
+        if not self.enabled or self.tracker.count() < self.min_samples:
+            return self.fixed_overhead
+        overhead = self.tracker.percentile(self.percent) + self.margin
+        return min(max(overhead, self.min_overhead), self.max_overhead)
+
+    def summary(self) -> str:
+        """Describe the move overhead for the logs."""
+        if not self.enabled or self.tracker.count() < self.min_samples:
+            return f"{msec_str(self.fixed_overhead)} ms (fixed)"
+        return (f"{msec_str(self.current())} ms ({self.percent}th percentile of {self.tracker.count()} clock lag "
+                f"measurements plus {msec_str(self.margin)} ms, between {msec_str(self.min_overhead)} and "
+                f"{msec_str(self.max_overhead)} ms)")
@@ -0,0 +1,228 @@
+"""Send moves to lichess.org over a connection that is kept warm, with a hedged second request if the first stalls."""
+import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Optional
+import requests
+from requests.adapters import HTTPAdapter
+from lib.config import Configuration
+from lib.lichess_types import MoveLatencyStatsType
+
+logger = logging.getLogger(__name__)
+
+# How many of the latest move submissions are used for the hedging delay and the statistics.
+LATENCY_HISTORY = 100
+
+# How many submissions are needed before the hedging delay is taken from their latencies.
+MIN_LATENCY_SAMPLES = 5
+
+
+def percentile(values: list[float], percent: float) -> float:
+    """Get a percentile (0-100) of a list of numbers by the nearest-rank method."""
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+class MoveSender:
+    """
+    Send moves over a `requests.Session` that is only used for moves.
+
+    Keeping moves off the session shared with everything else means a move is never stuck behind another request, and
+    the connection can be checked (`warm`) while the engine is thinking, so that a connection that the server closed while
+    the bot was idle is replaced before the move needs it.
+
+    If lichess.org hasn't answered a move after the `hedge_percentile` of the latest submit latencies, the same move is
+    sent again over a second connection, and the first successful answer is used. Sending a move twice is harmless: the
+    second copy is rejected because it is no longer the bot's turn.
+    """
+
+    def __init__(self, hedge: bool = True, hedge_percentile: float = 90, min_hedge_delay: float = 0.15,
+                 max_hedge_delay: float = 1.0, keep_alive: float = 20) -> None:
+        """
+        Create the session for sending moves.
+
+        :param hedge: Whether to send a second copy of a move that hasn't been answered in time.
+        :param hedge_percentile: The percentile of the latest submit latencies after which a move is sent again.
+        :param min_hedge_delay: The least time (in seconds) to wait for an answer before sending a move again.
+        :param max_hedge_delay: The most time (in seconds) to wait for an answer before sending a move again.
+        :param keep_alive: How long (in seconds) the connection can be idle before `warm` checks it.
+        """
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay = min_hedge_delay
+        self.max_hedge_delay = max_hedge_delay
+        self.keep_alive = keep_alive
+        self.session = self.create_session()
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.check_executor: Optional[ThreadPoolExecutor] = None
+        self.lock = threading.Lock()
+        self.moves_in_flight = 0
+        self.latencies: deque[float] = deque(maxlen=LATENCY_HISTORY)
+        self.moves_sent = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.last_used = 0.0
+
+    @classmethod
+    def from_config(cls, move_cfg: Configuration) -> "MoveSender":
+        """Create the move sender from the `move_submission` section of the config."""
+        return cls(move_cfg.hedge, move_cfg.hedge_percentile, move_cfg.min_hedge_delay / 1000,
+                   move_cfg.max_hedge_delay / 1000, move_cfg.keep_alive)
+
+    @staticmethod
+    def create_session() -> requests.Session:
+        """Create a session with room for the connections of a move, its hedge, and a health check."""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=3, max_retries=0)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def get_executor(self) -> ThreadPoolExecutor:
+        """Start the threads that send a move and its hedge the first time they're needed."""
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="move")
+            return self.executor
+
+    def get_check_executor(self) -> ThreadPoolExecutor:
+        """Start the thread for health checks the first time it's needed. A stalled check never delays a move."""
+        with self.lock:
+            if self.check_executor is None:
+                self.check_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="move-check")
+            return self.check_executor
+
+    def hedge_delay(self) -> float:
+        """How long (in seconds) to wait for lichess.org to answer a move before sending it again."""
+        if len(self.latencies) < MIN_LATENCY_SAMPLES:
+            return self.max_hedge_delay
+        delay = percentile(list(self.latencies), self.hedge_percentile)
+        return min(max(delay, self.min_hedge_delay), self.max_hedge_delay)
+
+    def send(self, url: str, params: Optional[dict[str, str]], timeout: float) -> requests.Response:
+        """
+        Send a move.
+
+        :param url: The url of the move endpoint, including the game id and the move.
+        :param params: Parameters sent to lichess.org (e.g. whether a draw is offered).
+        :param timeout: How long (in seconds) to wait for each request.
+        :return: The first successful response, or the last response if none succeeded.
+        """
+        with self.lock:
+            self.moves_in_flight += 1
+        try:
+            return self.send_hedged(url, params, timeout)
+        finally:
+            with self.lock:
+                self.moves_in_flight -= 1
+
+    def send_hedged(self, url: str, params: Optional[dict[str, str]], timeout: float) -> requests.Response:
+        """Send a move, and send it again if it isn't answered in time. See `send`."""
+        start = time.perf_counter()
+        executor = self.get_executor()
+        pending = {executor.submit(self.session.post, url, params=params, timeout=timeout)}
+        hedge: Optional[Future[requests.Response]] = None
+        if self.hedge:
+            delay = self.hedge_delay()
+            done, _ = wait(pending, timeout=delay)
+            if not done:
+                logger.debug(f"No answer to the move after {delay:0.2f} seconds. Sending it again.")
+                hedge = executor.submit(self.session.post, url, params=params, timeout=timeout)
+                pending.add(hedge)
+                self.hedged += 1
+
+        response: Optional[requests.Response] = None
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except requests.exceptions.RequestException as e:
+                    error = error or e
+                    continue
+                if result.ok:
+                    self.record(start, future is hedge)
+                    return result
+                response = result
+
+        self.last_used = time.monotonic()
+        if response is not None:
+            return response
+        assert error is not None
+        raise error
+
+    def record(self, start: float, hedge_won: bool) -> None:
+        """Record the latency of a move that lichess.org accepted."""
+        latency = time.perf_counter() - start
+        self.latencies.append(latency)
+        self.moves_sent += 1
+        self.hedge_wins += int(hedge_won)
+        self.last_used = time.monotonic()
+        logger.debug(f"Move accepted after {latency * 1000:0.0f} ms{' (hedged)' if hedge_won else ''}.")
+
+    def warm(self, url: str) -> None:
+        """
+        Check the connection in the background if it has been idle for a while, so that it's ready for the next move.
+
+        :param url: A cheap url on the same server as the move endpoint.
+        """
+        if time.monotonic() - self.last_used < self.keep_alive:
+            return
+        self.last_used = time.monotonic()
+        self.get_check_executor().submit(self.check_connection, url)
+
+    def check_connection(self, url: str) -> None:
+        """
+        Make a request over the move connection and start over with new connections if it fails.
+
+        The connections aren't closed while a move is being sent, since that would break the move's request. The move
+        replaces a broken connection by itself when it fails.
+        """
+        try:
+            self.session.head(url, timeout=2)
+        except requests.exceptions.RequestException:
+            with self.lock:
+                if self.moves_in_flight:
+                    logger.debug("The move connection failed its health check while a move was being sent.",
+                                 exc_info=True)
+                    return
+                logger.debug("The move connection failed its health check. Opening a new one.", exc_info=True)
+                for adapter in self.session.adapters.values():
+                    adapter.close()
+
+    def stats(self) -> MoveLatencyStatsType:
+        """Get the submit latencies (in milliseconds) of the latest moves and how often a move was sent twice."""
+        latencies = list(self.latencies)
+        return MoveLatencyStatsType(moves=self.moves_sent,
+                                    hedged=self.hedged,
+                                    hedge_wins=self.hedge_wins,
+                                    median=percentile(latencies, 50) * 1000 if latencies else 0.0,
+                                    p90=percentile(latencies, 90) * 1000 if latencies else 0.0,
+                                    max=max(latencies) * 1000 if latencies else 0.0)
+
+    def close(self) -> None:
+        """Stop the threads and close the connections."""
+        for executor in [self.executor, self.check_executor]:
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+        self.executor = None
+        self.check_executor = None
+        self.session.close()
+
+    def __getstate__(self) -> dict[str, Any]:
+        """Leave out the threads and lock when sending the move sender to another process."""
+        state = self.__dict__.copy()
+        state["executor"] = None
+        state["check_executor"] = None
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        """Create a new lock in the other process. The threads are started when they are first needed."""
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
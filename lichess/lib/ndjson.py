@@ -0,0 +1,88 @@
+"""Decode the newline-delimited JSON (NDJSON) streams of events and game updates from lichess.org."""
+import json
+from collections.abc import AsyncIterable, AsyncIterator, Iterable, Iterator
+from typing import Any
+
+KEEP_ALIVE = b""
+
+
+class LineSplitter:
+    """
+    Split a stream of byte chunks into lines.
+
+    Only the new chunk is searched for line breaks, so a long line (e.g. the full `moves` of a long game) that arrives in
+    many chunks is not searched again every time a chunk is added to it.
+    """
+
+    def __init__(self) -> None:
+        """Start with an empty buffer."""
+        self.buffer = bytearray()
+
+    def feed(self, chunk: bytes) -> list[bytes]:
+        """
+        Add a chunk and get the lines that it completes.
+
+        :param chunk: The bytes received from the socket.
+        :return: The complete lines, without line endings. Keep-alive messages are returned as empty lines.
+        """
+        end = chunk.find(b"\n")
+        if end == -1:
+            self.buffer += chunk
+            return []
+
+        lines = []
+        start = 0
+        while end != -1:
+            if self.buffer:
+                self.buffer += chunk[start:end]
+                line = bytes(self.buffer)
+                self.buffer.clear()
+            else:
+                line = chunk[start:end]
+            lines.append(line.rstrip(b"\r"))
+            start = end + 1
+            end = chunk.find(b"\n", start)
+        self.buffer += chunk[start:]
+        return lines
+
+    def flush(self) -> list[bytes]:
+        """Get the last line if the stream didn't end with a line break."""
+        line = bytes(self.buffer).rstrip(b"\r")
+        self.buffer.clear()
+        return [line] if line else []
+
+
+def iter_lines(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Split a stream of byte chunks (e.g. `requests.Response.iter_content(chunk_size=None)`) into lines."""
+    splitter = LineSplitter()
+    for chunk in chunks:
+        yield from splitter.feed(chunk)
+    yield from splitter.flush()
+
+
+async def aiter_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    """Split an asynchronous stream of byte chunks into lines."""
+    splitter = LineSplitter()
+    async for chunk in chunks:
+        for line in splitter.feed(chunk):
+            yield line
+    for line in splitter.flush():
+        yield line
+
+
+def is_keep_alive(line: bytes) -> bool:
+    """Check whether a line is a keep-alive message, which lichess.org sends as an empty line."""
+    return not line or line.isspace()
+
+
+def decode(line: bytes) -> dict[str, Any]:
+    """
+    Decode a line of a stream.
+
+    :param line: A line from `iter_lines` or `aiter_lines`.
+    :return: The message. Keep-alive messages become an empty dict without going through the JSON decoder.
+    """
+    if is_keep_alive(line):
+        return {}
+    message: dict[str, Any] = json.loads(line)
+    return message
@@ -0,0 +1,121 @@
+"""An index of the bot's ongoing games, kept up to date from the event stream."""
+import datetime
+import logging
+from collections import Counter
+from collections.abc import Mapping
+from typing import Any, Optional
+from lib import lichess
+from lib.lichess_types import EventType, GameType
+from lib.shared_snapshot import SharedSnapshot
+from lib.timer import Timer, minutes
+
+logger = logging.getLogger(__name__)
+
+# Maps the game id to the opponent's username and the speed of the game.
+ONGOING_GAMES_TYPE = dict[str, tuple[str, str]]
+
+# Room for the JSON of a few thousand ongoing (mostly correspondence) games.
+SNAPSHOT_CAPACITY = 1024 * 1024
+
+
+class OngoingGames:
+    """
+    The bot's ongoing games, so that we don't have to ask lichess.org (`/api/account/playing`) every time.
+
+    The index is updated by the main process from the `gameStart`, `gameFinish`, and `local_game_done` events, and checked
+    against lichess.org every `reconcile_period` in case an event was missed. If the index has a snapshot, every change
+    is published to it, and copies of the index in the game processes read the games from the snapshot.
+    """
+
+    def __init__(self, li: lichess.Lichess, snapshot: Optional[SharedSnapshot] = None,
+                 reconcile_period: datetime.timedelta = minutes(5)) -> None:
+        """
+        Create an empty index.
+
+        :param li: Provides communication with lichess.org.
+        :param snapshot: Where the games are published for the game processes. They aren't published if it is `None`.
+        :param reconcile_period: How often to check the index against the games lichess.org says we're playing.
+        """
+        self.li = li
+        self.games: ONGOING_GAMES_TYPE = {}
+        self.snapshot = snapshot
+        self.is_publisher = True
+        self.reconcile_timer = Timer(reconcile_period)
+        self.publish()
+
+    def reconcile(self, all_games: Optional[list[GameType]] = None) -> None:
+        """
+        Replace the index with the games that lichess.org says we're playing.
+
+        If the games can't be fetched, the index is kept as it is until the next time it is due.
+
+        :param all_games: The response from `/api/account/playing`. It is fetched if it is `None`.
+        """
+        if all_games is None:
+            all_games = self.li.fetch_ongoing_games()
+        if all_games is None:
+            logger.debug("Keeping the ongoing games index, since the ongoing games couldn't be fetched.")
+            self.reconcile_timer.reset()
+            return
+        ongoing = {game["gameId"]: (game["opponent"]["username"], game["speed"]) for game in all_games}
+        missed = self.games.keys() ^ ongoing.keys()
+        if missed:
+            logger.debug(f"Ongoing games index was out of date for: {', '.join(sorted(missed))}")
+        for game_id in self.games.keys() - ongoing.keys():
+            self.games.pop(game_id, None)
+        self.games.update(ongoing)
+        self.reconcile_timer.reset()
+        self.publish()
+
+    def reconcile_if_due(self) -> None:
+        """Reconcile the index with lichess.org if it hasn't been done in a while."""
+        if self.reconcile_timer.is_expired():
+            self.reconcile()
+
+    def update(self, event: EventType) -> None:
+        """
+        Update the index from an event.
+
+        A `local_game_done` only removes a real-time game, since we disconnect from correspondence games that aren't over.
+
+        :param event: An event from the control queue.
+        """
+        game = event.get("game")
+        if not game:
+            return
+        game_id = game.get("gameId") or game["id"]
+        if event["type"] == "gameStart":
+            self.games[game_id] = (game.get("opponent", {}).get("username", ""), game.get("speed", ""))
+        elif event["type"] == "gameFinish":
+            self.games.pop(game_id, None)
+        elif event["type"] == "local_game_done" and self.games.get(game_id, ("", ""))[1] != "correspondence":
+            self.games.pop(game_id, None)
+        else:
+            return
+        self.publish()
+
+    def publish(self) -> None:
+        """Publish the games to the game processes."""
+        if self.snapshot is not None:
+            self.snapshot.publish(self.games)
+
+    def current_games(self) -> Mapping[str, Any]:
+        """Get the games in the index. A copy of the index in a game process reads them from the snapshot."""
+        if self.is_publisher or self.snapshot is None:
+            return self.games
+        games: Mapping[str, Any] = self.snapshot.read()
+        return games
+
+    def is_active(self, game_id: str) -> bool:
+        """Determine if a game is still being played."""
+        return game_id in self.current_games()
+
+    def opponent_engagements(self) -> Counter[str]:
+        """Count the ongoing games against each opponent."""
+        return Counter(opponent for opponent, _ in self.games.values())
+
+    def __getstate__(self) -> dict[str, Any]:
+        """Mark the copy sent to another process as a reader of the snapshot."""
+        state = self.__dict__.copy()
+        state["is_publisher"] = False
+        return state
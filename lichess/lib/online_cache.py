@@ -0,0 +1,213 @@
+"""A cache on disk for the responses of online opening books, cloud analysis, and tablebases."""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional, Union
+from urllib.parse import urlsplit
+from lib.config import Configuration
+from lib.lichess_types import OnlineType
+
+logger = logging.getLogger(__name__)
+
+PARAMS_TYPE = dict[str, Union[str, int]]
+
+# How often (in number of writes) to check whether the cache has more entries than allowed.
+EVICTION_CHECK_PERIOD = 100
+
+
+def source_name(path: str) -> str:
+    """Get the name of the source of a url. The names are the keys of the `ttl` section of the cache config."""
+    url = urlsplit(path)
+    if url.hostname == "www.chessdb.cn":
+        return "chessdb"
+    if url.hostname == "tablebase.lichess.ovh":
+        return "lichess_egtb"
+    if url.hostname == "explorer.lichess.ovh":
+        return "lichess_opening_explorer"
+    if url.path.endswith("/cloud-eval"):
+        return "lichess_cloud_analysis"
+    return url.hostname or ""
+
+
+def has_move(status_code: int, response: OnlineType) -> bool:
+    """
+    Whether a response is a successful answer with at least one move, so that it can be stored.
+
+    Errors (e.g. an unknown position in the cloud analysis or chessdb) aren't stored, so that the source is asked again
+    later instead of the error being reused for days.
+
+    :param status_code: The HTTP status code of the response.
+    :param response: The decoded response.
+    """
+    if not 200 <= status_code < 300 or not isinstance(response, dict):
+        return False
+    if "error" in response or response.get("status", "ok") != "ok":
+        return False
+    return any(response.get(key) for key in ["move", "moves", "pv", "pvs"])
+
+
+def normalize_fen(fen: str, source: str) -> str:
+    """
+    Remove the parts of a FEN that don't change the answer of a source, so that transpositions share an entry.
+
+    The move counters are removed except that the halfmove clock is kept for tablebases, since it decides whether a win
+    can be converted before the 50-move rule.
+    """
+    fields = fen.split()
+    return " ".join(fields[:5] if source == "lichess_egtb" else fields[:4])
+
+
+class OnlineCache:
+    """
+    Responses from online move sources stored in SQLite.
+
+    The entries are keyed by source, variant, normalized FEN, and the other request parameters. Each source has its own
+    time to live. When there are more than `max_entries`, the least recently used entries are removed.
+
+    The database uses write-ahead logging so that it can be shared by all of the game processes. Each process (and copy
+    of a `Lichess` object) opens its own connection the first time it is used.
+    """
+
+    def __init__(self, path: str, max_entries: int, ttl: dict[str, int]) -> None:
+        """
+        Set up the cache. The database is opened when it is first used.
+
+        :param path: The path of the database file.
+        :param max_entries: The maximum number of responses stored.
+        :param ttl: How long (in seconds) the responses from each source are kept.
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.connection: Optional[sqlite3.Connection] = None
+        self.writes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_config(cls, cache_cfg: Configuration) -> Optional["OnlineCache"]:
+        """Create the cache from the `engine.online_moves.cache` section of the config, or `None` if it's disabled."""
+        if not cache_cfg.enabled:
+            return None
+        return cls(cache_cfg.path, cache_cfg.max_entries, dict(cache_cfg.ttl.items()))
+
+    def connect(self) -> sqlite3.Connection:
+        """Open the database and create the table if needed."""
+        if self.connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA busy_timeout=5000")
+            connection.execute("""CREATE TABLE IF NOT EXISTS online_moves (
+                                      source TEXT NOT NULL,
+                                      variant TEXT NOT NULL,
+                                      fen TEXT NOT NULL,
+                                      params TEXT NOT NULL,
+                                      response TEXT NOT NULL,
+                                      created REAL NOT NULL,
+                                      last_access REAL NOT NULL,
+                                      PRIMARY KEY (source, variant, fen, params))""")
+            connection.execute("CREATE INDEX IF NOT EXISTS online_moves_last_access ON online_moves (last_access)")
+            self.connection = connection
+        return self.connection
+
+    def key(self, path: str, params: Optional[PARAMS_TYPE]) -> tuple[str, str, str, str]:
+        """Get the key of a request: the source, the variant, the normalized FEN, and the other parameters."""
+        source = source_name(path)
+        other_params = dict(params or {})
+        fen = str(other_params.pop("fen", other_params.pop("board", "")))
+        variant = str(other_params.pop("variant", "standard"))
+        other_params["path"] = path
+        return source, variant, normalize_fen(fen, source), json.dumps(other_params, sort_keys=True)
+
+    def get(self, path: str, params: Optional[PARAMS_TYPE]) -> Optional[OnlineType]:
+        """
+        Get a stored response.
+
+        :param path: The url of the request.
+        :param params: The parameters of the request.
+        :return: The response, or `None` if it isn't stored or has expired.
+        """
+        source, variant, fen, other_params = self.key(path, params)
+        if not fen:
+            return None
+        now = time.time()
+        max_age = self.ttl.get(source, 0)
+        try:
+            with self.lock:
+                connection = self.connect()
+                row = connection.execute("SELECT response, created FROM online_moves "
+                                         "WHERE source = ? AND variant = ? AND fen = ? AND params = ?",
+                                         (source, variant, fen, other_params)).fetchone()
+                if row is None or now - row[1] > max_age:
+                    self.misses += 1
+                    return None
+                connection.execute("UPDATE online_moves SET last_access = ? "
+                                   "WHERE source = ? AND variant = ? AND fen = ? AND params = ?",
+                                   (now, source, variant, fen, other_params))
+                self.hits += 1
+            response: OnlineType = json.loads(row[0])
+            return response
+        except sqlite3.Error:
+            logger.debug("Could not read from the online moves cache.", exc_info=True)
+            return None
+
+    def put(self, path: str, params: Optional[PARAMS_TYPE], response: OnlineType) -> None:
+        """
+        Store a response.
+
+        :param path: The url of the request.
+        :param params: The parameters of the request.
+        :param response: The response from the online source.
+        """
+        source, variant, fen, other_params = self.key(path, params)
+        if not fen or self.ttl.get(source, 0) <= 0:
+            return
+        now = time.time()
+        try:
+            with self.lock:
+                connection = self.connect()
+                connection.execute("INSERT OR REPLACE INTO online_moves VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                   (source, variant, fen, other_params, json.dumps(response), now, now))
+                self.writes += 1
+                if self.writes % EVICTION_CHECK_PERIOD == 1:
+                    self.evict(connection)
+        except sqlite3.Error:
+            logger.debug("Could not write to the online moves cache.", exc_info=True)
+
+    def evict(self, connection: sqlite3.Connection) -> None:
+        """Remove expired entries and the least recently used entries over `max_entries`."""
+        now = time.time()
+        for source, max_age in self.ttl.items():
+            connection.execute("DELETE FROM online_moves WHERE source = ? AND created < ?", (source, now - max_age))
+        count = connection.execute("SELECT COUNT(*) FROM online_moves").fetchone()[0]
+        if count > self.max_entries:
+            connection.execute("DELETE FROM online_moves WHERE rowid IN "
+                               "(SELECT rowid FROM online_moves ORDER BY last_access LIMIT ?)",
+                               (count - self.max_entries,))
+
+    def close(self) -> None:
+        """Close the connection to the database."""
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+    def __getstate__(self) -> dict[str, Any]:
+        """Leave out the connection and lock when sending the cache to another process."""
+        state = self.__dict__.copy()
+        state["connection"] = None
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        """Create a new lock in the other process. The database is reopened when it is first used."""
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
@@ -0,0 +1,145 @@
+"""Keep engine analysis of positions on disk, so that analysis done ahead of time can be played later."""
+import atexit
+import chess
+import chess.engine
+import logging
+import sqlite3
+import threading
+import time
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# Stored moves aren't played after this many halfmoves without a capture or pawn move, since the stored analysis doesn't
+# know how close the fifty-move rule is.
+MAX_HALFMOVE_CLOCK = 60
+
+
+class StoredAnalysis(NamedTuple):
+    """The result of analyzing a position."""
+
+    move: chess.Move
+    depth: int
+    score: Optional[chess.engine.PovScore]
+    pv: list[chess.Move]
+
+    def play_result(self) -> chess.engine.PlayResult:
+        """Get the analysis as the result of a search."""
+        info: chess.engine.InfoDict = {"depth": self.depth, "pv": self.pv}
+        if self.score is not None:
+            info["score"] = self.score
+        return chess.engine.PlayResult(self.move, self.pv[1] if len(self.pv) > 1 else None, info)
+
+
+class PositionStore:
+    """
+    A sqlite database of analyzed positions, keyed by variant and EPD.
+
+    For each position, only the deepest analysis is kept. Several processes can use the same database. Since the key
+    leaves out the move counters and the earlier moves, a stored move doesn't take the fifty-move rule or repetitions
+    into account. Check `history_matters` before playing one.
+    """
+
+    def __init__(self, path: str) -> None:
+        """:param path: The file of the database. It is created if it doesn't exist."""
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS positions ("
+                                    "key TEXT PRIMARY KEY, move TEXT NOT NULL, depth INTEGER NOT NULL, "
+                                    "score_cp INTEGER, score_mate INTEGER, pv TEXT NOT NULL, updated REAL NOT NULL)")
+
+    def get(self, board: chess.Board) -> Optional[StoredAnalysis]:
+        """Get the stored analysis of a position, or `None` if the position hasn't been analyzed."""
+        with self.lock:
+            row = self.connection.execute("SELECT move, depth, score_cp, score_mate, pv FROM positions WHERE key = ?",
+                                          (position_key(board),)).fetchone()
+        if row is None:
+            return None
+        move_uci, depth, score_cp, score_mate, pv_uci = row
+        move = chess.Move.from_uci(move_uci)
+        if not board.is_legal(move):
+            return None
+        score: Optional[chess.engine.PovScore] = None
+        if score_mate is not None:
+            score = chess.engine.PovScore(chess.engine.Mate(score_mate), board.turn)
+        elif score_cp is not None:
+            score = chess.engine.PovScore(chess.engine.Cp(score_cp), board.turn)
+        return StoredAnalysis(move, depth, score, [chess.Move.from_uci(uci) for uci in pv_uci.split()])
+
+    def put(self, board: chess.Board, info: chess.engine.InfoDict) -> None:
+        """
+        Store the analysis of a position, unless a deeper analysis is already stored.
+
+        :param board: The position.
+        :param info: The engine's info about the position. Nothing is stored without a depth and a principal variation.
+        """
+        depth = info.get("depth")
+        pv = info.get("pv")
+        if not depth or not pv:
+            return
+        score = info.get("score")
+        relative_score = None if score is None else score.relative
+        score_cp = None if relative_score is None or relative_score.is_mate() else relative_score.score()
+        score_mate = None if relative_score is None or not relative_score.is_mate() else relative_score.mate()
+        with self.lock, self.connection:
+            self.connection.execute("INSERT INTO positions (key, move, depth, score_cp, score_mate, pv, updated) "
+                                    "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                                    "ON CONFLICT(key) DO UPDATE SET move = excluded.move, depth = excluded.depth, "
+                                    "score_cp = excluded.score_cp, score_mate = excluded.score_mate, pv = excluded.pv, "
+                                    "updated = excluded.updated WHERE excluded.depth > positions.depth",
+                                    (position_key(board), pv[0].uci(), depth, score_cp, score_mate,
+                                     " ".join(move.uci() for move in pv), time.time()))
+
+    def close(self) -> None:
+        """Close the database."""
+        with self.lock:
+            self.connection.close()
+
+
+def history_matters(board: chess.Board, move: chess.Move) -> bool:
+    """
+    Whether the earlier moves of a game could make a stored move a mistake, so the position should be searched instead.
+
+    This is the case if the position was already reached in the game, if the stored move lets the opponent claim a draw
+    (by repetition or the fifty-move rule), or if the fifty-move rule is near.
+
+    :param board: The current position, with the moves that led to it.
+    :param move: The stored move.
+    """
+    if board.halfmove_clock >= MAX_HALFMOVE_CLOCK or board.is_repetition(2):
+        return True
+    board.push(move)
+    try:
+        return board.can_claim_draw()
+    finally:
+        board.pop()
+
+
+def position_key(board: chess.Board) -> str:
+    """Get the key of a position in the store."""
+    variant = board.uci_variant + ("960" if board.chess960 else "")
+    return f"{variant} {board.epd()}"
+
+
+# The position stores opened by this process.
+open_stores: dict[str, PositionStore] = {}
+open_stores_lock = threading.Lock()
+
+
+def get_position_store(path: str) -> PositionStore:
+    """Get the position store in a file, opening it the first time it is used by this process."""
+    with open_stores_lock:
+        if path not in open_stores:
+            open_stores[path] = PositionStore(path)
+        return open_stores[path]
+
+
+@atexit.register
+def close_position_stores() -> None:
+    """Close the position stores opened by this process."""
+    with open_stores_lock:
+        for store in open_stores.values():
+            store.close()
+        open_stores.clear()
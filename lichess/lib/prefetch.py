@@ -0,0 +1,118 @@
+"""Look up the answers to the opponent's likely replies while the opponent is thinking."""
+from __future__ import annotations
+import logging
+import chess
+import chess.engine
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+from lib import model
+
+logger = logging.getLogger(__name__)
+
+THREAD_NAME_PREFIX = "prefetch"
+
+# Looks up a position in the move sources, so that their answers are cached.
+WARM_TYPE = Callable[[chess.Board, model.Game], None]
+
+# Gets the opening explorer's move (in UCI notation) in a position, or `None`.
+EXPLORER_MOVE_TYPE = Callable[[chess.Board, model.Game], Optional[str]]
+
+
+class QuietPrefetchFilter(logging.Filter):
+    """Hide the "Got move ..." messages logged by the move sources when they are called by the prefetcher."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        """Drop messages below WARNING from prefetch threads."""
+        return record.levelno >= logging.WARNING or not record.threadName.startswith(THREAD_NAME_PREFIX)
+
+
+def quiet_prefetch_threads(source_logger: logging.Logger) -> None:
+    """Hide the messages below WARNING that a logger gets from prefetch threads. Does nothing if already done."""
+    if not any(isinstance(log_filter, QuietPrefetchFilter) for log_filter in source_logger.filters):
+        source_logger.addFilter(QuietPrefetchFilter())
+
+
+class Prefetcher:
+    """
+    Warm the online move cache and the local tablebase scores for the positions after the opponent's likely replies.
+
+    The likely replies are the engine's ponder move (or the second move of its PV) and the best reply according to the
+    opening explorer. The lookups run in a background thread during the opponent's turn, so that `play_move` finds the
+    answer without waiting on the network if the opponent plays one of them.
+    """
+
+    def __init__(self, max_replies: int, warm: WARM_TYPE, explorer_move: EXPLORER_MOVE_TYPE) -> None:
+        """
+        Create the background thread that does the lookups.
+
+        :param max_replies: The most replies looked up after each of our moves.
+        :param warm: Looks up a position in the same sources that `EngineWrapper.play_move` uses.
+        :param explorer_move: Gets the best reply according to the opening explorer.
+        """
+        self.max_replies = max_replies
+        self.warm = warm
+        self.explorer_move = explorer_move
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=THREAD_NAME_PREFIX)
+        self.pending: Optional[Future[None]] = None
+
+    def start(self, board: chess.Board, game: model.Game, our_move: chess.engine.PlayResult) -> None:
+        """
+        Start looking up the answers to the likely replies to our move.
+
+        :param board: The position before our move.
+        :param game: The game being played.
+        :param our_move: The move we just sent to lichess.org.
+        """
+        if our_move.move is None:
+            return
+        self.cancel()
+        board = board.copy()
+        board.push(our_move.move)
+        if board.is_game_over():
+            return
+        self.pending = self.executor.submit(self.prefetch, board, game, our_move)
+
+    def cancel(self) -> None:
+        """Drop the prefetch if it hasn't started yet. A prefetch that is running is left to finish."""
+        if self.pending:
+            self.pending.cancel()
+            self.pending = None
+
+    def close(self) -> None:
+        """Stop prefetching."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def likely_replies(self, board: chess.Board, game: model.Game, our_move: chess.engine.PlayResult) -> list[chess.Move]:
+        """
+        Get the opponent's likely replies to our move.
+
+        :param board: The position after our move.
+        :param game: The game being played.
+        :param our_move: The move we just played, with the engine's ponder move and PV.
+        """
+        replies: list[chess.Move] = []
+        pv = (our_move.info or {}).get("pv") or []
+        for reply in [our_move.ponder, pv[1] if len(pv) > 1 else None]:
+            if reply is not None and reply not in replies and board.is_legal(reply):
+                replies.append(reply)
+
+        if len(replies) < self.max_replies:
+            explorer_move = self.explorer_move(board, game)
+            reply = chess.Move.from_uci(explorer_move) if explorer_move else None
+            if reply is not None and reply not in replies and board.is_legal(reply):
+                replies.append(reply)
+
+        return replies[:self.max_replies]
+
+    def prefetch(self, board: chess.Board, game: model.Game, our_move: chess.engine.PlayResult) -> None:
+        """Look up the answers to each likely reply."""
+        try:
+            for reply in self.likely_replies(board, game, our_move):
+                board.push(reply)
+                if not board.is_game_over():
+                    logger.debug(f"Prefetching answers to {reply.uci()} in game {game.id}")
+                    self.warm(board, game)
+                board.pop()
+        except Exception:
+            logger.debug("Prefetching failed.", exc_info=True)
@@ -0,0 +1,371 @@
+"""
+Record the traffic between lichess-bot and lichess.org, and replay it later without connecting to lichess.org.
+
+A recording is a directory with one gzipped NDJSON file per process. Each line is written as its own gzip member, so a
+file is complete up to its last line even if its process is terminated. Each line is a request, the response to it, a
+chunk of a streamed response (e.g. a line of the event or game stream), or the end of a stream, with the time it happened.
+The transport adapters here are mounted on the `requests` sessions of `lib.lichess.Lichess`, so everything that reads
+the responses (`watch_control_stream`, `play_game`, the online move sources) runs the same way in a replay.
+
+A replay isn't causal across processes. Each response is replayed at its recorded time after its own request, whatever
+happened in the other processes. For example, a `gameStart` event from the event stream arrives at its recorded time
+even if the games before it take longer in the replay (e.g. because the engine chooses other moves), so more games than
+`challenge.concurrency` can be running at once. A replay is best for checking how the bot reacts to a sequence of
+responses, not for reproducing the timing between games.
+"""
+from __future__ import annotations
+import glob
+import gzip
+import json
+import logging
+import multiprocessing.util
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from collections.abc import Iterator
+from http.client import responses
+from typing import IO, Any, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from urllib3.exceptions import ProtocolError
+
+logger = logging.getLogger(__name__)
+
+RECORD_TYPE = dict[str, Any]
+
+TOKEN_PLACEHOLDER = "<token>"  # The token is never written to a recording.
+TOKEN_TEST_PATH = "/api/token/test"
+MOVE_PATH_PARTS = 6  # "/api/bot/game/{}/move/{}" split on "/"
+RECORDED_HEADERS = ["Content-Type", "Retry-After"]
+
+
+def exchange_key(method: str, url: str) -> str:
+    """
+    Get the key that matches a request in a replay to a request in the recording.
+
+    The key is the method, host, path, and sorted query. For moves, the move itself is left out because the engine may
+    not choose the same move in the replay.
+    """
+    parts = urlsplit(url)
+    path = parts.path
+    path_parts = path.split("/")
+    if len(path_parts) == MOVE_PATH_PARTS + 1 and path_parts[1:4] == ["api", "bot", "game"] and path_parts[5] == "move":
+        path = "/".join(path_parts[:6])
+    query = urlencode(sorted(parse_qsl(parts.query)))
+    return f"{method} {parts.hostname}{path}?{query}"
+
+
+def to_text(data: bytes) -> str:
+    """Store bytes in JSON. Latin-1 maps every byte to one character."""
+    return data.decode("latin-1")
+
+
+def to_bytes(text: str) -> bytes:
+    """Get back bytes stored with `to_text`."""
+    return text.encode("latin-1")
+
+
+class TrafficRecorder:
+    """Write the records of a process to its own file in the recording directory."""
+
+    def __init__(self, directory: str) -> None:
+        """:param directory: Where the recording is written. It is created if needed."""
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.file: Optional[IO[bytes]] = None
+        self.pid: Optional[int] = None
+        self.next_id = 0
+
+    def open(self) -> IO[bytes]:
+        """
+        Open the file of this process. A copy of the recorder sent to another process opens its own file.
+
+        The file is closed when the process exits. `Finalize` also runs in processes started by `multiprocessing`, where
+        `atexit` handlers don't.
+        """
+        if self.file is None or self.pid != os.getpid():
+            os.makedirs(self.directory, exist_ok=True)
+            self.pid = os.getpid()
+            self.file = open(os.path.join(self.directory, f"{self.pid}-{time.time_ns()}.ndjson.gz"), "ab")
+            multiprocessing.util.Finalize(self, self.close, exitpriority=0)
+        return self.file
+
+    def close(self) -> None:
+        """Close the file of this process."""
+        with self.lock:
+            if self.file is not None and self.pid == os.getpid():
+                self.file.close()
+            self.file = None
+
+    def new_exchange(self) -> str:
+        """Get a unique ID for a request and its response."""
+        with self.lock:
+            self.next_id += 1
+            return f"{os.getpid()}-{self.next_id}"
+
+    def write(self, record: RECORD_TYPE) -> None:
+        """
+        Write a record as a complete gzip member and flush it, so that nothing is lost if the process is terminated.
+
+        Concatenated gzip members are read back as one file by `gzip.open`.
+        """
+        record["time"] = time.time()
+        member = gzip.compress(json.dumps(record).encode("utf-8") + b"\n", mtime=0)
+        with self.lock:
+            file = self.open()
+            file.write(member)
+            file.flush()
+
+    def __getstate__(self) -> dict[str, Any]:
+        """Leave out the file and lock when sending the recorder to another process."""
+        state = self.__dict__.copy()
+        state["file"] = None
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        """Create a new lock in the other process. The file is opened when it is first used."""
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+
+class RecordingBody:
+    """Wrap the body of a streamed response so that every chunk is recorded as it is read."""
+
+    def __init__(self, raw: Any, recorder: TrafficRecorder, exchange_id: str) -> None:
+        """
+        Wrap a response body.
+
+        :param raw: The `urllib3` response.
+        :param recorder: Where the chunks are written.
+        :param exchange_id: The ID of the request.
+        """
+        self.raw = raw
+        self.recorder = recorder
+        self.exchange_id = exchange_id
+
+    def stream(self, amt: Optional[int] = None, decode_content: Optional[bool] = None) -> Iterator[bytes]:
+        """Read the body chunk by chunk, recording each chunk and whether the stream broke."""
+        error = None
+        try:
+            for chunk in self.raw.stream(amt, decode_content=decode_content):
+                self.recorder.write({"type": "chunk", "id": self.exchange_id, "data": to_text(chunk)})
+                yield chunk
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self.recorder.write({"type": "end", "id": self.exchange_id, "error": error})
+
+    def __getattr__(self, name: str) -> Any:
+        """Everything else is passed to the `urllib3` response."""
+        return getattr(self.raw, name)
+
+
+class RecordingAdapter(HTTPAdapter):
+    """Send requests to the network and record them with their responses."""
+
+    __attrs__ = [*HTTPAdapter.__attrs__, "recorder"]
+
+    def __init__(self, recorder: TrafficRecorder, **kwargs: Any) -> None:
+        """
+        Create an adapter that records.
+
+        :param recorder: Where the traffic is written.
+        :param kwargs: The arguments of `HTTPAdapter` (e.g. `pool_maxsize`).
+        """
+        self.recorder = recorder
+        super().__init__(**kwargs)
+
+    def send(self, request: requests.PreparedRequest, stream: bool = False, **kwargs: Any) -> requests.Response:
+        """Send a request and record it and its response."""
+        exchange_id = self.recorder.new_exchange()
+        url = request.url or ""
+        self.recorder.write({"type": "request", "id": exchange_id, "method": request.method,
+                             "key": exchange_key(request.method or "", url), "stream": stream})
+        try:
+            response = super().send(request, stream=stream, **kwargs)
+        except requests.exceptions.RequestException as error:
+            self.recorder.write({"type": "error", "id": exchange_id, "error": type(error).__name__})
+            raise
+        headers = {name: response.headers[name] for name in RECORDED_HEADERS if name in response.headers}
+        record = {"type": "response", "id": exchange_id, "status": response.status_code, "headers": headers}
+        if stream:
+            self.recorder.write(record)
+            response.raw = RecordingBody(response.raw, self.recorder, exchange_id)
+        else:
+            body = response.content
+            if urlsplit(url).path == TOKEN_TEST_PATH and isinstance(request.body, (str, bytes)):
+                token = request.body if isinstance(request.body, bytes) else request.body.encode("utf-8")
+                body = body.replace(token, TOKEN_PLACEHOLDER.encode("utf-8"))
+            record["body"] = to_text(body)
+            self.recorder.write(record)
+        return response
+
+
+class Exchange:
+    """A recorded request with its response."""
+
+    def __init__(self, request: RECORD_TYPE) -> None:
+        """:param request: The request record."""
+        self.key: str = request["key"]
+        self.start: float = request["time"]
+        self.response: Optional[RECORD_TYPE] = None
+        self.chunks: list[tuple[float, bytes]] = []
+        self.stream_error: Optional[str] = None
+
+
+def load_recording(directory: str) -> dict[str, deque[Exchange]]:
+    """
+    Read all of the files in a recording.
+
+    :param directory: The recording directory.
+    :return: The exchanges for each key, in the order that the requests were sent.
+    """
+    exchanges: dict[str, Exchange] = {}
+    for path in sorted(glob.glob(os.path.join(directory, "*.ndjson.gz"))):
+        with gzip.open(path, "rb") as file:
+            try:
+                for line in file:
+                    record = json.loads(line)
+                    if record["type"] == "request":
+                        exchanges[record["id"]] = Exchange(record)
+                    elif record["id"] in exchanges:
+                        exchange = exchanges[record["id"]]
+                        if record["type"] in ("response", "error"):
+                            exchange.response = record
+                        elif record["type"] == "chunk":
+                            exchange.chunks.append((record["time"] - exchange.start, to_bytes(record["data"])))
+                        elif record["type"] == "end":
+                            exchange.stream_error = record.get("error")
+            except (EOFError, gzip.BadGzipFile, json.JSONDecodeError):
+                logger.warning(f"The recording {path} ends early. It was probably cut off when the bot stopped.")
+
+    by_key: defaultdict[str, deque[Exchange]] = defaultdict(deque)
+    for exchange in sorted(exchanges.values(), key=lambda e: e.start):
+        if exchange.response is not None:
+            by_key[exchange.key].append(exchange)
+    logger.info(f"Loaded {len(exchanges)} recorded requests from {directory}")
+    return by_key
+
+
+class ReplayBody:
+    """The body of a replayed response. Chunks are released at their recorded times, divided by the replay speed."""
+
+    def __init__(self, chunks: list[tuple[float, bytes]], speed: float, error: Optional[str] = None) -> None:
+        """
+        Start replaying a body.
+
+        :param chunks: The chunks with their times after the request was sent.
+        :param speed: How many times faster than real time to replay.
+        :param error: The name of the error that broke the recorded stream, if any.
+        """
+        self.chunks = chunks
+        self.speed = speed
+        self.error = error
+        self.start = time.monotonic()
+
+    def wait_until(self, offset: float) -> None:
+        """Sleep until the replayed time of something that happened `offset` seconds after the request."""
+        wait = offset / self.speed - (time.monotonic() - self.start)
+        if wait > 0:
+            time.sleep(wait)
+
+    def stream(self, amt: Optional[int] = None, decode_content: Optional[bool] = None) -> Iterator[bytes]:  # noqa: ARG002
+        """Yield the chunks at their recorded times. If the recorded stream broke, break this one too."""
+        for offset, chunk in self.chunks:
+            self.wait_until(offset)
+            yield chunk
+        if self.error:
+            raise ProtocolError(f"Replayed {self.error}")
+
+    def read(self, amt: Optional[int] = None) -> bytes:  # noqa: ARG002
+        """Read the whole body."""
+        return b"".join(self.stream())
+
+    def close(self) -> None:
+        """Nothing to close."""
+
+    def release_conn(self) -> None:
+        """Nothing to release."""
+
+
+class ReplayAdapter(BaseAdapter):
+    """Answer requests from a recording instead of the network."""
+
+    def __init__(self, directory: str, speed: float = 1.0) -> None:
+        """
+        Load a recording.
+
+        :param directory: The recording directory.
+        :param speed: How many times faster than real time to replay.
+        """
+        super().__init__()
+        self.directory = directory
+        self.speed = speed
+        self.exchanges = load_recording(directory)
+        self.lock = threading.Lock()
+
+    def send(self, request: requests.PreparedRequest, stream: bool = False, **kwargs: Any) -> requests.Response:  # noqa: ARG002
+        """Find the next recorded response to a request. Requests that aren't in the recording get a 404."""
+        url = request.url or ""
+        key = exchange_key(request.method or "", url)
+        with self.lock:
+            queue = self.exchanges.get(key)
+            exchange = queue.popleft() if queue else None
+
+        response = requests.Response()
+        response.request = request
+        response.url = url
+        if exchange is None or exchange.response is None:
+            logger.debug(f"No recorded response for {key}")
+            response.status_code = 404
+            response.reason = responses[404]
+            response.headers = CaseInsensitiveDict({"Content-Type": "application/json"})
+            response.raw = ReplayBody([(0.0, b'{"error": "Not in the recording"}')], self.speed)
+            return response
+
+        recorded = exchange.response
+        if recorded["type"] == "error":
+            ReplayBody([], self.speed).wait_until(recorded["time"] - exchange.start)
+            error_type = getattr(requests.exceptions, recorded["error"], requests.exceptions.ConnectionError)
+            raise error_type(f"Replayed {recorded['error']} for {key}", request=request)
+
+        response.status_code = recorded["status"]
+        response.reason = responses.get(response.status_code, "")
+        response.headers = CaseInsensitiveDict(recorded["headers"])
+        response.encoding = get_encoding_from_headers(response.headers)
+        if "body" in recorded:
+            body = to_bytes(recorded["body"])
+            if urlsplit(url).path == TOKEN_TEST_PATH and isinstance(request.body, (str, bytes)):
+                token = request.body if isinstance(request.body, bytes) else request.body.encode("utf-8")
+                body = body.replace(TOKEN_PLACEHOLDER.encode("utf-8"), token)
+            latency = recorded["time"] - exchange.start
+            response.raw = ReplayBody([(latency, body)], self.speed)
+        else:
+            response.raw = ReplayBody(exchange.chunks, self.speed, exchange.stream_error)
+        return response
+
+    def close(self) -> None:
+        """Nothing to close."""
+
+    def __getstate__(self) -> dict[str, Any]:
+        """Leave out the lock when sending the adapter to another process."""
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        """Create a new lock in the other process."""
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+
+def mount(session: requests.Session, adapter: BaseAdapter) -> None:
+    """Send all of a session's requests through an adapter."""
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
@@ -0,0 +1,56 @@
+"""Publish a value from the main process to the game processes through shared memory."""
+import ctypes
+import json
+import multiprocessing
+from typing import Any, Optional
+
+
+class SharedSnapshot:
+    """
+    A JSON value that one process publishes and other processes read.
+
+    The value is kept in shared memory, so reading it doesn't need a round trip to another process (as a
+    `multiprocessing.Manager` proxy does). Readers only decode the value again when it has been published since their
+    last read, so reading an unchanged snapshot costs one read of a shared counter. The value returned by `read` is
+    shared by all reads in a process and must not be changed.
+
+    Like a `multiprocessing.Queue`, a snapshot can only be handed to a process when the process is started.
+    """
+
+    def __init__(self, initial: Any, capacity: int = 64 * 1024) -> None:
+        """
+        Create the shared memory and publish the first value.
+
+        :param initial: The first value.
+        :param capacity: The most bytes the JSON of a value can take.
+        """
+        self.buffer = multiprocessing.Array(ctypes.c_char, capacity)
+        self.size = multiprocessing.RawValue(ctypes.c_size_t, 0)
+        self.version = multiprocessing.RawValue(ctypes.c_uint64, 0)
+        self.published: Optional[bytes] = None
+        self.read_version = -1
+        self.value: Any = None
+        self.publish(initial)
+
+    def publish(self, value: Any) -> None:
+        """Replace the value. Nothing is written if the value hasn't changed since it was last published."""
+        data = json.dumps(value, separators=(",", ":")).encode("utf-8")
+        if data == self.published:
+            return
+        if len(data) > len(self.buffer):
+            raise ValueError(f"The snapshot needs {len(data)} bytes, but only has room for {len(self.buffer)}.")
+        with self.buffer.get_lock():
+            ctypes.memmove(self.buffer.get_obj(), data, len(data))
+            self.size.value = len(data)
+            self.version.value += 1
+        self.published = data
+
+    def read(self) -> Any:
+        """Get the latest published value."""
+        if self.version.value != self.read_version:
+            with self.buffer.get_lock():
+                version = self.version.value
+                data = ctypes.string_at(self.buffer.get_obj(), self.size.value)
+            self.value = json.loads(data)
+            self.read_version = version
+        return self.value
@@ -0,0 +1 @@
+"""Tests for lichess-bot."""
@@ -0,0 +1,86 @@
+"""Tests for keeping the board of a game up to date."""
+import chess
+import datetime
+from typing import Optional
+from lib import model
+from lib.board_tracker import BoardTracker, continues
+from lib.lichess_types import GameEventType
+
+
+def make_game(moves: str, variant: str = "Standard", initial_fen: Optional[str] = None) -> model.Game:
+    """Create a game with the given moves."""
+    game_info: GameEventType = {"id": "zzzzzzzz",
+                                "variant": {"name": variant},
+                                "white": {"name": "bo"},
+                                "black": {"name": "opponent"},
+                                "initialFen": initial_fen or "startpos",
+                                "createdAt": 1600000000000,
+                                "state": {"moves": moves}}  # type: ignore[typeddict-item]
+    return model.Game(game_info, "bo", "https://lichess.org", datetime.timedelta(seconds=20))
+
+
+def replay(moves: str) -> chess.Board:
+    """Set up a board by playing all of the moves from the starting position."""
+    board = chess.Board()
+    for move in moves.split():
+        board.push_uci(move)
+    return board
+
+
+def test_continues() -> None:
+    """Test that only whole moves count as continuing the earlier moves."""
+    assert continues("e2e4 e7e5", "")
+    assert continues("e2e4 e7e5", "e2e4")
+    assert continues("e2e4", "e2e4")
+    assert not continues("e2e4", "e2e4 e7e5")
+    assert not continues("d2d4 e7e5", "e2e4")
+    assert not continues("e7e8q", "e7e8")
+
+
+def test_new_moves_are_pushed() -> None:
+    """Test that new moves are played on the same board instead of setting it up again."""
+    tracker = BoardTracker(make_game(""))
+    board = tracker.update(make_game("e2e4"))
+    for moves in ["e2e4 e7e5", "e2e4 e7e5 g1f3 b8c6", "e2e4 e7e5 g1f3 b8c6"]:
+        assert tracker.update(make_game(moves)) is board
+        assert board == replay(moves)
+        assert board.move_stack == replay(moves).move_stack
+
+
+def test_takeback() -> None:
+    """Test that taken back moves are popped."""
+    tracker = BoardTracker(make_game(""))
+    board = tracker.update(make_game("e2e4 e7e5 g1f3 b8c6"))
+    assert tracker.update(make_game("e2e4 e7e5")) is board
+    assert board.move_stack == replay("e2e4 e7e5").move_stack
+    assert tracker.update(make_game("e2e4 e7e5 f1c4")) is board
+    assert board.move_stack == replay("e2e4 e7e5 f1c4").move_stack
+
+
+def test_different_moves_rebuild_the_board() -> None:
+    """Test that the board is set up again when the moves don't continue the moves already played."""
+    tracker = BoardTracker(make_game(""))
+    tracker.update(make_game("e2e4 e7e5"))
+    board = tracker.update(make_game("d2d4 d7d5"))
+    assert board.move_stack == replay("d2d4 d7d5").move_stack
+
+
+def test_illegal_move() -> None:
+    """Test that an illegal move is skipped and that the board is rebuilt on the next update."""
+    tracker = BoardTracker(make_game(""))
+    board = tracker.update(make_game("e2e4 e2e4 e7e5"))
+    assert board.move_stack == replay("e2e4 e7e5").move_stack
+    assert not tracker.in_sync
+    board = tracker.update(make_game("e2e4 e2e4 e7e5 g1f3"))
+    assert board.move_stack == replay("e2e4 e7e5 g1f3").move_stack
+
+
+def test_starting_position() -> None:
+    """Test that games from a position and variant games start from the right board."""
+    fen = "4k3/8/8/8/8/8/4P3/4K3 w - - 0 1"
+    board = BoardTracker(make_game("", "From Position", fen)).update(make_game("e2e4", "From Position", fen))
+    assert board.fen() == "4k3/8/8/8/4P3/8/8/4K3 b - - 0 1"
+
+    board = BoardTracker(make_game("", "Atomic")).update(make_game("e2e4", "Atomic"))
+    assert board.uci_variant == "atomic"
+    assert board.move_stack == [chess.Move.from_uci("e2e4")]
@@ -0,0 +1,115 @@
+"""Tests for deciding when to check in on correspondence games."""
+import datetime
+from typing import Optional
+from unittest.mock import patch
+from lib import correspondence_scheduler
+from lib.correspondence_scheduler import CorrespondenceScheduler
+from lib.lichess_types import GameType
+
+
+class Clock:
+    """A clock that only moves when told to."""
+
+    def __init__(self) -> None:
+        """Start at an arbitrary time."""
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        """Get the current time."""
+        return self.now
+
+
+def make_game(game_id: str, is_my_turn: bool, seconds_left: Optional[int] = None) -> GameType:
+    """Create an entry of the ongoing games list."""
+    game: GameType = {"gameId": game_id, "isMyTurn": is_my_turn}  # type: ignore[typeddict-item]
+    if seconds_left is not None:
+        game["secondsLeft"] = seconds_left
+    return game
+
+
+def make_scheduler() -> CorrespondenceScheduler:
+    """Create a scheduler with a check-in period of one minute."""
+    return CorrespondenceScheduler(datetime.timedelta(seconds=60))
+
+
+def test_due_games_are_ordered_by_priority() -> None:
+    """Test that games in which it is the bot's turn come first, then the games with the least time left."""
+    clock = Clock()
+    with patch.object(correspondence_scheduler.time, "monotonic", clock):
+        scheduler = make_scheduler()
+        scheduler.add(make_game("no_clock", True))
+        scheduler.add(make_game("opponent", False, 10))
+        scheduler.add(make_game("slow", True, 86400))
+        scheduler.add(make_game("fast", True, 3600))
+        assert len(scheduler) == 4
+        assert scheduler.pop_due(2) == ["fast", "slow"]
+        assert scheduler.pop_due(10) == ["no_clock"]
+        assert "opponent" in scheduler
+        assert scheduler.pop_due(10) == []
+
+        clock.now += 60
+        assert scheduler.pop_due(10) == ["opponent"]
+        assert len(scheduler) == 0
+
+
+def test_time_until_next() -> None:
+    """Test that the wait lasts until the next game becomes due, and that games already due don't count."""
+    clock = Clock()
+    with patch.object(correspondence_scheduler.time, "monotonic", clock):
+        scheduler = make_scheduler()
+        assert scheduler.time_until_next() is None
+        scheduler.add(make_game("mine", True))
+        assert scheduler.time_until_next() is None
+        scheduler.add(make_game("first", False))
+        clock.now += 20
+        scheduler.add(make_game("second", False))
+        assert scheduler.time_until_next() == datetime.timedelta(seconds=40)
+        clock.now += 100
+        assert scheduler.time_until_next() is None
+        assert scheduler.pop_due(10) == ["mine", "first", "second"]
+
+
+def test_discard() -> None:
+    """Test that discarded games are not started."""
+    clock = Clock()
+    with patch.object(correspondence_scheduler.time, "monotonic", clock):
+        scheduler = make_scheduler()
+        scheduler.add(make_game("mine", True))
+        scheduler.add(make_game("theirs", False))
+        version = scheduler.version
+        scheduler.discard("mine")
+        scheduler.discard("theirs")
+        scheduler.discard("unknown")
+        assert scheduler.version == version + 2
+        assert len(scheduler) == 0
+        assert scheduler.time_until_next() is None
+        clock.now += 60
+        assert scheduler.pop_due(10) == []
+
+
+def test_reschedule() -> None:
+    """Test that adding a game again replaces its earlier entry."""
+    clock = Clock()
+    with patch.object(correspondence_scheduler.time, "monotonic", clock):
+        scheduler = make_scheduler()
+        scheduler.add(make_game("game", True))
+        scheduler.add(make_game("game", False))
+        assert len(scheduler) == 1
+        assert scheduler.pop_due(10) == []
+        assert scheduler.waiting_games() == ["game"]
+
+        scheduler.add(make_game("game", True))
+        assert scheduler.pop_due(10) == ["game"]
+        clock.now += 60
+        assert scheduler.pop_due(10) == []
+
+
+def test_waiting_games() -> None:
+    """Test that the waiting games are listed with the due games first."""
+    clock = Clock()
+    with patch.object(correspondence_scheduler.time, "monotonic", clock):
+        scheduler = make_scheduler()
+        scheduler.add(make_game("later", False))
+        scheduler.add(make_game("now", True))
+        scheduler.time_until_next()
+        assert scheduler.waiting_games() == ["now", "later"]
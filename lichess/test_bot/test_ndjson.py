@@ -0,0 +1,51 @@
+"""Tests for the decoding of the NDJSON streams from lichess.org."""
+import asyncio
+from collections.abc import AsyncIterator
+from lib.ndjson import aiter_lines, decode, iter_lines
+
+STREAM = b'{"type":"gameFull","id":"abc"}\n\n{"type":"gameState","moves":"e2e4 e7e5"}\r\n{"type":"chatLine"}'
+
+
+def split_into_chunks(data: bytes, size: int) -> list[bytes]:
+    """Split the bytes into chunks of the given size."""
+    return [data[start:start + size] for start in range(0, len(data), size)]
+
+
+def test_iter_lines_in_one_chunk() -> None:
+    """Test that a stream received at once is split into lines, with keep-alive messages as empty lines."""
+    assert list(iter_lines([STREAM])) == [b'{"type":"gameFull","id":"abc"}',
+                                          b"",
+                                          b'{"type":"gameState","moves":"e2e4 e7e5"}',
+                                          b'{"type":"chatLine"}']
+
+
+def test_iter_lines_across_chunk_boundaries() -> None:
+    """Test that lines split across chunks, including between `\\r` and `\\n`, are put back together."""
+    expected = list(iter_lines([STREAM]))
+    for size in range(1, len(STREAM) + 1):
+        assert list(iter_lines(split_into_chunks(STREAM, size))) == expected
+
+
+def test_iter_lines_with_empty_chunks() -> None:
+    """Test that empty chunks don't produce lines."""
+    assert list(iter_lines([b"", b'{"a":', b"", b"1}\n", b""])) == [b'{"a":1}']
+    assert list(iter_lines([])) == []
+
+
+def test_aiter_lines() -> None:
+    """Test that the asynchronous splitter gives the same lines as the synchronous one."""
+    async def chunks() -> AsyncIterator[bytes]:
+        for chunk in split_into_chunks(STREAM, 7):
+            yield chunk
+
+    async def collect() -> list[bytes]:
+        return [line async for line in aiter_lines(chunks())]
+
+    assert asyncio.run(collect()) == list(iter_lines([STREAM]))
+
+
+def test_decode() -> None:
+    """Test that messages are decoded and keep-alive messages become empty dicts."""
+    assert decode(b'{"type":"gameState","moves":"e2e4"}') == {"type": "gameState", "moves": "e2e4"}
+    assert decode(b"") == {}
+    assert decode(b" ") == {}
@@ -0,0 +1,112 @@
+"""Tests for the cache of online move sources."""
+import os
+import time
+from unittest.mock import patch
+from lib import online_cache
+from lib.online_cache import OnlineCache, has_move, normalize_fen, source_name
+
+CLOUD_EVAL = "https://lichess.org/api/cloud-eval"
+TABLEBASE = "https://tablebase.lichess.ovh/standard"
+FEN = "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1"
+RESPONSE = {"pvs": [{"moves": "e7e5 g1f3", "cp": 20}]}
+
+
+def make_cache(tmp_path: str, max_entries: int = 100, ttl: int = 60) -> OnlineCache:
+    """Create a cache in a temporary directory."""
+    return OnlineCache(os.path.join(tmp_path, "cache", "online_moves.sqlite"), max_entries,
+                       {"lichess_cloud_analysis": ttl, "lichess_egtb": ttl})
+
+
+def test_source_name() -> None:
+    """Test that urls are mapped to the names used in the `ttl` config."""
+    assert source_name(CLOUD_EVAL) == "lichess_cloud_analysis"
+    assert source_name(TABLEBASE) == "lichess_egtb"
+    assert source_name("https://www.chessdb.cn/cdb.php") == "chessdb"
+    assert source_name("https://explorer.lichess.ovh/masters") == "lichess_opening_explorer"
+
+
+def test_has_move() -> None:
+    """Test that only successful responses with a move are stored."""
+    assert has_move(200, RESPONSE)
+    assert has_move(200, {"move": "e2e4", "status": "ok"})
+    assert not has_move(404, RESPONSE)
+    assert not has_move(200, {"error": "Not found"})
+    assert not has_move(200, {"status": "unknown", "move": "e2e4"})
+    assert not has_move(200, {"pvs": []})
+    assert not has_move(200, "e2e4")
+
+
+def test_normalize_fen() -> None:
+    """Test that the move counters are removed, except the halfmove clock for tablebases."""
+    assert normalize_fen(FEN, "lichess_cloud_analysis") == "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq -"
+    assert normalize_fen(FEN, "lichess_egtb") == "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0"
+
+
+def test_get_and_put(tmp_path: str) -> None:
+    """Test that a stored response is found for the same position reached with other move counters."""
+    cache = make_cache(tmp_path)
+    params = {"fen": FEN, "multiPv": 1, "variant": "standard"}
+    assert cache.get(CLOUD_EVAL, params) is None
+    cache.put(CLOUD_EVAL, params, RESPONSE)
+    transposition = {"fen": FEN.replace(" 0 1", " 4 9"), "multiPv": 1, "variant": "standard"}
+    assert cache.get(CLOUD_EVAL, transposition) == RESPONSE
+    assert cache.get(CLOUD_EVAL, {**params, "multiPv": 2}) is None
+    assert cache.get(CLOUD_EVAL, {**params, "variant": "chess960"}) is None
+    assert (cache.hits, cache.misses) == (1, 3)
+    cache.close()
+
+
+def test_tablebase_keeps_halfmove_clock(tmp_path: str) -> None:
+    """Test that tablebase responses are not shared between positions with different halfmove clocks."""
+    cache = make_cache(tmp_path)
+    fen = "8/8/8/8/8/2k5/8/K1Q5 w - - 10 60"
+    cache.put(TABLEBASE, {"fen": fen}, {"category": "win", "moves": [{"uci": "c1c2"}]})
+    assert cache.get(TABLEBASE, {"fen": fen.replace(" 60", " 70")}) is not None
+    assert cache.get(TABLEBASE, {"fen": fen.replace(" 10 ", " 90 ")}) is None
+    cache.close()
+
+
+def test_sources_without_ttl_are_not_stored(tmp_path: str) -> None:
+    """Test that responses from a source without a time to live are not stored."""
+    cache = make_cache(tmp_path)
+    cache.put("https://www.chessdb.cn/cdb.php", {"board": FEN}, {"status": "ok", "move": "e7e5"})
+    assert cache.get("https://www.chessdb.cn/cdb.php", {"board": FEN}) is None
+    assert cache.writes == 0
+    cache.close()
+
+
+def test_ttl_expiry(tmp_path: str) -> None:
+    """Test that a response is not used after its time to live."""
+    cache = make_cache(tmp_path, ttl=60)
+    params = {"fen": FEN}
+    now = time.time()
+    with patch.object(online_cache.time, "time", return_value=now):
+        cache.put(CLOUD_EVAL, params, RESPONSE)
+    with patch.object(online_cache.time, "time", return_value=now + 59):
+        assert cache.get(CLOUD_EVAL, params) == RESPONSE
+    with patch.object(online_cache.time, "time", return_value=now + 61):
+        assert cache.get(CLOUD_EVAL, params) is None
+    cache.close()
+
+
+def test_lru_eviction(tmp_path: str) -> None:
+    """Test that the least recently used entries are removed when there are too many."""
+    cache = make_cache(tmp_path, max_entries=2)
+    fens = [f"8/8/8/8/8/8/{rank}/K6k w - - 0 1" for rank in ["P7", "1P6", "2P5"]]
+    now = time.time()
+    with patch.object(online_cache, "EVICTION_CHECK_PERIOD", 2):
+        with patch.object(online_cache.time, "time", return_value=now):
+            cache.put(CLOUD_EVAL, {"fen": fens[0]}, RESPONSE)
+        with patch.object(online_cache.time, "time", return_value=now + 1):
+            cache.put(CLOUD_EVAL, {"fen": fens[1]}, RESPONSE)
+        with patch.object(online_cache.time, "time", return_value=now + 2):
+            # Reading the first entry makes the second one the least recently used.
+            assert cache.get(CLOUD_EVAL, {"fen": fens[0]}) == RESPONSE
+        with patch.object(online_cache.time, "time", return_value=now + 3):
+            cache.put(CLOUD_EVAL, {"fen": fens[2]}, RESPONSE)
+
+    with patch.object(online_cache.time, "time", return_value=now + 4):
+        assert cache.get(CLOUD_EVAL, {"fen": fens[0]}) == RESPONSE
+        assert cache.get(CLOUD_EVAL, {"fen": fens[1]}) is None
+        assert cache.get(CLOUD_EVAL, {"fen": fens[2]}) == RESPONSE
+    cache.close()